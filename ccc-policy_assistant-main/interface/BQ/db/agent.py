@@ -6,38 +6,132 @@ from . import prompt
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'tools'))
-from bq_connector import generate_sql, execute_sql
+from bq_connector import generate_sql, execute_sql, execute_sql_arrow, arrow_to_records
 from .table_router_agent import table_router_agent
 from .table_factory import table_factory
+from .column_selector import column_selector
+from .sql_cache import sql_cache
+from .sql_validator import sql_validator, repair_prompt
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from token_counting import count_tokens
 
-def dynamic_get_data(table_name: str, user_question: str) -> dict:
-    """Dynamically generate and execute SQL for the specified table."""
+# Regenerations allowed when generated SQL fails local validation
+SQL_MAX_REPAIRS = int(os.getenv("SQL_MAX_REPAIRS", "2"))
+
+def build_query_prompt(table_name: str, user_question: str) -> tuple:
+    """Build the SQL-generation prompt for a question with the table's relevant columns.
+    
+    Returns (query_prompt, prompt_stats), where prompt_stats has the column counts and the
+    tokens of the prompt, of the prompt with all columns, and saved by pruning. Only the
+    prompt sent is counted; the full prompt's count is cached with the table's template.
+    """
+    # Get the schema for the table
+    table_schema = table_factory.get_schema(table_name)
+    schema_version = table_factory.get_schema_version(table_name)
+    # Keep only the columns relevant to the question (None keeps them all)
+    columns = column_selector.select(table_name, table_schema, schema_version, user_question)
+    # Create the query prompt with SQL generation rules from the table's cached prompt template
+    query_prompt = prompt.generate_query_prompt(
+        table_name, table_schema, schema_version, user_question, columns=columns
+    )
+    prompt_tokens = count_tokens(query_prompt)
+    if columns is None:
+        full_tokens = prompt_tokens
+    else:
+        template = prompt.get_table_prompt_template(table_name, table_schema, schema_version)
+        full_tokens = template.query_prefix_tokens + count_tokens(prompt.question_suffix(user_question))
+    prompt_stats = {"columns": len(columns) if columns is not None else len(table_schema["Data dictionary"]),
+                    "total_columns": len(table_schema["Data dictionary"]),
+                    "prompt_tokens": prompt_tokens,
+                    "full_tokens": full_tokens,
+                    "saved_tokens": full_tokens - prompt_tokens}
+    logging.info(f"Prompt for {table_name}: {prompt_stats}")
+    return query_prompt, prompt_stats
+
+def generate_table_sql(table_name: str, user_question: str) -> tuple:
+    """Get the SQL for a question against a table, from the SQL cache or by calling the LLM.
+    
+    Returns (sql, prompt_stats, cached). Pass cached to remember_sql once the SQL has run.
+    """
+    schema_version = table_factory.get_schema_version(table_name)
+    cached_sql = sql_cache.get(table_name, schema_version, user_question)
+    if cached_sql is not None:
+        # No prompt is sent for cached SQL
+        return cached_sql, {"sql_cache": "hit", "prompt_tokens": 0}, True
+    query_prompt, prompt_stats = build_query_prompt(table_name, user_question)
+    # Generate SQL using bq_connector
+    sql = generate_sql(query_prompt)
+    sql, prompt_stats["sql_repairs"] = validate_and_repair(table_name, query_prompt, sql)
+    return sql, prompt_stats, False
+
+def validate_and_repair(table_name: str, query_prompt: str, sql: str) -> tuple:
+    """Check generated SQL against the table's schema, regenerating it with the problems found
+    up to SQL_MAX_REPAIRS times.
+    
+    Returns (sql, repairs). Raises ValueError if the SQL still fails validation, so it is never executed.
+    """
+    table_schema = table_factory.get_schema(table_name)
+    for repairs in range(SQL_MAX_REPAIRS + 1):
+        problems = sql_validator.validate(sql, table_name, table_schema)
+        if not problems:
+            return sql, repairs
+        logging.info(f"Generated SQL for {table_name} failed validation: {problems}")
+        if repairs == SQL_MAX_REPAIRS:
+            break
+        sql = generate_sql(repair_prompt(query_prompt, sql, problems))
+    logging.warning(f"SQL for {table_name} still fails validation after {SQL_MAX_REPAIRS} repairs")
+    raise ValueError(f"Generated SQL for {table_name} still fails validation after {SQL_MAX_REPAIRS} "
+                     f"repairs: {'; '.join(problems)}")
+
+def remember_sql(table_name: str, user_question: str, sql: str, cached: bool, succeeded: bool):
+    """Cache SQL that executed successfully, and drop cached SQL that no longer does."""
+    schema_version = table_factory.get_schema_version(table_name)
+    if succeeded and not cached:
+        sql_cache.put(table_name, schema_version, user_question, sql)
+    elif cached and not succeeded:
+        sql_cache.delete(table_name, schema_version, user_question)
+
+def run_table_sql(table_name: str, user_question: str, clean_sql: str, cached: bool = False,
+                  allow_heavy: bool = False) -> dict:
+    """Execute SQL generated for a question as an Arrow result, and cache the SQL if it succeeds.
+    
+    Queries over the byte warning budget return status "needs_confirmation" with their dry-run
+    estimate instead of running, unless allow_heavy.
+    """
+    result = execute_sql_arrow(clean_sql, table_name, allow_heavy=allow_heavy)
+    if result.get("status") != "needs_confirmation":
+        remember_sql(table_name, user_question, clean_sql, cached,
+                     succeeded=result.get("status") == "success")
+    return result
+
+def get_table_data(table_name: str, user_question: str, allow_heavy: bool = False) -> dict:
+    """Generate and execute SQL for the specified table, keeping the result as an Arrow table.
+    
+    The result's "table" is a pyarrow.Table that can be displayed without copying; use
+    dynamic_get_data when the rows have to be passed to an LLM as JSON.
+    """
     try:
-        # Get the schema for the table
-        table_schema = table_factory.get_schema(table_name)
-        # Generate the specific prompt for this table
-        table_prompt = prompt.generate_table_prompt(table_name, table_schema)
-        # Create the query prompt with SQL generation rules
-        query_prompt = (
-            f"{table_prompt}\n"
-            "Important: When generating SQL:\n"
-            "1. Use SAFE_CAST for type conversions.\n"
-            "2. Handle NULL values explicitly.\n"
-            "3. Ensure all COALESCE arguments are the same type.\n"
-            f"Question: {user_question}"
-        )
-        # Generate SQL using bq_connector
-        clean_sql = generate_sql(query_prompt)
-        logging.info(f"Generated SQL for {table_name}: {clean_sql}")
+        clean_sql, prompt_stats, cached = generate_table_sql(table_name, user_question)
+        logging.info(f"{'Cached' if cached else 'Generated'} SQL for {table_name}: {clean_sql}")
         # Execute SQL and return results
-        result = execute_sql(clean_sql, table_name)
+        result = run_table_sql(table_name, user_question, clean_sql, cached, allow_heavy=allow_heavy)
         if not result or (isinstance(result, dict) and result.get("status") == "error"):
-            return {"error": "No results found or error occurred"}
+            return {"error": result.get("error", "No results found or error occurred"),
+                    "estimate": result.get("estimate"), "status": "error"}
+        result["prompt_stats"] = prompt_stats
+        result["sql_cached"] = cached
         return result
     except Exception as e:
-        logging.error(f"Error in dynamic_get_data for {table_name}: {str(e)}")
+        logging.error(f"Error in get_table_data for {table_name}: {str(e)}")
         return {"error": str(e), "status": "error"}
 
+def dynamic_get_data(table_name: str, user_question: str) -> dict:
+    """Dynamically generate and execute SQL for the specified table."""
+    result = get_table_data(table_name, user_question)
+    if "table" in result:
+        result["data"] = arrow_to_records(result.pop("table"))
+    return result
+
 # Create root_agent with dynamic query handling
 # RENAMED FROM db_root_agent TO root_agent
 root_agent = Agent(
@@ -0,0 +1,204 @@
+"""Batch routing and NL-to-SQL for offline workloads.
+
+Routes a file of questions in batches, generates SQL for each question's best table with
+bounded concurrency, runs the BigQuery jobs in parallel, and writes one row per question with
+its per-stage timings to Parquet or JSON lines. From the interface directory:
+
+    python -m BQ.db.batch questions.txt --output results.parquet
+
+The questions file has one question per line, or is a JSON lines file with a "question" field.
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import statistics
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .agent import generate_table_sql, remember_sql, execute_sql
+from .table_router_agent import get_table_router
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchResult:
+    """Outcome and stage timings of one question in a batch."""
+    question: str
+    table_name: Optional[str] = None
+    confidence: Optional[float] = None
+    candidates: List[str] = field(default_factory=list)
+    sql: Optional[str] = None
+    sql_cached: bool = False
+    status: str = "pending"
+    error: Optional[str] = None
+    row_count: int = 0
+    truncated: bool = False
+    data: list = field(default_factory=list)
+    prompt_tokens: Optional[int] = None
+    route_seconds: float = 0.0
+    generate_seconds: float = 0.0
+    execute_seconds: float = 0.0
+
+
+def load_questions(path: str) -> List[str]:
+    """Read questions from a text file (one per line) or a JSON lines file with a "question" field."""
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+
+def route_questions(questions: List[str], results: List[BatchResult], top_k: int, batch_size: int):
+    """Route the questions in batches and record each one's best table and candidates."""
+    router = get_table_router()
+    for start in range(0, len(questions), batch_size):
+        batch = questions[start:start + batch_size]
+        batch_start = time.perf_counter()
+        ranked = router.rank_tables_many(batch, top_k=top_k)
+        # Batched routing has no per-question latency; charge each question an equal share
+        per_question = (time.perf_counter() - batch_start) / len(batch)
+        for offset, tables in enumerate(ranked):
+            result = results[start + offset]
+            result.route_seconds = per_question
+            result.candidates = [table["file_name"].replace(".json", "") for table in tables]
+            if tables:
+                result.table_name = result.candidates[0]
+                result.confidence = tables[0]["score"]
+            else:
+                result.status = "error"
+                result.error = "No relevant tables found for this question"
+        logger.info(f"Routed {start + len(batch)}/{len(questions)} questions")
+
+
+def generate_stage(result: BatchResult) -> bool:
+    """Generate the SQL of a routed question, or reuse cached SQL; returns whether it can be executed."""
+    start = time.perf_counter()
+    try:
+        result.sql, prompt_stats, result.sql_cached = generate_table_sql(result.table_name, result.question)
+        result.prompt_tokens = prompt_stats.get("prompt_tokens")
+        return True
+    except Exception as e:
+        result.status = "error"
+        result.error = f"SQL generation failed: {str(e)}"
+        return False
+    finally:
+        result.generate_seconds = time.perf_counter() - start
+
+
+def execute_stage(result: BatchResult):
+    """Run the generated SQL of a question in BigQuery and record its rows."""
+    start = time.perf_counter()
+    # Offline runs don't wait for confirmation; QUERY_MAX_BYTES_BILLED still applies
+    response = execute_sql(result.sql, result.table_name, allow_heavy=True)
+    result.execute_seconds = time.perf_counter() - start
+    remember_sql(result.table_name, result.question, result.sql, result.sql_cached,
+                 succeeded=response.get("status") == "success")
+    if response.get("status") == "success":
+        result.status = "success"
+        result.data = response["data"]
+        result.row_count = len(result.data)
+        result.truncated = response.get("truncated", False)
+    else:
+        result.status = "error"
+        result.error = response.get("error", "Query failed")
+
+
+def run_batch(questions: List[str], top_k: int = 3, batch_size: int = 250,
+              sql_workers: int = 8, bq_workers: int = 16) -> List[BatchResult]:
+    """Route, generate SQL for and execute a batch of questions.
+
+    SQL generation runs on sql_workers threads; as each question's SQL is ready its BigQuery
+    job is started on one of bq_workers threads, so both stages overlap.
+    """
+    results = [BatchResult(question=question) for question in questions]
+    route_questions(questions, results, top_k, batch_size)
+
+    routed = [result for result in results if result.table_name]
+    with ThreadPoolExecutor(max_workers=bq_workers, thread_name_prefix="batch_bq") as bq_executor:
+        def generate_then_submit(result: BatchResult) -> Optional[Future]:
+            if generate_stage(result):
+                return bq_executor.submit(execute_stage, result)
+            return None
+
+        with ThreadPoolExecutor(max_workers=sql_workers, thread_name_prefix="batch_sql") as sql_executor:
+            pending = list(sql_executor.map(generate_then_submit, routed))
+
+        for future, result in zip(pending, routed):
+            if future is None:
+                continue
+            try:
+                future.result()
+            except Exception as e:
+                result.status = "error"
+                result.error = f"Query execution failed: {str(e)}"
+
+    return results
+
+
+def summarize_timings(results: List[BatchResult], wall_seconds: float) -> Dict[str, float]:
+    """Totals and percentiles of each stage's timings."""
+    summary = {
+        "questions": len(results),
+        "succeeded": sum(result.status == "success" for result in results),
+        "wall_seconds": round(wall_seconds, 3),
+    }
+    for stage in ["route_seconds", "generate_seconds", "execute_seconds"]:
+        values = sorted(getattr(result, stage) for result in results if getattr(result, stage) > 0)
+        if values:
+            summary[f"{stage}_total"] = round(sum(values), 3)
+            summary[f"{stage}_p50"] = round(statistics.median(values), 3)
+            summary[f"{stage}_p95"] = round(values[min(len(values) - 1, int(0.95 * len(values)))], 3)
+    return summary
+
+
+def write_results(results: List[BatchResult], path: str):
+    """Write one row per question to a .parquet file, or to JSON lines otherwise.
+
+    Result rows differ in columns from question to question, so Parquet stores them as JSON text.
+    """
+    records = [asdict(result) for result in results]
+    if path.endswith(".parquet"):
+        for record in records:
+            record["data"] = json.dumps(record["data"], default=str)
+        pd.DataFrame.from_records(records).to_parquet(path, index=False)
+    else:
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+    logger.info(f"Wrote {len(records)} results to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route questions and run their generated SQL in batch")
+    parser.add_argument("questions", help="Text file of questions, one per line, or JSON lines with a 'question' field")
+    parser.add_argument("--output", default="batch_results.parquet", help="Output .parquet or .jsonl file")
+    parser.add_argument("--top-k", type=int, default=3, help="Candidate tables recorded per question")
+    parser.add_argument("--batch-size", type=int, default=250, help="Questions routed together")
+    parser.add_argument("--sql-workers", type=int, default=8, help="Concurrent SQL generation calls")
+    parser.add_argument("--bq-workers", type=int, default=16, help="Concurrent BigQuery jobs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    questions = load_questions(args.questions)
+
+    start = time.perf_counter()
+    results = run_batch(questions, top_k=args.top_k, batch_size=args.batch_size,
+                        sql_workers=args.sql_workers, bq_workers=args.bq_workers)
+    summary = summarize_timings(results, time.perf_counter() - start)
+
+    write_results(results, args.output)
+    timings_path = f"{os.path.splitext(args.output)[0]}.timings.json"
+    with open(timings_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from bm25 import BM25Index
+
+logger = logging.getLogger(__name__)
+
+# Columns always sent to the model when a table has them
+KEY_COLUMNS = ["UNITID", "INSTNM", "YEAR", "STABBR", "OPEID"]
+
+
+class ColumnSelector:
+    """Picks the columns of a table that are relevant to a question.
+
+    Each table's columns are indexed once per schema version with BM25 over the column name and
+    its data dictionary description. A question keeps the top_n best-matching columns plus any
+    KEY_COLUMNS, in schema order. Tables with few columns, and questions that match no column,
+    keep every column.
+    """
+
+    def __init__(self, top_n: int = 40):
+        self.top_n = top_n
+        self._indexes: Dict[str, Tuple[str, List[str], BM25Index]] = {}
+        self._lock = threading.Lock()
+
+    def _get_index(self, table_name: str, table_schema: dict, schema_version: str) -> Tuple[List[str], BM25Index]:
+        cached = self._indexes.get(table_name)
+        if cached is None or cached[0] != schema_version:
+            columns = list(table_schema["Data dictionary"].keys())
+            documents = [f"{col} {table_schema['Data dictionary'][col]}" for col in columns]
+            cached = (schema_version, columns, BM25Index(documents))
+            with self._lock:
+                self._indexes[table_name] = cached
+        return cached[1], cached[2]
+
+    def select(self, table_name: str, table_schema: dict, schema_version: str, user_question: str) -> Optional[List[str]]:
+        """Get the columns to include in the prompt, or None to include them all."""
+        columns, index = self._get_index(table_name, table_schema, schema_version)
+        keys = [col for col in columns if col.upper() in KEY_COLUMNS]
+        if len(columns) <= self.top_n + len(keys):
+            return None
+
+        matches = index.top_k(user_question, self.top_n)
+        if not matches:
+            logger.info(f"No columns of {table_name} match the question; keeping all {len(columns)}")
+            return None
+
+        selected = set(keys) | {columns[doc_id] for doc_id, _ in matches}
+        return [col for col in columns if col in selected]
+
+
+column_selector = ColumnSelector(top_n=int(os.getenv("PROMPT_MAX_COLUMNS", "40")))
@@ -0,0 +1,165 @@
+import os
+import sys
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from bm25 import BM25Index
+from .vector_index import TableVectorIndex, schema_document, table_vector_index
+
+logger = logging.getLogger(__name__)
+
+
+class TableLexicalIndex:
+    """BM25 index over each table's name, overview and column descriptions.
+
+    Exact IPEDS variable words and survey codes in a question match here even when their
+    embeddings are not close. The index is rebuilt in memory when any schema version changes.
+    """
+
+    def __init__(self):
+        self.table_names: List[str] = []
+        self.versions: Dict[str, str] = {}
+        self.snippets: List[str] = []
+        self.index: Optional[BM25Index] = None
+        self._lock = threading.RLock()
+
+    def build(self, table_factory):
+        """Index the current schemas of all tables."""
+        with self._lock:
+            versions = {name: table_factory.get_schema_version(name) for name in table_factory.get_all_table_names()}
+            if self.index is not None and versions == self.versions:
+                return
+            names = list(versions)
+            schemas = {name: table_factory.get_schema(name) for name in names}
+            self.index = BM25Index([schema_document(name, schemas[name]) for name in names])
+            self.table_names = names
+            self.snippets = [schemas[name]["Overview description of file contents"] for name in names]
+            self.versions = versions
+            logger.info(f"Built lexical table index of {len(names)} tables")
+
+    def ensure_built(self, table_factory):
+        """Build the index on first use."""
+        if self.index is None:
+            self.build(table_factory)
+
+    def scores(self, query_text: str) -> np.ndarray:
+        """BM25 score of a question against every table, in table_names order."""
+        if self.index is None:
+            return np.zeros(0, dtype=np.float32)
+        return np.asarray(self.index.score(query_text), dtype=np.float32)
+
+    def search(self, query_text: str, top_k: int = 5) -> List[dict]:
+        """Get the top_k tables matching a question as dicts of table_name, score and snippet."""
+        return [
+            {"table_name": self.table_names[i], "score": score, "snippet": self.snippets[i]}
+            for i, score in self.index.top_k(query_text, top_k)
+        ]
+
+    def search_many(self, query_texts: Sequence[str], top_k: int = 5) -> List[List[dict]]:
+        """search() for several questions."""
+        return [self.search(query_text, top_k) for query_text in query_texts]
+
+
+class HybridTableIndex:
+    """Fusion of lexical (BM25) and vector table rankings.
+
+    fusion="rrf" sums reciprocal ranks, 1 / (rrf_k + rank), from each ranking, so only rank
+    positions matter. fusion="weighted" min-max normalizes both score lists over all tables
+    and combines them as alpha * vector + (1 - alpha) * lexical. If the question can't be
+    embedded, tables are ranked by the lexical scores alone.
+    """
+
+    def __init__(self, lexical: TableLexicalIndex, vector: TableVectorIndex,
+                 fusion: str = "rrf", alpha: float = 0.5, rrf_k: int = 60):
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown score fusion: {fusion}")
+        self.lexical = lexical
+        self.vector = vector
+        self.fusion = fusion
+        self.alpha = alpha
+        self.rrf_k = rrf_k
+
+    def ensure_built(self, table_factory):
+        """Build both indexes on first use; the lexical index alone if the vector one can't be built."""
+        self.lexical.ensure_built(table_factory)
+        try:
+            self.vector.ensure_built(table_factory)
+        except Exception as e:
+            logger.warning(f"Vector table index unavailable, routing lexically: {str(e)}")
+
+    def _vector_scores(self, query_text: str) -> Optional[Dict[str, float]]:
+        if len(self.vector.table_names) == 0:
+            return None
+        try:
+            return dict(zip(self.vector.table_names, self.vector.scores(query_text).tolist()))
+        except Exception as e:
+            logger.warning(f"Could not embed question, routing lexically: {str(e)}")
+            return None
+
+    def _fuse_rrf(self, lexical: np.ndarray, vector: Optional[np.ndarray]) -> np.ndarray:
+        fused = np.zeros(len(lexical), dtype=np.float64)
+        rankings = [(lexical, lexical > 0)]
+        if vector is not None:
+            rankings.append((vector, np.isfinite(vector)))
+        for scores, ranked in rankings:
+            order = np.argsort(-scores, kind="stable")
+            ranks = np.empty(len(scores), dtype=np.float64)
+            ranks[order] = np.arange(1, len(scores) + 1)
+            fused += np.where(ranked, 1.0 / (self.rrf_k + ranks), 0.0)
+        return fused
+
+    @staticmethod
+    def _min_max(scores: np.ndarray) -> np.ndarray:
+        finite = scores[np.isfinite(scores)]
+        if len(finite) == 0 or finite.max() == finite.min():
+            return np.zeros(len(scores))
+        return np.where(np.isfinite(scores), (scores - finite.min()) / (finite.max() - finite.min()), 0.0)
+
+    def search(self, query_text: str, top_k: int = 5) -> List[dict]:
+        """Get the top_k tables by fused score as dicts of table_name, score and snippet."""
+        names = self.lexical.table_names
+        if not names:
+            return []
+        lexical = self.lexical.scores(query_text)
+
+        vector = None
+        vector_by_name = self._vector_scores(query_text)
+        if vector_by_name is not None:
+            # Tables missing from the vector index take no part in its ranking
+            vector = np.array([vector_by_name.get(name, -np.inf) for name in names])
+
+        if self.fusion == "rrf":
+            fused = self._fuse_rrf(lexical, vector)
+        elif vector is None:
+            fused = self._min_max(lexical)
+        else:
+            fused = self.alpha * self._min_max(vector) + (1 - self.alpha) * self._min_max(lexical)
+
+        order = np.argsort(-fused, kind="stable")[:top_k]
+        return [
+            {"table_name": names[i], "score": float(fused[i]), "snippet": self.lexical.snippets[i]}
+            for i in order if fused[i] > 0
+        ]
+
+    def search_many(self, query_texts: Sequence[str], top_k: int = 5) -> List[List[dict]]:
+        """search() for several questions, embedding them together first."""
+        if len(self.vector.table_names) > 0:
+            try:
+                self.vector.embed_queries(query_texts)
+            except Exception as e:
+                logger.warning(f"Could not embed questions, routing lexically: {str(e)}")
+        return [self.search(query_text, top_k) for query_text in query_texts]
+
+
+table_lexical_index = TableLexicalIndex()
+
+table_hybrid_index = HybridTableIndex(
+    lexical=table_lexical_index,
+    vector=table_vector_index,
+    fusion=os.getenv("TABLE_ROUTER_FUSION", "rrf"),
+    alpha=float(os.getenv("TABLE_ROUTER_ALPHA", "0.5")),
+)
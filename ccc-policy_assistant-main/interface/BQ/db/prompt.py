@@ -1,6 +1,13 @@
 from dotenv import load_dotenv
 load_dotenv()
 import os 
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from token_counting import count_tokens
 
 # GCS configuration from TableAgentFactory
 GCS_BUCKET_NAME = os.getenv("GOOGLE_BUCKET")
@@ -10,15 +17,57 @@ BQ_DATASET_ID = os.getenv("BQ_DATASET_ID")
 MODEL_NAME = os.getenv("MODEL_NAME")
 
 
-def generate_table_prompt(table_name: str, table_schema: dict) -> str:
+# SQL generation rules appended to every table prompt before the user's question
+SQL_GENERATION_RULES = (
+    "Important: When generating SQL:\n"
+    "1. Use SAFE_CAST for type conversions.\n"
+    "2. Handle NULL values explicitly.\n"
+    "3. Ensure all COALESCE arguments are the same type.\n"
+)
+
+
+@dataclass(frozen=True)
+class TablePromptTemplate:
+    """Pre-rendered pieces of a table's SQL-generation prompt.
+
+    prompt is the full table prompt; query_prefix is the prompt plus the SQL generation
+    rules, to which only the question is appended, so it is a stable prefix across calls.
+    header and instructions surround the column list, and column_lines holds each
+    column's line so prompts with a subset of the columns can be assembled.
+    query_prefix_tokens is the token count of query_prefix, counted once per schema version.
+    """
+    table_name: str
+    schema_version: str
+    header: str
+    column_lines: Dict[str, str]
+    instructions: str
+    prompt: str
+    query_prefix: str
+    query_prefix_tokens: int
+
+    def render(self, columns: Optional[List[str]] = None) -> str:
+        """Render the table prompt with all columns, or only the given ones."""
+        if columns is None:
+            return self.prompt
+        schema_desc = "\n".join(self.column_lines[col] for col in columns if col in self.column_lines)
+        return self.header + schema_desc + self.instructions
+
+
+# Prompt templates by table name; an entry is replaced when its schema version changes
+_TABLE_PROMPT_CACHE: Dict[str, TablePromptTemplate] = {}
+_TABLE_PROMPT_CACHE_LOCK = threading.Lock()
+
+
+def _render_table_prompt_template(table_name: str, table_schema: dict, schema_version: str) -> TablePromptTemplate:
     # Construct GCS path for the schema file
     gcs_path = f"gs://{GCS_BUCKET_NAME}/{GCS_SCHEMAS_PATH}/{table_name}.json"
-    schema_desc = "\n".join(
-        f"{col}: {desc}" 
+    column_lines = {
+        col: f"{col}: {desc}"
         for col, desc in table_schema['Data dictionary'].items()
-    )
+    }
+    schema_desc = "\n".join(column_lines.values())
     
-    return f"""
+    header = f"""
     You are a SQL expert for the {table_name} table in the IPEDS database, with schema stored at {gcs_path}.
     
     TABLE DESCRIPTION:
@@ -27,7 +76,8 @@ def generate_table_prompt(table_name: str, table_schema: dict) -> str:
     SCHEMA:
     Source: {gcs_path}
     Columns:
-    {schema_desc}
+    """
+    instructions = f"""
     
     INSTRUCTIONS:
     1. Generate SQL queries for the BigQuery table `{BQ_PROJECT_ID}.{BQ_DATASET_ID}.{table_name}`
@@ -40,6 +90,57 @@ def generate_table_prompt(table_name: str, table_schema: dict) -> str:
     8. Ensure all COALESCE arguments are of the same type
     9. Use IFNULL instead of COALESCE when working with mixed types
     """
+    prompt = header + schema_desc + instructions
+    query_prefix = f"{prompt}\n{SQL_GENERATION_RULES}"
+    
+    return TablePromptTemplate(
+        table_name=table_name,
+        schema_version=schema_version,
+        header=header,
+        column_lines=column_lines,
+        instructions=instructions,
+        prompt=prompt,
+        query_prefix=query_prefix,
+        query_prefix_tokens=count_tokens(query_prefix),
+    )
+
+
+def get_table_prompt_template(table_name: str, table_schema: dict, schema_version: str) -> TablePromptTemplate:
+    """Get the cached prompt template for a table, rendering it if the schema version changed."""
+    template = _TABLE_PROMPT_CACHE.get(table_name)
+    if template is None or template.schema_version != schema_version:
+        template = _render_table_prompt_template(table_name, table_schema, schema_version)
+        with _TABLE_PROMPT_CACHE_LOCK:
+            _TABLE_PROMPT_CACHE[table_name] = template
+    return template
+
+
+def invalidate_table_prompt(table_name: Optional[str] = None):
+    """Drop the cached prompt template of a table, or of all tables."""
+    with _TABLE_PROMPT_CACHE_LOCK:
+        if table_name is None:
+            _TABLE_PROMPT_CACHE.clear()
+        else:
+            _TABLE_PROMPT_CACHE.pop(table_name, None)
+
+
+def generate_table_prompt(table_name: str, table_schema: dict) -> str:
+    return _render_table_prompt_template(table_name, table_schema, schema_version="").prompt
+
+
+def question_suffix(user_question: str) -> str:
+    """The part of a query prompt after the table prompt and rules."""
+    return f"Question: {user_question}"
+
+
+def generate_query_prompt(table_name: str, table_schema: dict, schema_version: str, user_question: str,
+                          columns: Optional[List[str]] = None) -> str:
+    """Build the SQL-generation prompt for a question from the table's cached template,
+    with all columns or only the given ones."""
+    template = get_table_prompt_template(table_name, table_schema, schema_version)
+    if columns is None:
+        return f"{template.query_prefix}{question_suffix(user_question)}"
+    return f"{template.render(columns)}\n{SQL_GENERATION_RULES}{question_suffix(user_question)}"
 
 TABLE_ROUTER_PROMPT = """
 You are an IPEDS table routing expert. Your task:
@@ -60,6 +161,8 @@ You are a routing agent for the IPEDS database:
 5. If the user selects an invalid table, inform them and ask again.
 6. If the user asks a new question, re-run the 'route_to_table' tool to find a new set of relevant tables Display the list of relevant tables (up to 5) with their descriptions to the user..
 7. Relay the results from the 'dynamic_get_data' tool to the user.
+   If it returns "truncated": true, the rows were capped and may be incomplete: say so, and don't present totals or rankings computed from them as complete.
+   If it returns status "needs_confirmation", the query was too large to run automatically: tell the user its estimated bytes scanned and cost, and suggest narrowing the question (e.g. fewer columns or years).
 8. Answer the user's question. Always add the source table(s) used in the answer, formatting it with the actual BigQuery table reference, but **display the source on a new line**, like:
 
    Source: <BQ_PROJECT_ID>.<BQ_DATASET_ID>.<table_name>
@@ -0,0 +1,110 @@
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaStore:
+    """On-disk store of table schemas with the GCS generation and etag they were downloaded at.
+
+    Schemas are kept as zlib-compressed compact JSON in a single SQLite file in WAL mode,
+    so all processes on a host can share one store. A schema stored with no payload marks
+    a blob that was downloaded but failed validation, so it is not downloaded again until
+    it changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schemas (
+                    table_name TEXT PRIMARY KEY,
+                    blob_name TEXT NOT NULL,
+                    generation INTEGER NOT NULL,
+                    etag TEXT,
+                    payload BLOB,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+        logger.info(f"Using schema store at {path}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_versions(self) -> Dict[str, Tuple[int, Optional[str]]]:
+        """Get {table_name: (generation, etag)} for every stored schema."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT table_name, generation, etag FROM schemas").fetchall()
+        return {table_name: (generation, etag) for table_name, generation, etag in rows}
+
+    def get_version(self, table_name: str) -> Optional[Tuple[int, Optional[str]]]:
+        """Get the (generation, etag) of a stored schema, or None if it isn't stored."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT generation, etag FROM schemas WHERE table_name = ?", (table_name,)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def get(self, table_name: str) -> Optional[dict]:
+        """Get a stored schema, or None if it is missing or invalid."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM schemas WHERE table_name = ?", (table_name,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def get_many(self, table_names: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """Get the stored schemas of several tables, with None for tables marked invalid."""
+        table_names = list(table_names)
+        schemas = {}
+        with self._connect() as conn:
+            # Stay under SQLite's limit on query parameters
+            for i in range(0, len(table_names), 500):
+                batch = table_names[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT table_name, payload FROM schemas "
+                    f"WHERE table_name IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for table_name, payload in rows:
+                    schemas[table_name] = None if payload is None else json.loads(zlib.decompress(payload))
+        return schemas
+
+    def put_many(self, entries: Iterable[Tuple[str, str, int, Optional[str], Optional[dict]]]):
+        """Store (table_name, blob_name, generation, etag, schema) entries; a None schema marks an invalid blob."""
+        now = time.time()
+        rows = [
+            (
+                table_name,
+                blob_name,
+                generation,
+                etag,
+                None if schema is None else zlib.compress(json.dumps(schema, separators=(",", ":")).encode("utf-8")),
+                now,
+            )
+            for table_name, blob_name, generation, etag, schema in entries
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO schemas VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def delete(self, table_names: Iterable[str]):
+        """Remove schemas whose blobs no longer exist."""
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM schemas WHERE table_name = ?", [(name,) for name in table_names])
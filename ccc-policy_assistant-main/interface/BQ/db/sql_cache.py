@@ -0,0 +1,221 @@
+import os
+import sys
+import sqlite3
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from text_cleaning_tools import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+class SQLCache:
+    """On-disk cache of generated SQL keyed by table, schema version and normalized question.
+
+    Only SQL that executed successfully is stored, so a hit can skip the LLM call entirely.
+    Entries live in a single SQLite file in WAL mode shared by all processes on a host; they
+    expire ttl seconds after they were stored, and the least recently used entries are evicted
+    beyond max_entries. A new schema version of a table changes its keys, so SQL generated
+    against an old schema is never returned.
+
+    The file is opened on first use. If it can't be (e.g. a read-only home directory), the
+    cache falls back to an in-memory database for the life of the process.
+
+    With an embed_fn and a similarity_threshold, a question that has no exact match also hits
+    when its embedding's cosine similarity to a cached question of the same table and schema
+    version is at least similarity_threshold.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl: float = 30 * 24 * 60 * 60,
+                 embed_fn: Optional[Callable[[str], np.ndarray]] = None,
+                 similarity_threshold: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.stats = dict(exact_hits=0, semantic_hits=0, misses=0)
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._database: Optional[str] = None
+        self._uri = False
+        # Holds an in-memory fallback database open; it is dropped with its last connection
+        self._memory_keeper: Optional[sqlite3.Connection] = None
+
+    def _open(self):
+        """Create the cache file and table on first use, falling back to an in-memory database."""
+        if self._database is not None:
+            return
+        with self._open_lock:
+            if self._database is not None:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._create_table(self.path, uri=False, wal=True)
+                self._database, self._uri = self.path, False
+                logger.info(f"Using SQL cache at {self.path}")
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"SQL cache at {self.path} unavailable, caching in memory: {str(e)}")
+                database = f"file:sql_cache_{id(self)}?mode=memory&cache=shared"
+                self._memory_keeper = sqlite3.connect(database, uri=True, check_same_thread=False)
+                self._create_table(database, uri=True, wal=False)
+                self._database, self._uri = database, True
+
+    @staticmethod
+    def _create_table(database: str, uri: bool, wal: bool):
+        conn = sqlite3.connect(database, uri=uri, timeout=30)
+        try:
+            with conn:
+                if wal:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS sql_cache (
+                        table_name TEXT NOT NULL,
+                        schema_version TEXT NOT NULL,
+                        question TEXT NOT NULL,
+                        sql TEXT NOT NULL,
+                        embedding BLOB,
+                        created_at REAL NOT NULL,
+                        last_used_at REAL NOT NULL,
+                        hits INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (table_name, schema_version, question)
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS sql_cache_last_used ON sql_cache (last_used_at)")
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived connection that commits on success and is always closed."""
+        self._open()
+        conn = sqlite3.connect(self._database, uri=self._uri, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @property
+    def semantic(self) -> bool:
+        return self.embed_fn is not None and self.similarity_threshold is not None
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        """Unit-length embedding of a normalized question, or None if it can't be embedded."""
+        try:
+            vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Could not embed question for the SQL cache: {str(e)}")
+            return None
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, table_name: str, schema_version: str, user_question: str) -> Optional[str]:
+        """Get the cached SQL of a question against a table's schema version, or None on a miss."""
+        question = normalize_question(user_question)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sql FROM sql_cache WHERE table_name = ? AND schema_version = ? AND question = ? "
+                "AND created_at >= ?",
+                (table_name, schema_version, question, now - self.ttl),
+            ).fetchone()
+            matched = question
+            if row is None and self.semantic:
+                matched, row = self._nearest(conn, table_name, schema_version, question, now)
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            conn.execute(
+                "UPDATE sql_cache SET last_used_at = ?, hits = hits + 1 "
+                "WHERE table_name = ? AND schema_version = ? AND question = ?",
+                (now, table_name, schema_version, matched),
+            )
+        self.stats["exact_hits" if matched == question else "semantic_hits"] += 1
+        logger.info(f"SQL cache hit for {table_name}: '{matched}'")
+        return row[0]
+
+    def _nearest(self, conn: sqlite3.Connection, table_name: str, schema_version: str,
+                 question: str, now: float):
+        """Find the most similar cached question of the same table and schema version.
+
+        Returns (question, row) of the match, or (None, None) if none is similar enough.
+        """
+        rows = conn.execute(
+            "SELECT question, sql, embedding FROM sql_cache WHERE table_name = ? AND schema_version = ? "
+            "AND created_at >= ? AND embedding IS NOT NULL",
+            (table_name, schema_version, now - self.ttl),
+        ).fetchall()
+        if not rows:
+            return None, None
+        vector = self._embed(question)
+        if vector is None:
+            return None, None
+        matrix = np.vstack([np.frombuffer(embedding, dtype=np.float32) for _, _, embedding in rows])
+        if matrix.shape[1] != vector.shape[0]:
+            return None, None
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        if float(similarities[best]) < self.similarity_threshold:
+            return None, None
+        return rows[best][0], (rows[best][1],)
+
+    def put(self, table_name: str, schema_version: str, user_question: str, sql: str):
+        """Store SQL that executed successfully for a question, evicting expired and least recently used entries."""
+        question = normalize_question(user_question)
+        vector = self._embed(question) if self.semantic else None
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sql_cache "
+                "(table_name, schema_version, question, sql, embedding, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (table_name, schema_version, question, sql,
+                 None if vector is None else vector.tobytes(), now, now),
+            )
+            conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM sql_cache WHERE rowid IN ("
+                "SELECT rowid FROM sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, table_name: str, schema_version: str, user_question: str):
+        """Drop the cached SQL of a question, e.g. after it stopped executing successfully."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM sql_cache WHERE table_name = ? AND schema_version = ? AND question = ?",
+                (table_name, schema_version, normalize_question(user_question)),
+            )
+
+
+def _similarity_threshold() -> Optional[float]:
+    value = os.getenv("SQL_CACHE_SIMILARITY")
+    return float(value) if value else None
+
+
+def _embed_question(question: str) -> np.ndarray:
+    """Embed a question with the table router's memoized query embeddings."""
+    from .vector_index import table_vector_index
+    return table_vector_index.embed_query(question)
+
+
+sql_cache = SQLCache(
+    path=os.getenv(
+        "SQL_CACHE_PATH",
+        os.path.join(os.path.expanduser("~"), ".cache", "ccc_policy_assistant", "sql_cache.sqlite")
+    ),
+    max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "5000")),
+    ttl=float(os.getenv("SQL_CACHE_TTL", str(30 * 24 * 60 * 60))),
+    embed_fn=_embed_question,
+    similarity_threshold=_similarity_threshold(),
+)
@@ -0,0 +1,181 @@
+import difflib
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# BigQuery column types by family, for spotting comparisons and aggregates of the wrong type
+STRING_TYPES = {"STRING"}
+NUMERIC_TYPES = {"INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC", "DECIMAL", "BIGDECIMAL"}
+
+
+def _load_sqlglot():
+    """Import sqlglot, or return None if it's unavailable so validation is skipped."""
+    global _SQLGLOT
+    if _SQLGLOT is None:
+        try:
+            import sqlglot
+            _SQLGLOT = sqlglot
+        except ImportError:
+            logger.warning("sqlglot not installed; generated SQL won't be validated locally")
+            _SQLGLOT = False
+    return _SQLGLOT or None
+
+
+_SQLGLOT = None
+
+
+class SQLValidator:
+    """Checks generated SQL against a table's schema before it is sent to BigQuery.
+
+    The SQL is parsed with sqlglot's BigQuery dialect and its columns are resolved scope by
+    scope. Columns read from the table must exist in its data dictionary or BigQuery schema,
+    and, when column types are known (column_types_fn), STRING columns may not be compared
+    with numbers, summed or averaged, and numeric columns may not be compared with strings.
+    An unqualified column resolves to the table when the table is the only source of its
+    scope whose columns contain the name; it is unknown when no source contains it. Sources
+    whose columns can't be determined (tables outside the dataset, SELECT *) stop the check of
+    unqualified columns in their scope, which is left to BigQuery.
+    """
+
+    def __init__(self, column_types_fn: Optional[Callable[[str], Dict[str, str]]] = None):
+        self.column_types_fn = column_types_fn
+
+    def _column_types(self, table_name: str) -> Dict[str, str]:
+        if self.column_types_fn is None:
+            return {}
+        try:
+            return {name.lower(): field_type.upper() for name, field_type in self.column_types_fn(table_name).items()}
+        except Exception as e:
+            logger.warning(f"Could not get column types of {table_name}; skipping type checks: {str(e)}")
+            return {}
+
+    def validate(self, sql: str, table_name: str, table_schema: dict) -> List[str]:
+        """Get the problems found in a query; an empty list means it looks valid."""
+        sqlglot = _load_sqlglot()
+        if sqlglot is None:
+            return []
+        from sqlglot import exp
+        from sqlglot.optimizer.scope import Scope, traverse_scope
+
+        try:
+            tree = sqlglot.parse_one(sql, read="bigquery")
+        except sqlglot.errors.ParseError as e:
+            return [f"SQL syntax error: {str(e).splitlines()[0]}"]
+
+        target = table_name.lower()
+        if not any(table.name.lower() == target for table in tree.find_all(exp.Table)):
+            return [f"Query doesn't read from the {table_name} table"]
+
+        types = self._column_types(table_name)
+        columns = {col.lower(): col for col in table_schema["Data dictionary"]}
+        columns.update({name: name for name in types if name not in columns})
+
+        other_columns = {}
+
+        def source_columns(source) -> Optional[Set[str]]:
+            """Lower-case column names of a scope's source, or None if they can't be determined."""
+            if isinstance(source, Scope):
+                selects = getattr(source.expression, "selects", [])
+                if any(isinstance(select, exp.Star) or isinstance(select.this, exp.Star) for select in selects):
+                    return None
+                names = getattr(source.expression, "named_selects", None)
+                return None if names is None else {name.lower() for name in names}
+            if not isinstance(source, exp.Table) or source.catalog or source.db:
+                return None
+            name = source.name.lower()
+            if name == target:
+                return set(columns)
+            if name not in other_columns:
+                other_columns[name] = set(self._column_types(name)) or None
+            return other_columns[name]
+
+        try:
+            scopes = traverse_scope(tree)
+        except Exception as e:
+            logger.warning(f"Could not resolve the columns of generated SQL; skipping column checks: {str(e)}")
+            return []
+
+        problems = []
+        resolved = set()
+        for scope in scopes:
+            target_sources = {name.lower() for name, source in scope.sources.items()
+                              if isinstance(source, exp.Table) and source.name.lower() == target}
+            others = [source_columns(source) for name, source in scope.sources.items()
+                      if name.lower() not in target_sources]
+            # Output aliases of the scope, which ORDER BY, GROUP BY etc. may refer to
+            aliases = {select.alias.lower() for select in getattr(scope.expression, "selects", [])
+                       if isinstance(select, exp.Alias)}
+
+            for column in scope.columns:
+                name = column.name.lower()
+                if isinstance(column.this, exp.Star):
+                    continue
+                if column.table:
+                    if column.table.lower() not in target_sources:
+                        continue
+                elif not target_sources or None in others:
+                    continue
+                elif any(name in other for other in others) or (name not in columns and name in aliases):
+                    # Another source has the column, or it is an output alias
+                    continue
+
+                if name in columns:
+                    resolved.add(id(column))
+                    continue
+                problem = f"Unknown column {column.name} in {table_name}"
+                suggestions = difflib.get_close_matches(name, list(columns), n=3, cutoff=0.6)
+                if suggestions:
+                    problem += "; did you mean {}?".format(", ".join(columns[s] for s in suggestions))
+                problems.append(problem)
+
+        if types:
+            problems.extend(self._type_problems(tree, exp, types, lambda column: id(column) in resolved))
+
+        # Report each problem once, in the order found
+        return list(dict.fromkeys(problems))
+
+    @staticmethod
+    def _type_problems(tree, exp, types: Dict[str, str], resolves_to_table) -> List[str]:
+        def column_type(node) -> Optional[str]:
+            if isinstance(node, exp.Column) and resolves_to_table(node):
+                return types.get(node.name.lower())
+            return None
+
+        problems = []
+        comparisons = (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE)
+        for comparison in tree.find_all(*comparisons):
+            for column, other in [(comparison.left, comparison.right), (comparison.right, comparison.left)]:
+                field_type = column_type(column)
+                if not isinstance(other, exp.Literal) or field_type is None:
+                    continue
+                if field_type in STRING_TYPES and not other.is_string:
+                    problems.append(f"STRING column {column.name} is compared with the number {other.this}; "
+                                    f"compare with a quoted string or SAFE_CAST the column")
+                elif field_type in NUMERIC_TYPES and other.is_string:
+                    problems.append(f"{field_type} column {column.name} is compared with the string '{other.this}'; "
+                                    f"compare with a number")
+
+        for aggregate in tree.find_all(exp.Sum, exp.Avg):
+            if column_type(aggregate.this) in STRING_TYPES:
+                problems.append(f"{aggregate.key.upper()} of STRING column {aggregate.this.name}; "
+                                f"SAFE_CAST it to a number first")
+
+        return problems
+
+
+def repair_prompt(query_prompt: str, sql: str, problems: List[str]) -> str:
+    """Prompt asking the model to fix SQL that failed validation."""
+    issues = "\n".join(f"- {problem}" for problem in problems)
+    return (f"{query_prompt}\n\n"
+            f"This SQL was generated for the question above:\n{sql}\n\n"
+            f"It has these problems:\n{issues}\n\n"
+            f"Return only the corrected SQL.")
+
+
+def _bigquery_column_types(table_name: str) -> Dict[str, str]:
+    from bq_connector import get_column_types
+    return get_column_types(table_name)
+
+
+sql_validator = SQLValidator(column_types_fn=_bigquery_column_types)
@@ -1,82 +1,260 @@
 import os
 import json
+import hashlib
+import time
 import logging
-from typing import Dict
-from google.cloud import storage
+import threading
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from google.api_core.exceptions import GoogleAPIError
 from dotenv import load_dotenv
+from .schema_store import SchemaStore
 load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from google_clients import google_clients
 
 logger = logging.getLogger(__name__)
 
 class TableAgentFactory:
-    def __init__(self, gcs_bucket_name: str, gcs_schemas_path: str, project_id: str):
+    """Lazy access to the table schemas stored as JSON files in GCS.
+    
+    Nothing is loaded when the factory is created. The first call that needs table names lists
+    the bucket once; each schema is fetched (from the local schema store when it is current, else
+    from GCS) the first time get_schema asks for it and is memoized. warm_up() loads all schemas
+    concurrently and start_background_warm_up() does so in a background thread.
+    """
+    def __init__(self, gcs_bucket_name: str, gcs_schemas_path: str, project_id: str, max_workers: int = 32,
+                 schema_store_path: Optional[str] = None):
         self.gcs_bucket_name = gcs_bucket_name
         self.gcs_schemas_path = gcs_schemas_path.rstrip('/')
         self.project_id = project_id
+        self.max_workers = max_workers
         self.schemas: Dict[str, dict] = {}
+        self.load_report: Dict[str, float] = {}
+        self.schema_store = self._open_schema_store(schema_store_path)
+        
+        # {table_name: (blob_name, generation, etag)} from the bucket listing
+        self._listing: Optional[Dict[str, Tuple[str, int, Optional[str]]]] = None
+        self._invalid: Set[str] = set()
+        self._bucket = None
+        self._lock = threading.RLock()
+        self._warm_up_thread: Optional[threading.Thread] = None
         logger.info(f"Initializing TableAgentFactory with GCS bucket: {gcs_bucket_name}, path: {gcs_schemas_path}")
-        self._load_all_schemas()
     
-    def _load_all_schemas(self):
-        """Load all JSON schemas from the GCS bucket path."""
+    @staticmethod
+    def _open_schema_store(path: Optional[str]) -> Optional[SchemaStore]:
+        """Open the local schema store, or run without one if it can't be used."""
+        if not path:
+            return None
+        try:
+            return SchemaStore(path)
+        except Exception as e:
+            logger.warning(f"Schema store at {path} unavailable, downloading all schemas: {str(e)}")
+            return None
+    
+    def _get_bucket(self):
+        """Get the bucket handle from the shared storage client on first use."""
+        with self._lock:
+            if self._bucket is None:
+                self._bucket = google_clients.storage(self.project_id).bucket(self.gcs_bucket_name)
+            return self._bucket
+    
+    def _ensure_listed(self) -> Dict[str, Tuple[str, int, Optional[str]]]:
+        """List the schema files in the bucket once and drop stored schemas whose files are gone."""
+        with self._lock:
+            if self._listing is None:
+                start = time.perf_counter()
+                try:
+                    self._listing = {
+                        self._table_name(blob.name): (blob.name, blob.generation, blob.etag)
+                        for blob in self._get_bucket().list_blobs(prefix=self.gcs_schemas_path)
+                        if blob.name.endswith('.json')
+                    }
+                except Exception as e:
+                    logger.error(f"Error listing schemas in GCS: {str(e)}")
+                    raise
+                
+                if self.schema_store:
+                    removed = [name for name in self.schema_store.get_versions() if name not in self._listing]
+                    if removed:
+                        self.schema_store.delete(removed)
+                
+                self.load_report["list_seconds"] = round(time.perf_counter() - start, 3)
+                logger.info(f"Listed {len(self._listing)} schema files in gs://{self.gcs_bucket_name}/{self.gcs_schemas_path}")
+            return self._listing
+    
+    def warm_up(self) -> Dict[str, float]:
+        """Load every schema not loaded yet, reading current ones from the schema store and
+        downloading the rest concurrently. Returns the timing report."""
         try:
-            storage_client = storage.Client(project=self.project_id)
-            bucket = storage_client.bucket(self.gcs_bucket_name)
+            start = time.perf_counter()
+            listing = self._ensure_listed()
+            with self._lock:
+                missing = [name for name in listing if name not in self.schemas and name not in self._invalid]
             
-            # List all files in the schemas path
-            blobs = bucket.list_blobs(prefix=self.gcs_schemas_path)
+            # Read schemas whose stored version is current; tables stored as invalid at their
+            # current generation are skipped until their file changes
+            stored = {}
+            if self.schema_store:
+                stored_versions = self.schema_store.get_versions()
+                unchanged = [name for name in missing if stored_versions.get(name) == listing[name][1:]]
+                stored = self.schema_store.get_many(unchanged)
+            with self._lock:
+                self.schemas.update({name: schema for name, schema in stored.items() if schema is not None})
+                self._invalid.update(name for name, schema in stored.items() if schema is None)
             
-            schema_count = 0
-            for blob in blobs:
-                if blob.name.endswith('.json'):
-                    try:
-                        # Download the file content
-                        content = blob.download_as_text()
-                        schema = json.loads(content)
-                        
-                        # Extract table name from the blob path
-                        table_name = os.path.splitext(os.path.basename(blob.name))[0]
-                        
-                        if "Overview description of file contents" not in schema or "Data dictionary" not in schema:
-                            logger.warning(f"Invalid schema for {table_name}: Missing required fields")
-                            continue
-                            
-                        self.schemas[table_name] = schema
-                        schema_count += 1
-                        logger.info(f"Loaded schema for table: {table_name}")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse schema from {blob.name}: {str(e)}")
-                    except GoogleAPIError as e:
-                        logger.error(f"Failed to download schema from {blob.name}: {str(e)}")
+            # Download with a bounded pool; each blob's errors are handled in _load_schema
+            changed = [name for name in missing if name not in stored]
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="schema_download") as executor:
+                loaded = [result for result in executor.map(self._load_schema, changed) if result is not None]
+            self._save_loaded(loaded)
+            
+            finished = time.perf_counter()
+            with self._lock:
+                schema_count = len(self.schemas)
+            self.load_report.update({
+                "blobs": len(listing),
+                "schemas": schema_count,
+                "failed": len(listing) - schema_count,
+                "downloaded": len(changed),
+                "from_store": len(stored),
+                "warm_up_seconds": round(finished - start, 3),
+            })
+            logger.info(f"Schema load timing: {self.load_report}")
             
             if schema_count == 0:
                 logger.warning(f"No valid schemas found in gs://{self.gcs_bucket_name}/{self.gcs_schemas_path}")
             else:
-                logger.info(f"Successfully loaded {schema_count} schemas from GCS")
+                logger.info(f"Successfully loaded {schema_count} schemas")
+            return self.load_report
                 
         except Exception as e:
             logger.error(f"Error loading schemas from GCS: {str(e)}")
             raise
     
+    def start_background_warm_up(self) -> threading.Thread:
+        """Start warm_up() in a daemon thread, once per factory."""
+        with self._lock:
+            if self._warm_up_thread is None:
+                self._warm_up_thread = threading.Thread(target=self._background_warm_up,
+                                                        name="schema_warm_up", daemon=True)
+                self._warm_up_thread.start()
+            return self._warm_up_thread
+    
+    def _background_warm_up(self):
+        try:
+            self.warm_up()
+        except Exception:
+            # Already logged; schemas will still be fetched on demand
+            pass
+    
+    @property
+    def is_warm(self) -> bool:
+        """Whether a warm-up has finished loading the schemas."""
+        return self._warm_up_thread is not None and not self._warm_up_thread.is_alive() and "warm_up_seconds" in self.load_report
+    
+    @staticmethod
+    def _table_name(blob_name: str) -> str:
+        """Extract table name from the blob path."""
+        return os.path.splitext(os.path.basename(blob_name))[0]
+    
+    def _load_schema(self, table_name: str) -> Optional[tuple]:
+        """Download and validate one table's schema file.
+        
+        Returns (table_name, schema), with schema None if the file is not a valid schema,
+        or None if the download failed.
+        """
+        blob_name, generation, _ = self._listing[table_name]
+        try:
+            # Download the file content at the listed generation
+            content = self._get_bucket().blob(blob_name, generation=generation).download_as_text()
+            schema = json.loads(content)
+            
+            if "Overview description of file contents" not in schema or "Data dictionary" not in schema:
+                logger.warning(f"Invalid schema for {table_name}: Missing required fields")
+                return table_name, None
+                
+            logger.info(f"Loaded schema for table: {table_name}")
+            return table_name, schema
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse schema from {blob_name}: {str(e)}")
+            return table_name, None
+        except GoogleAPIError as e:
+            logger.error(f"Failed to download schema from {blob_name}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error loading schema from {blob_name}: {str(e)}")
+        return None
+    
+    def _save_loaded(self, loaded: List[tuple]):
+        """Memoize downloaded schemas and save them, including invalid ones so they aren't
+        downloaded again until they change."""
+        with self._lock:
+            for table_name, schema in loaded:
+                if schema is None:
+                    self._invalid.add(table_name)
+                else:
+                    self.schemas[table_name] = schema
+        if self.schema_store and loaded:
+            self.schema_store.put_many(
+                (table_name, *self._listing[table_name], schema) for table_name, schema in loaded
+            )
+    
     def get_schema(self, table_name: str) -> dict:
-        """Get the schema for a specific table."""
+        """Get the schema for a specific table, fetching it on first use."""
         schema = self.schemas.get(table_name)
+        if schema:
+            return schema
+        
+        listing = self._ensure_listed()
+        if table_name in listing and table_name not in self._invalid:
+            # Current version from the schema store, else from GCS
+            if self.schema_store and self.schema_store.get_version(table_name) == listing[table_name][1:]:
+                schema = self.schema_store.get(table_name)
+                with self._lock:
+                    if schema:
+                        self.schemas[table_name] = schema
+                    else:
+                        # Stored as invalid at this generation
+                        self._invalid.add(table_name)
+            if not schema and table_name not in self._invalid:
+                loaded = self._load_schema(table_name)
+                if loaded is not None:
+                    self._save_loaded([loaded])
+                    schema = loaded[1]
+        
         if not schema:
             raise ValueError(f"No schema found for table: {table_name}")
         return schema
     
+    def get_schema_version(self, table_name: str) -> str:
+        """Get the version of a table's schema: its GCS generation, or a hash of its content if not listed.
+        
+        The bucket is listed first if it hasn't been, so a table's version doesn't change from a
+        hash to its generation once the listing loads.
+        """
+        listing = self._ensure_listed()
+        if table_name in listing:
+            return str(listing[table_name][1])
+        schema = self.get_schema(table_name)
+        return hashlib.sha1(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+    
     def get_all_table_names(self) -> list:
-        """Get the list of all table names."""
-        return list(self.schemas.keys())
+        """Get the list of all table names (from the bucket listing; schemas load on demand)."""
+        return [name for name in self._ensure_listed() if name not in self._invalid]
 
 # Initialize with GCS bucket and path
 gcs_bucket_name =os.getenv("GOOGLE_BUCKET")
 gcs_schemas_path = os.getenv("GOOGLE_SCHEMA_PATH")
 project_id = os.getenv("BQ_PROJECT_ID")
+schema_store_path = os.getenv(
+    "SCHEMA_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "ccc_policy_assistant", "schemas.sqlite")
+)
 
 table_factory = TableAgentFactory(
     gcs_bucket_name=gcs_bucket_name,
     gcs_schemas_path=gcs_schemas_path,
-    project_id=project_id
+    project_id=project_id,
+    schema_store_path=schema_store_path
 )
\ No newline at end of file
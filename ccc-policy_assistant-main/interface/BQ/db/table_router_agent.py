@@ -1,20 +1,70 @@
 import os
+import sys
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from google.adk.agents import Agent
 from . import prompt
 from .table_factory import table_factory
+from .vector_index import table_vector_index
+from .hybrid_index import table_hybrid_index, table_lexical_index
 from vertexai import rag
 import vertexai
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from text_cleaning_tools import normalize_question
+from chunk_ranking import chunk_similarity, aggregate_chunks, SCORE_AGGREGATIONS
 
 logger = logging.getLogger(__name__)
 
 # Load .env file
 load_dotenv()
 
+# Table routing backends and the source label of their results
+ROUTER_BACKENDS = {
+    "vertex_rag": "vertex_rag",
+    "vector": "vector_index",
+    "lexical": "lexical_index",
+    "hybrid": "hybrid_index",
+}
+
+# In-process indexes of the local backends
+LOCAL_INDEXES = {
+    "vector": table_vector_index,
+    "lexical": table_lexical_index,
+    "hybrid": table_hybrid_index,
+}
+
 class TableRouter:
-    def __init__(self):
-        """Initialize TableRouter with Vertex AI RAG."""
+    """Routes questions to tables with Vertex AI RAG or a local index.
+
+    A router is meant to be long-lived: the RAG corpus is resolved once and refreshed every
+    corpus_refresh_seconds, and ranked results are kept in an LRU cache with a TTL keyed by
+    the normalized question, so repeat questions skip retrieval. Use get_table_router() for
+    the router shared by the process.
+
+    A table's schema is split into many chunks in the RAG corpus, so chunk_overfetch times
+    top_k chunks are retrieved and their scores aggregated per table ("max" keeps the best
+    chunk's score, "sum" adds up all of them) to rank top_k distinct tables in one retrieval.
+    """
+    def __init__(self, backend: str = None, corpus_refresh_seconds: float = 3600,
+                 route_cache_size: int = 1024, route_cache_ttl: float = 3600,
+                 chunk_overfetch: int = 4, score_aggregation: str = "max"):
+        """Initialize TableRouter with Vertex AI RAG, or with a local index ("vector", "lexical" or "hybrid")."""
+        self.backend = backend or os.getenv("TABLE_ROUTER_BACKEND", "vertex_rag")
+        if self.backend not in ROUTER_BACKENDS:
+            raise ValueError(f"Unknown table router backend: {self.backend}")
+        if score_aggregation not in SCORE_AGGREGATIONS:
+            raise ValueError(f"Unknown score aggregation: {score_aggregation}")
+        self.corpus_refresh_seconds = corpus_refresh_seconds
+        self.chunk_overfetch = chunk_overfetch
+        self.score_aggregation = score_aggregation
+        # {corpus_display_name: (corpus_name, resolved_at)}
+        self._corpora = {}
+        self._route_cache = TTLCache(maxsize=route_cache_size, ttl=route_cache_ttl)
+        self._lock = threading.Lock()
         try:
             # Initialize Vertex AI
             project_id = os.getenv("BQ_PROJECT_ID")
@@ -25,6 +75,47 @@ class TableRouter:
             logger.error(f"Failed to initialize Vertex AI: {str(e)}")
             self.rag_enabled = False
 
+    def resolve_corpus(self, corpus_display_name: str) -> str:
+        """Get the resource name of a RAG corpus, listing the corpora only if it isn't resolved or is stale."""
+        cached = self._corpora.get(corpus_display_name)
+        if cached and time.monotonic() - cached[1] < self.corpus_refresh_seconds:
+            return cached[0]
+        
+        # List all corpora to find the target corpus
+        target_corpus = None
+        for corpus in rag.list_corpora():
+            if corpus.display_name == corpus_display_name:
+                target_corpus = corpus
+                break
+
+        if not target_corpus:
+            raise ValueError(f"Corpus with display name '{corpus_display_name}' not found.")
+
+        logger.info(f"Found RAG Corpus: {target_corpus.name}")
+        with self._lock:
+            self._corpora[corpus_display_name] = (target_corpus.name, time.monotonic())
+        return target_corpus.name
+
+    def invalidate_corpus(self, corpus_display_name: str):
+        """Forget a resolved corpus so the next query lists the corpora again."""
+        with self._lock:
+            self._corpora.pop(corpus_display_name, None)
+
+    def retrieve(self, corpus_name: str, query_text: str, top_k: int):
+        """Run a retrieval query against a RAG corpus."""
+        return rag.retrieval_query(
+            rag_resources=[
+                rag.RagResource(
+                    rag_corpus=corpus_name,
+                )
+            ],
+            text=query_text,
+            rag_retrieval_config=rag.RagRetrievalConfig(
+                top_k=top_k,
+                filter=rag.utils.resources.Filter(vector_distance_threshold=0.5)
+            )
+        )
+
     def query_embeddings(self, query_text, corpus_display_name="ccc-schema-updated", top_k=5):
         """Query the embeddings stored in the RAG corpus and return relevant results."""
         if not self.rag_enabled:
@@ -36,32 +127,19 @@ class TableRouter:
             project_id = os.getenv("BQ_PROJECT_ID")
             logger.info(f"Querying embeddings for project: {project_id}, corpus: {corpus_display_name}")
 
-            # List all corpora to find the target corpus
-            corpora = rag.list_corpora()
-            target_corpus = None
-            for corpus in corpora:
-                if corpus.display_name == corpus_display_name:
-                    target_corpus = corpus
-                    break
-
-            if not target_corpus:
-                raise ValueError(f"Corpus with display name '{corpus_display_name}' not found.")
-
-            logger.info(f"Found RAG Corpus: {target_corpus.name}")
+            was_cached = corpus_display_name in self._corpora
+            corpus_name = self.resolve_corpus(corpus_display_name)
 
             # Perform the query
-            response = rag.retrieval_query(
-                rag_resources=[
-                    rag.RagResource(
-                        rag_corpus=target_corpus.name,
-                    )
-                ],
-                text=query_text,
-                rag_retrieval_config=rag.RagRetrievalConfig(
-                    top_k=top_k,
-                    filter=rag.utils.resources.Filter(vector_distance_threshold=0.5)
-                )
-            )
+            try:
+                response = self.retrieve(corpus_name, query_text, top_k)
+            except Exception:
+                if not was_cached:
+                    raise
+                # The corpus may have been recreated since it was resolved; resolve it again and retry once
+                self.invalidate_corpus(corpus_display_name)
+                corpus_name = self.resolve_corpus(corpus_display_name)
+                response = self.retrieve(corpus_name, query_text, top_k)
 
             # Process and display results
             results = []
@@ -69,7 +147,7 @@ class TableRouter:
             for context in response.contexts.contexts:
                 file_name = context.source_uri.split('/')[-1]  # Extract file name from source_uri
                 snippet = context.text
-                results.append({"file_name": file_name, "snippet": snippet})
+                results.append({"file_name": file_name, "snippet": snippet, "score": chunk_similarity(context)})
                 logger.info(f"File: {file_name}, Snippet: {snippet[:100]}...")
 
             print(f"\nQuery Results for '{query_text}':")
@@ -85,28 +163,85 @@ class TableRouter:
             print(f"Query failed: {str(e)}")
             return []
 
+    def query_local_index(self, query_text, top_k=5):
+        """Rank tables against the query with the backend's local index, in the result format of query_embeddings."""
+        index = LOCAL_INDEXES[self.backend]
+        try:
+            index.ensure_built(table_factory)
+            return [
+                {"file_name": f"{result['table_name']}.json", "snippet": result["snippet"], "score": result["score"]}
+                for result in index.search(query_text, top_k=top_k)
+            ]
+        except Exception as e:
+            logger.error(f"{ROUTER_BACKENDS[self.backend]} query failed: {str(e)}")
+            return []
+
+    def rank_tables(self, user_question: str, top_k=5) -> list:
+        """Rank the top_k distinct tables for a question as file_name, snippet and score results."""
+        if self.backend in LOCAL_INDEXES:
+            # Local indexes score whole tables
+            return self.query_local_index(user_question, top_k=top_k)
+        chunk_results = self.query_embeddings(user_question, top_k=top_k * self.chunk_overfetch)
+        return aggregate_chunks(chunk_results, top_k, self.score_aggregation)
+
+    def rank_tables_many(self, user_questions: list, top_k=5, max_workers: int = 8) -> list:
+        """rank_tables() for a batch of questions. Local indexes embed and score the batch together;
+        RAG retrievals run concurrently."""
+        if self.backend in LOCAL_INDEXES:
+            index = LOCAL_INDEXES[self.backend]
+            try:
+                index.ensure_built(table_factory)
+                return [
+                    [
+                        {"file_name": f"{result['table_name']}.json", "snippet": result["snippet"], "score": result["score"]}
+                        for result in results
+                    ]
+                    for results in index.search_many(user_questions, top_k=top_k)
+                ]
+            except Exception as e:
+                logger.error(f"{ROUTER_BACKENDS[self.backend]} batch query failed: {str(e)}")
+                return [[] for _ in user_questions]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="table_router") as executor:
+            return list(executor.map(lambda question: self.rank_tables(question, top_k=top_k), user_questions))
+
     def find_relevant_tables(self, user_question: str, top_k=5) -> list:
-        """Find the top_k most relevant tables using Vertex AI RAG embeddings."""
+        """Find the top_k most relevant tables using the configured routing backend."""
         logger.info(f"Searching for relevant tables for question: {user_question}")
         tables = []
+        source = ROUTER_BACKENDS[self.backend]
         
-        # Query Vertex AI RAG
+        # Query Vertex AI RAG or a local index, unless the question was routed recently
         try:
-            rag_results = self.query_embeddings(user_question, top_k=top_k)
-            rag_tables = [
-                {
-                    "table_name": result["file_name"].replace(".json", ""),
-                    "table_schema": table_factory.get_schema(result["file_name"].replace(".json", "")),
-                    "source": "vertex_rag",
-                    "snippet": result["snippet"]
-                }
-                for result in rag_results
-                if table_factory.get_schema(result["file_name"].replace(".json", "")) 
-            ]
+            cache_key = (normalize_question(user_question), top_k)
+            with self._lock:
+                rag_results = self._route_cache.get(cache_key)
+            if rag_results is not None:
+                logger.info(f"Using cached routing for question: {user_question}")
+            else:
+                rag_results = self.rank_tables(user_question, top_k=top_k)
+                # Empty results are usually failures, so they are not cached
+                if rag_results:
+                    with self._lock:
+                        self._route_cache[cache_key] = rag_results
+            rag_tables = []
+            for result in rag_results:
+                table_name = result["file_name"].replace(".json", "")
+                try:
+                    table_schema = table_factory.get_schema(table_name)
+                except ValueError as e:
+                    logger.warning(f"Skipping routed table without a schema: {str(e)}")
+                    continue
+                rag_tables.append({
+                    "table_name": table_name,
+                    "table_schema": table_schema,
+                    "source": source,
+                    "snippet": result["snippet"],
+                    "score": result["score"]
+                })
             tables.extend(rag_tables)
-            logger.info(f"Found {len(rag_tables)} relevant tables from Vertex AI RAG: {[t['table_name'] for t in rag_tables]}")
+            logger.info(f"Found {len(rag_tables)} relevant tables from {source}: {[t['table_name'] for t in rag_tables]}")
         except Exception as e:
-            logger.error(f"Error querying Vertex AI RAG: {str(e)}")
+            logger.error(f"Error querying {source}: {str(e)}")
         
         # Deduplicate tables by table_name, keeping the first occurrence
         seen = set()
@@ -122,10 +257,29 @@ class TableRouter:
         logger.info(f"Returning {len(unique_tables)} unique relevant tables: {[t['table_name'] for t in unique_tables]}")
         return unique_tables
 
+# Router shared by the process, created on first use
+_TABLE_ROUTER = None
+_TABLE_ROUTER_LOCK = threading.Lock()
+
+def get_table_router() -> TableRouter:
+    """Get the process-wide TableRouter, creating it (and initializing Vertex AI) once."""
+    global _TABLE_ROUTER
+    if _TABLE_ROUTER is None:
+        with _TABLE_ROUTER_LOCK:
+            if _TABLE_ROUTER is None:
+                _TABLE_ROUTER = TableRouter(
+                    corpus_refresh_seconds=float(os.getenv("TABLE_ROUTER_CORPUS_REFRESH", "3600")),
+                    route_cache_size=int(os.getenv("TABLE_ROUTER_CACHE_SIZE", "1024")),
+                    route_cache_ttl=float(os.getenv("TABLE_ROUTER_CACHE_TTL", "3600")),
+                    chunk_overfetch=int(os.getenv("TABLE_ROUTER_CHUNK_OVERFETCH", "4")),
+                    score_aggregation=os.getenv("TABLE_ROUTER_AGGREGATION", "max"),
+                )
+    return _TABLE_ROUTER
+
 def route_to_table(user_question: str) -> dict:
     """Route a user question to relevant tables."""
     try:
-        table_router = TableRouter()
+        table_router = get_table_router()
         relevant_tables = table_router.find_relevant_tables(user_question)
         if not relevant_tables:
             logger.warning("No relevant tables found for the question")
@@ -138,7 +292,8 @@ def route_to_table(user_question: str) -> dict:
                     "table_schema": table["table_schema"],
                     "user_question": user_question,
                     "source": table.get("source", "vertex_rag"),
-                    "snippet": table.get("snippet", "")
+                    "snippet": table.get("snippet", ""),
+                    "confidence": round(table.get("score", 0.0), 4)
                 }
                 for table in relevant_tables
             ]
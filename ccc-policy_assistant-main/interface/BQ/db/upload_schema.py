@@ -1,12 +1,14 @@
 import os
-from google.cloud import storage
+import sys
 from google.api_core.exceptions import GoogleAPIError 
 from dotenv import load_dotenv
 load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from google_clients import google_clients
 
 def upload_folder_to_gcs(local_folder_path: str, gcs_bucket_name: str, gcs_base_path: str, project_id: str):
     try:
-        client = storage.Client(project=project_id)
+        client = google_clients.storage(project_id)
         bucket = client.bucket(gcs_bucket_name)
 
         if not os.path.exists(local_folder_path):
@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from cachetools import LRUCache
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from text_cleaning_tools import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Same embedding model as the Vertex RAG schema corpus
+EMBEDDING_MODEL = "text-embedding-005"
+
+# Characters of a schema embedded per table; the model truncates inputs past its token limit
+MAX_DOCUMENT_CHARS = 8000
+
+
+def schema_document(table_name: str, table_schema: dict) -> str:
+    """Text of a table's schema that is embedded: its name, overview and column descriptions."""
+    columns = "\n".join(f"{col}: {desc}" for col, desc in table_schema["Data dictionary"].items())
+    text = f"{table_name}\n{table_schema['Overview description of file contents']}\n{columns}"
+    return text[:MAX_DOCUMENT_CHARS]
+
+
+def vertex_embed_fn(model_name: str = EMBEDDING_MODEL, batch_size: int = 16) -> Callable[[Sequence[str], str], np.ndarray]:
+    """Embedding function backed by a Vertex AI text embedding model.
+
+    The function takes texts and a task type (RETRIEVAL_DOCUMENT or RETRIEVAL_QUERY) and
+    returns one row per text.
+    """
+    from vertexai.language_models import TextEmbeddingInput, TextEmbeddingModel
+    model = TextEmbeddingModel.from_pretrained(model_name)
+
+    def embed(texts: Sequence[str], task_type: str) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            inputs = [TextEmbeddingInput(text, task_type) for text in texts[i:i + batch_size]]
+            vectors.extend(embedding.values for embedding in model.get_embeddings(inputs))
+        return np.asarray(vectors, dtype=np.float32)
+
+    return embed
+
+
+class TableVectorIndex:
+    """In-process vector index of the table schemas, persisted to disk as a .npz file.
+
+    Each table's schema is embedded once and stored as a unit-length row of a NumPy matrix,
+    with the schema version it was embedded at. build() re-embeds only tables whose schema
+    version changed; search() ranks all tables by cosine similarity with one matrix product.
+    Query embeddings are memoized in an LRU cache, so repeat questions make no remote call at all.
+
+    Builds fetch and embed schemas without holding the lock searches use, and swap the new
+    matrix in at the end, so routing keeps using the previous index during a rebuild.
+    """
+
+    def __init__(self, path: Optional[str], embed_fn: Optional[Callable] = None,
+                 model_name: str = EMBEDDING_MODEL, query_cache_size: int = 1024):
+        self.path = path
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self._embed_fn = embed_fn
+        self.table_names: List[str] = []
+        self.versions: List[str] = []
+        self.snippets: List[str] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._query_cache: LRUCache = LRUCache(maxsize=query_cache_size)
+        # Guards the index arrays and the query cache; held only briefly
+        self._lock = threading.RLock()
+        # Serializes builds
+        self._build_lock = threading.RLock()
+        self._built = False
+
+    def _embed(self, texts: Sequence[str], task_type: str) -> np.ndarray:
+        if self._embed_fn is None:
+            self._embed_fn = vertex_embed_fn(self.model_name)
+        return self._embed_fn(texts, task_type)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+    def load(self) -> bool:
+        """Load the index from disk; returns whether a usable index was found."""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model_name"]) != self.model_name:
+                    logger.info(f"Table index at {self.path} was built with another model; rebuilding")
+                    return False
+                with self._lock:
+                    self.table_names = data["table_names"].tolist()
+                    self.versions = data["versions"].tolist()
+                    self.snippets = data["snippets"].tolist()
+                    self.matrix = data["matrix"]
+            logger.info(f"Loaded table index of {len(self.table_names)} tables from {self.path}")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not load table index from {self.path}: {str(e)}")
+            return False
+
+    def save(self):
+        """Write the index to disk, replacing the previous file atomically."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            table_names, versions, snippets, matrix = self.table_names, self.versions, self.snippets, self.matrix
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                model_name=np.array(self.model_name),
+                table_names=np.array(table_names, dtype=str),
+                versions=np.array(versions, dtype=str),
+                snippets=np.array(snippets, dtype=str),
+                matrix=matrix,
+            )
+        os.replace(tmp_path, self.path)
+
+    def build(self, table_factory) -> Dict[str, float]:
+        """Embed the schemas that are new or changed since the index was saved, drop removed
+        tables, and save the index. Returns a report of the work done."""
+        start = time.perf_counter()
+        with self._build_lock:
+            if not self.table_names:
+                self.load()
+            with self._lock:
+                table_names, versions = self.table_names, self.versions
+                snippets, matrix = self.snippets, self.matrix
+            current = {name: table_factory.get_schema_version(name) for name in table_factory.get_all_table_names()}
+            existing = {name: i for i, name in enumerate(table_names)
+                        if current.get(name) == versions[i]}
+            changed = [name for name in current if name not in existing]
+
+            vectors, new_snippets = None, []
+            if changed:
+                # Download the schemas concurrently rather than one get_schema call at a time
+                if hasattr(table_factory, "warm_up"):
+                    table_factory.warm_up()
+                schemas = {name: table_factory.get_schema(name) for name in changed}
+                vectors = self._normalize(self._embed(
+                    [schema_document(name, schemas[name]) for name in changed], "RETRIEVAL_DOCUMENT"
+                ))
+                new_snippets = [schemas[name]["Overview description of file contents"] for name in changed]
+
+            kept = list(existing.values())
+            names = [table_names[i] for i in kept] + changed
+            rows = [matrix[kept]] if kept else []
+            if vectors is not None:
+                rows.append(vectors)
+
+            modified = bool(changed) or len(kept) != len(table_names)
+            with self._lock:
+                self.table_names = names
+                self.versions = [current[name] for name in names]
+                self.snippets = [snippets[i] for i in kept] + new_snippets
+                self.matrix = np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+                self._built = True
+            if modified:
+                self.save()
+
+        report = {
+            "tables": len(names),
+            "embedded": len(changed),
+            "build_seconds": round(time.perf_counter() - start, 3),
+        }
+        logger.info(f"Table index build: {report}")
+        return report
+
+    def ensure_built(self, table_factory):
+        """Build the index on first use, from disk if it was saved before."""
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self.build(table_factory)
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        """Unit-length embedding of a question, memoized per question."""
+        return self.embed_queries([query_text])[0]
+
+    def embed_queries(self, query_texts: Sequence[str]) -> np.ndarray:
+        """Unit-length embeddings of several questions, one row each, embedding the ones not
+        memoized in batched calls."""
+        keys = [normalize_question(text) for text in query_texts]
+        with self._lock:
+            vectors = {key: self._query_cache.get(key) for key in keys}
+        missing = list({key: text for key, text in zip(keys, query_texts) if vectors[key] is None}.items())
+        if missing:
+            embedded = self._normalize(self._embed([text for _, text in missing], "RETRIEVAL_QUERY"))
+            with self._lock:
+                for (key, _), vector in zip(missing, embedded):
+                    vectors[key] = vector
+                    self._query_cache[key] = vector
+        return np.vstack([vectors[key] for key in keys])
+
+    def scores(self, query_text: str) -> np.ndarray:
+        """Cosine similarity of a question with every table, in table_names order."""
+        if len(self.table_names) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ self.embed_query(query_text)
+
+    def search(self, query_text: str, top_k: int = 5) -> List[dict]:
+        """Get the top_k tables most similar to a question as dicts of table_name, score and snippet."""
+        return self._top_k(self.scores(query_text), top_k)
+
+    def search_many(self, query_texts: Sequence[str], top_k: int = 5) -> List[List[dict]]:
+        """search() for several questions, embedded together and scored with one matrix product."""
+        if len(self.table_names) == 0 or len(query_texts) == 0:
+            return [[] for _ in query_texts]
+        scores = self.embed_queries(query_texts) @ self.matrix.T
+        return [self._top_k(row, top_k) for row in scores]
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> List[dict]:
+        if len(scores) == 0:
+            return []
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            {"table_name": self.table_names[i], "score": float(scores[i]), "snippet": self.snippets[i]}
+            for i in best
+        ]
+
+
+table_vector_index = TableVectorIndex(
+    path=os.getenv(
+        "TABLE_INDEX_PATH",
+        os.path.join(os.path.expanduser("~"), ".cache", "ccc_policy_assistant", "table_index.npz")
+    )
+)
@@ -1,37 +1,174 @@
 import logging, inspect
-import google.genai as genai
 from google.cloud import bigquery
-import json, datetime
-import os
-from google.cloud import storage
+from cachetools import TTLCache
+import pyarrow as pa
+import json, datetime, decimal
+import os, sys, threading
 from dotenv import load_dotenv
 load_dotenv()
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'utils'))
+from google_clients import google_clients
+from result_cache import ResultCache
+from row_limit import enforce_row_limit
 
 GCS_BUCKET_NAME = os.getenv("GOOGLE_BUCKET")
 GCS_SCHEMAS_PATH = os.getenv("GOOGLE_SCHEMA_PATH")
 BQ_PROJECT_ID = os.getenv("BQ_PROJECT_ID")
 BQ_DATASET_ID = os.getenv("BQ_DATASET_ID")
 MODEL_NAME = os.getenv("MODEL_NAME")
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Budgets of generated queries: larger scans are rejected, or need confirmation above the
+# warning threshold, and results are capped at QUERY_MAX_ROWS rows
+QUERY_MAX_BYTES_BILLED = int(os.getenv("QUERY_MAX_BYTES_BILLED", str(10 * 2 ** 30)))
+QUERY_WARN_BYTES = int(os.getenv("QUERY_WARN_BYTES", str(2 ** 30)))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "10000"))
+# On-demand price and a rough scan rate, for the estimates shown to users
+QUERY_PRICE_PER_TIB = float(os.getenv("QUERY_PRICE_PER_TIB", "6.25"))
+QUERY_SCAN_BYTES_PER_SECOND = float(os.getenv("QUERY_SCAN_BYTES_PER_SECOND", str(2 ** 30)))
 
-def execute_query(query: str, table_name: str = None):
-    """Execute a BigQuery SQL query"""
-    bq_client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig()
+
+def dataset_last_modified() -> dict:
+    """Get {table_name: last_modified_time} of every table in the dataset with one metadata query"""
+    query = f"SELECT table_id, last_modified_time FROM `{BQ_PROJECT_ID}.{BQ_DATASET_ID}.__TABLES__`"
+    rows = google_clients.bigquery().query(query).result()
+    return {row["table_id"]: row["last_modified_time"] for row in rows}
+
+
+# Column types by table; BigQuery schemas change about once a year
+_COLUMN_TYPES = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+_COLUMN_TYPES_LOCK = threading.Lock()
+
+def get_column_types(table_name: str) -> dict:
+    """Get {column_name: BigQuery type} of a dataset table from its metadata (no query job)"""
+    with _COLUMN_TYPES_LOCK:
+        column_types = _COLUMN_TYPES.get(table_name)
+    if column_types is None:
+        table = google_clients.bigquery().get_table(f"{BQ_PROJECT_ID}.{BQ_DATASET_ID}.{table_name}")
+        column_types = {field.name: field.field_type for field in table.schema}
+        with _COLUMN_TYPES_LOCK:
+            _COLUMN_TYPES[table_name] = column_types
+    return column_types
+
+
+result_cache = ResultCache(
+    directory=os.getenv(
+        "RESULT_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "ccc_policy_assistant", "results")
+    ),
+    freshness_fn=dataset_last_modified,
+    project=BQ_PROJECT_ID,
+    dataset=BQ_DATASET_ID,
+    size_limit=int(os.getenv("RESULT_CACHE_SIZE_LIMIT", str(2 ** 30))),
+    freshness_ttl=float(os.getenv("RESULT_CACHE_FRESHNESS_TTL", "300")),
+)
+
+
+def query_job_config(table_name: str = None, **kwargs) -> bigquery.QueryJobConfig:
+    """Job configuration of a query, capped at QUERY_MAX_BYTES_BILLED"""
+    job_config = bigquery.QueryJobConfig(maximum_bytes_billed=QUERY_MAX_BYTES_BILLED, **kwargs)
     
     if table_name:
         job_config.default_dataset = f"{BQ_PROJECT_ID}.{BQ_DATASET_ID}"
     
-    job = bq_client.query(query, job_config=job_config)
+    return job_config
+
+def execute_query(query: str, table_name: str = None):
+    """Execute a BigQuery SQL query"""
+    bq_client = google_clients.bigquery()
+    job = bq_client.query(query, job_config=query_job_config(table_name))
     return job.result().to_dataframe()
 
-def execute_sql(clean_sql: str, table_name: str = None) -> dict:
-    """Execute SQL and return JSON results"""
+def estimate_query(sql: str, table_name: str = None) -> dict:
+    """Dry-run a query and estimate its bytes scanned, on-demand cost and scan time"""
+    bq_client = google_clients.bigquery()
+    job = bq_client.query(sql, job_config=query_job_config(table_name, dry_run=True, use_query_cache=False))
+    bytes_processed = job.total_bytes_processed or 0
+    return {
+        "bytes_processed": bytes_processed,
+        "estimated_cost_usd": round(bytes_processed / 2 ** 40 * QUERY_PRICE_PER_TIB, 4),
+        "estimated_seconds": round(bytes_processed / QUERY_SCAN_BYTES_PER_SECOND, 1),
+    }
+
+def guard_query(sql: str, table_name: str = None) -> dict:
+    """Check a query's dry-run estimate against the byte budgets.
+    
+    The estimate's "action" is "run", "warn" above QUERY_WARN_BYTES, or "reject" above
+    QUERY_MAX_BYTES_BILLED.
+    """
+    estimate = estimate_query(sql, table_name)
+    if estimate["bytes_processed"] > QUERY_MAX_BYTES_BILLED:
+        estimate["action"] = "reject"
+    elif estimate["bytes_processed"] > QUERY_WARN_BYTES:
+        estimate["action"] = "warn"
+    else:
+        estimate["action"] = "run"
+    return estimate
+
+def execute_query_arrow(query: str, table_name: str = None) -> pa.Table:
+    """Execute a BigQuery SQL query and fetch the result as an Arrow table.
+    
+    Rows are streamed through the shared BigQuery Storage Read API client when it is
+    installed, and over REST otherwise.
+    """
+    bq_client = google_clients.bigquery()
+    job = bq_client.query(query, job_config=query_job_config(table_name))
+    bqstorage_client = google_clients.bigquery_storage()
+    return job.result().to_arrow(bqstorage_client=bqstorage_client,
+                                 create_bqstorage_client=False)
+
+def arrow_to_records(table: pa.Table) -> list:
+    """Convert an Arrow result to JSON-serializable records, for tools that hand rows to an LLM"""
+    return json.loads(json.dumps(table.to_pylist(), default=date_converter))
+
+def execute_sql_arrow(clean_sql: str, table_name: str = None, allow_heavy: bool = False) -> dict:
+    """Execute SQL and return the Arrow result table, without converting it to JSON.
+    
+    The query is capped at QUERY_MAX_ROWS rows; "truncated" is True when a result reached a
+    cap the query didn't set itself and may be partial. Results of queries over unchanged tables are
+    served from the local result cache; other queries are dry-run first and rejected if they
+    would scan more than QUERY_MAX_BYTES_BILLED. Unless allow_heavy, queries scanning more than
+    QUERY_WARN_BYTES aren't run and return status "needs_confirmation" with their estimate.
+    """
     try:
-        df = execute_query(clean_sql, table_name)
+        clean_sql, row_capped = enforce_row_limit(clean_sql, QUERY_MAX_ROWS)
+        cache_key = result_cache.key(clean_sql)
+        table = result_cache.get(cache_key)
+        if table is not None:
+            return {
+                "table": table,
+                "row_count": table.num_rows,
+                "truncated": row_capped and table.num_rows >= QUERY_MAX_ROWS,
+                "cached": True,
+                "sql": clean_sql,
+                "status": "success"
+            }
+        
+        estimate = guard_query(clean_sql, table_name)
+        if estimate["action"] == "reject":
+            return {
+                "error": (f"Query would scan {estimate['bytes_processed']:,} bytes, over the "
+                          f"{QUERY_MAX_BYTES_BILLED:,} byte limit. Try a narrower question."),
+                "estimate": estimate,
+                "sql": clean_sql,
+                "status": "error"
+            }
+        if estimate["action"] == "warn" and not allow_heavy:
+            return {
+                "estimate": estimate,
+                "sql": clean_sql,
+                "status": "needs_confirmation"
+            }
+        
+        table = execute_query_arrow(clean_sql, table_name)
+        result_cache.put(cache_key, table)
         return {
-            "data": json.loads(df.to_json(orient="records", date_format="iso")),
+            "table": table,
+            "row_count": table.num_rows,
+            "truncated": row_capped and table.num_rows >= QUERY_MAX_ROWS,
+            "cached": False,
+            "estimate": estimate,
+            "sql": clean_sql,
             "status": "success"
         }
     except Exception as e:
@@ -40,10 +177,17 @@ def execute_sql(clean_sql: str, table_name: str = None) -> dict:
             "error": str(e),
             "status": "error"
         }
+
+def execute_sql(clean_sql: str, table_name: str = None, allow_heavy: bool = False) -> dict:
+    """Execute SQL and return JSON results"""
+    result = execute_sql_arrow(clean_sql, table_name, allow_heavy=allow_heavy)
+    if result["status"] == "success":
+        result["data"] = arrow_to_records(result.pop("table"))
+    return result
     
 def generate_sql(user_question: str) -> str:  # Changed return type to str
     module = "{}.{}".format(__name__, inspect.currentframe().f_code.co_name)
-    response = client.models.generate_content(
+    response = google_clients.genai(api_key=GOOGLE_API_KEY).models.generate_content(
         model=MODEL_NAME,
         contents=f"""
         Generate BigQuery SQL following these rules:
@@ -61,5 +205,11 @@ def generate_sql(user_question: str) -> str:  # Changed return type to str
     return clean_sql_2
 
 def date_converter(o):
-    if isinstance(o, (datetime.date, datetime.datetime)):
+    if isinstance(o, (datetime.date, datetime.datetime, datetime.time)):
         return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, datetime.timedelta):
+        return o.total_seconds()
+    if isinstance(o, bytes):
+        return o.decode("utf-8", errors="replace")
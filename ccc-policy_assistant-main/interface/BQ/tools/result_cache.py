@@ -0,0 +1,176 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+def canonicalize_sql(sql: str) -> str:
+    """Collapse whitespace outside string literals and drop a trailing semicolon, for cache keys."""
+    parts = re.split(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""", sql.strip().rstrip(";"))
+    # Odd parts are string literals and are kept verbatim
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts)).strip()
+
+
+def referenced_tables(sql: str, project: str, dataset: str) -> Optional[Set[str]]:
+    """Names of the dataset tables a query reads, or None if it reads anything else.
+
+    Tables are found by parsing the query with sqlglot, so None is also returned when
+    sqlglot is unavailable or can't parse the query, or the query reads no table at all.
+    Unqualified names resolve to the default dataset; CTEs aren't tables.
+    """
+    try:
+        import sqlglot
+        from sqlglot import exp
+        tree = sqlglot.parse_one(sql, read="bigquery")
+    except Exception:
+        return None
+
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    tables = set()
+    for table in tree.find_all(exp.Table):
+        name = table.name
+        if not name:
+            # e.g. UNNEST or a table function
+            return None
+        if not table.db and name.lower() in cte_names:
+            continue
+        if (table.catalog and table.catalog != project) or (table.db and table.db != dataset):
+            return None
+        tables.add(name)
+    return tables or None
+
+
+class ResultCache:
+    """On-disk cache of query results as zstd-compressed Parquet files.
+
+    A result is keyed by its canonicalized SQL and the last_modified time of every dataset
+    table the query reads, so rewriting a table changes the key of its queries and their old
+    results are never returned. Table modification times come from one batched metadata call
+    (freshness_fn) that is reused, or whose failure is remembered, for freshness_ttl seconds.
+    Queries reading any table whose last_modified time isn't known (e.g. in another dataset)
+    aren't cached. Files are evicted least recently used first once the directory exceeds
+    size_limit bytes.
+
+    The directory is created on first use; if that fails the cache passes every query through.
+    """
+
+    def __init__(self, directory: str, freshness_fn: Callable[[], Dict[str, int]],
+                 project: str, dataset: str, size_limit: int = 2 ** 30,
+                 freshness_ttl: float = 300, max_entry_bytes: int = 2 ** 27):
+        self.directory = directory
+        self.freshness_fn = freshness_fn
+        self.project = project
+        self.dataset = dataset
+        self.size_limit = size_limit
+        self.freshness_ttl = freshness_ttl
+        self.max_entry_bytes = max_entry_bytes
+        self.stats = dict(hits=0, misses=0)
+        # None while the latest freshness check failed
+        self._freshness: Optional[Dict[str, int]] = None
+        self._freshness_at = float("-inf")
+        self._lock = threading.Lock()
+        # None until the directory is first used, then whether it is usable
+        self._usable: Optional[bool] = None
+
+    def _ready(self) -> bool:
+        """Create the cache directory on first use; returns whether the cache can be used."""
+        if self._usable is None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self._usable = os.access(self.directory, os.W_OK)
+            except OSError as e:
+                logger.warning(f"Result cache at {self.directory} unavailable: {str(e)}")
+                self._usable = False
+        return self._usable
+
+    def _table_versions(self) -> Optional[Dict[str, int]]:
+        """{table_name: last_modified} of the dataset, or None if the check failed, refreshed
+        every freshness_ttl seconds."""
+        if time.monotonic() - self._freshness_at > self.freshness_ttl:
+            with self._lock:
+                if time.monotonic() - self._freshness_at > self.freshness_ttl:
+                    try:
+                        self._freshness = self.freshness_fn()
+                    except Exception as e:
+                        logger.warning(f"Could not check table freshness; not caching results "
+                                       f"for {self.freshness_ttl:.0f}s: {str(e)}")
+                        self._freshness = None
+                    self._freshness_at = time.monotonic()
+        return self._freshness
+
+    def key(self, sql: str) -> Optional[str]:
+        """Cache key of a query at the current table versions, or None if it can't be cached."""
+        if not self._ready():
+            return None
+        canonical = canonicalize_sql(sql)
+        tables = referenced_tables(canonical, self.project, self.dataset)
+        if tables is None:
+            return None
+        versions = self._table_versions()
+        if versions is None or any(name not in versions for name in tables):
+            return None
+        tables = sorted(tables)
+        fingerprint = "\n".join([canonical] + [f"{name}@{versions[name]}" for name in tables])
+        return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: Optional[str]) -> Optional[pa.Table]:
+        """Get a cached result, or None on a miss."""
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            table = pq.read_table(path)
+        except (FileNotFoundError, OSError, pa.ArrowInvalid):
+            self.stats["misses"] += 1
+            return None
+        # Mark as recently used for eviction; a concurrent put may have just evicted it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats["hits"] += 1
+        return table
+
+    def put(self, key: Optional[str], table: pa.Table):
+        """Store a result and evict least recently used results beyond size_limit."""
+        if key is None or table.nbytes > self.max_entry_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not cache query result: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".parquet"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,51 @@
+import re
+from typing import Tuple
+
+# A LIMIT (and optional OFFSET) ending the query, with a number or a query parameter
+TRAILING_LIMIT = re.compile(r"\bLIMIT\s+(\d+|@\w+|\?)(\s+OFFSET\s+(?:\d+|@\w+|\?))?\s*$", re.IGNORECASE)
+
+def _line_comment_start(line: str) -> int:
+    """Index of the -- or # comment ending a line, outside string literals, or -1"""
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+        elif char == "#" or line.startswith("--", i):
+            return i
+        i += 1
+    return -1
+
+def strip_trailing_comments(sql: str) -> str:
+    """Drop the comments and semicolons ending a query"""
+    while True:
+        sql = sql.strip().rstrip(";").rstrip()
+        if sql.endswith("*/") and "/*" in sql:
+            sql = sql[:sql.rfind("/*")]
+            continue
+        last_line_start = sql.rfind("\n") + 1
+        comment = _line_comment_start(sql[last_line_start:])
+        if comment < 0:
+            return sql
+        sql = sql[:last_line_start + comment]
+
+def enforce_row_limit(sql: str, max_rows: int) -> Tuple[str, bool]:
+    """Add LIMIT max_rows to a query, or lower its own trailing LIMIT to max_rows.
+    
+    Returns the query and whether max_rows was imposed on it, in which case a result of
+    max_rows rows may be partial. A LIMIT of at most max_rows, or given by a query parameter,
+    is kept as-is.
+    """
+    sql = strip_trailing_comments(sql)
+    match = TRAILING_LIMIT.search(sql)
+    if match is None:
+        return f"{sql} LIMIT {max_rows}", True
+    if not match.group(1).isdigit() or int(match.group(1)) <= max_rows:
+        return sql, False
+    return f"{sql[:match.start(1)]}{max_rows}{sql[match.end(1):]}", True
@@ -0,0 +1,294 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Process-wide registry of agent engine handles and pools of pre-created sessions
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from vertexai import agent_engines
+
+from agent_replay import recordingAgentEngine, replayAgentEngine
+
+# Worker pool used to create sessions in the background
+SESSION_EXECUTOR = ThreadPoolExecutor(max_workers=4,
+                                      thread_name_prefix="ccc_session")
+
+
+class sessionPool:
+    '''
+    Pool of pre-created sessions for one agent engine and user. Sessions are
+    created in the background and lent to queries with lease() or acquire().
+
+    Attributes
+
+        pool_size: Number of idle sessions to keep ready
+        session_ttl: Seconds after creation when a session is no longer lent out
+        max_uses: Number of leases before a session is retired; None for no limit.
+            The default of 1 gives every query a fresh session.
+        health_check_after: Seconds a session can sit idle before it is checked
+            with get_session before being lent out
+
+    '''
+
+    def __init__(self,
+                 agent_engine,
+                 user_id: str,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.pool_size = 2
+        self.session_ttl = 30 * 60
+        self.max_uses = 1
+        self.health_check_after = 5 * 60
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.agent_engine = agent_engine
+        self.user_id = user_id
+
+        # Idle sessions and the number being created in the background
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.pending = 0
+
+    def new_entry(self) -> dict:
+        '''
+        Create a session and wrap it with its bookkeeping
+        '''
+
+        session = self.agent_engine.create_session(user_id=self.user_id)
+        now = time.monotonic()
+
+        return dict(session=session,
+                    created=now,
+                    last_used=now,
+                    uses=0)
+
+    def is_expired(self,
+                   entry: dict) -> bool:
+        '''
+        Check if a session has outlived session_ttl or max_uses
+        '''
+
+        if time.monotonic() - entry["created"] > self.session_ttl:
+            return True
+
+        return self.max_uses is not None and entry["uses"] >= self.max_uses
+
+    def is_healthy(self,
+                   entry: dict) -> bool:
+        '''
+        Check that the agent engine still knows about a session
+        '''
+
+        try:
+            self.agent_engine.get_session(user_id=self.user_id,
+                                          session_id=entry["session"]["id"])
+            return True
+        except Exception:
+            return False
+
+    def acquire(self) -> dict:
+        '''
+        Take a session entry out of the pool, creating one if none are ready. The
+        entry's session is in entry["session"]; return it with release().
+        '''
+
+        entry = None
+        while entry is None:
+            with self.lock:
+                if not self.idle:
+                    break
+                entry = self.idle.popleft()
+
+            # Evict expired or unhealthy sessions
+            if self.is_expired(entry):
+                entry = None
+            elif (time.monotonic() - entry["last_used"] > self.health_check_after
+                  and not self.is_healthy(entry)):
+                entry = None
+
+        if entry is None:
+            entry = self.new_entry()
+
+        entry["uses"] += 1
+
+        # Replace what was taken
+        self.refill()
+
+        return entry
+
+    def release(self,
+                entry: dict):
+        '''
+        Return a session entry to the pool unless it should be retired
+        '''
+
+        entry["last_used"] = time.monotonic()
+        if self.is_expired(entry):
+            return
+
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(entry)
+
+    @contextmanager
+    def lease(self):
+        '''
+        Context manager that lends a session for the duration of a query
+        '''
+
+        entry = self.acquire()
+        try:
+            yield entry["session"]
+        finally:
+            self.release(entry)
+
+    def refill(self):
+        '''
+        Start background creation of sessions until pool_size are idle or pending
+        '''
+
+        with self.lock:
+            missing = self.pool_size - len(self.idle) - self.pending
+            self.pending += max(0, missing)
+
+        for _ in range(missing):
+            SESSION_EXECUTOR.submit(self._add_entry)
+
+    def _add_entry(self):
+        '''
+        Create a session and add it to the idle sessions
+        '''
+
+        try:
+            entry = self.new_entry()
+            with self.lock:
+                self.idle.append(entry)
+        except Exception:
+            # The next acquire() creates a session synchronously
+            pass
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+
+class agentEngineRegistry:
+    '''
+    Registry that resolves each reasoning engine resource once per process and
+    keeps a sessionPool per (resource, user)
+
+    Attributes
+
+        mode: "live" to call the agent engines, "record" to call them and save their
+            responses to fixtures_dir, or "replay" to serve saved responses locally
+        fixtures_dir: Directory of the record/replay fixture files
+        replay_latency: Latency distribution of replayed responses (see
+            agent_replay.sample_latency)
+
+    '''
+
+    def __init__(self,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Default sessionPool parameters
+        self.pool_kwargs = {}
+
+        # Live, record or replay agent engines
+        self.mode = "live"
+        self.fixtures_dir = "fixtures/agent_engines"
+        self.replay_latency = "recorded"
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.lock = threading.Lock()
+        self.engines = {}
+        self.pools = {}
+
+    def get_engine(self,
+                   resource_name: str):
+        '''
+        Get the agent engine for a resource name, retrieving it on first use
+        '''
+
+        agent_engine = self.engines.get(resource_name)
+        if agent_engine is None:
+            with self.lock:
+                agent_engine = self.engines.get(resource_name)
+                if agent_engine is None:
+                    agent_engine = self.resolve_engine(resource_name)
+                    self.engines[resource_name] = agent_engine
+
+        return agent_engine
+
+    def resolve_engine(self,
+                       resource_name: str):
+        '''
+        Retrieve the agent engine for a resource name according to the mode
+        '''
+
+        if self.mode == "replay":
+            return replayAgentEngine(resource_name=resource_name,
+                                     fixtures_dir=self.fixtures_dir,
+                                     latency=self.replay_latency,
+                                     event_latency=self.replay_latency)
+
+        agent_engine = agent_engines.get(resource_name)
+        if self.mode == "record":
+            agent_engine = recordingAgentEngine(agent_engine=agent_engine,
+                                                resource_name=resource_name,
+                                                fixtures_dir=self.fixtures_dir)
+
+        return agent_engine
+
+    def get_pool(self,
+                 resource_name: str,
+                 user_id: str,
+                 **kwargs) -> sessionPool:
+        '''
+        Get the session pool for a resource name and user. Key word args override
+        pool_kwargs when the pool is first created.
+        '''
+
+        key = (resource_name, user_id)
+        pool = self.pools.get(key)
+        if pool is None:
+            agent_engine = self.get_engine(resource_name)
+            with self.lock:
+                pool = self.pools.get(key)
+                if pool is None:
+                    pool = sessionPool(agent_engine=agent_engine,
+                                       user_id=user_id,
+                                       **{**self.pool_kwargs, **kwargs})
+                    self.pools[key] = pool
+
+        return pool
+
+    def warm(self,
+             resource_name: str,
+             user_id: str,
+             **kwargs):
+        '''
+        Resolve an engine and start filling its session pool in the background
+        '''
+
+        SESSION_EXECUTOR.submit(lambda: self.get_pool(resource_name, user_id, **kwargs).refill())
+
+
+# Registry shared by all chatbots and sub-agent calls in this process
+AGENT_ENGINES = agentEngineRegistry(mode=os.getenv("CCC_AGENT_MODE", "live"),
+                                    fixtures_dir=os.getenv("CCC_AGENT_FIXTURES", "fixtures/agent_engines"),
+                                    replay_latency=os.getenv("CCC_AGENT_REPLAY_LATENCY", "recorded"))
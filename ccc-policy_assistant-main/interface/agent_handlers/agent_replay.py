@@ -0,0 +1,198 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Record agent engine traffic to fixture files and replay it offline
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+
+# One lock for all fixture file appends in this process
+_FIXTURE_LOCK = threading.Lock()
+
+
+def fixture_path(fixtures_dir: str,
+                 resource_name: str) -> str:
+    '''
+    Path of the JSON lines fixture file of a reasoning engine resource
+    '''
+
+    return os.path.join(fixtures_dir, "{}.jsonl".format(resource_name.rstrip("/").split("/")[-1]))
+
+
+def sample_latency(spec: str,
+                   recorded: float) -> float:
+    '''
+    Sample a latency in seconds from a distribution spec:
+        "none": no delay
+        "recorded": the latency seen when recording
+        "constant:s": s seconds
+        "uniform:a,b": uniform between a and b seconds
+        "lognormal:mu,sigma": log-normal with the given parameters of the log
+        "scaled:f": the recorded latency times f
+    '''
+
+    kind, _, args = spec.partition(":")
+    params = [float(p) for p in args.split(",") if p]
+
+    if kind == "none":
+        return 0.0
+    if kind == "recorded":
+        return recorded
+    if kind == "constant":
+        return params[0]
+    if kind == "uniform":
+        return random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        return random.lognormvariate(params[0], params[1])
+    if kind == "scaled":
+        return recorded * params[0]
+
+    raise ValueError("Unknown latency distribution: {}".format(spec))
+
+
+class recordingAgentEngine:
+    '''
+    Wrapper of an agent engine that appends every create_session response and
+    stream_query event stream, with their latencies, to a fixture file
+
+    '''
+
+    def __init__(self,
+                 agent_engine,
+                 resource_name: str,
+                 fixtures_dir: str):
+        '''
+        Initialize class
+        '''
+
+        self.agent_engine = agent_engine
+        self.resource_name = resource_name
+        self.path = fixture_path(fixtures_dir, resource_name)
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def write_record(self,
+                     record: dict):
+        '''
+        Append a record to the fixture file
+        '''
+
+        record["resource_name"] = self.resource_name
+        line = json.dumps(record, default=str)
+        with _FIXTURE_LOCK:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+    def create_session(self, **kwargs):
+        start = time.monotonic()
+        session = self.agent_engine.create_session(**kwargs)
+        self.write_record(dict(type="create_session",
+                               session=session,
+                               latency=time.monotonic() - start))
+        return session
+
+    def get_session(self, **kwargs):
+        return self.agent_engine.get_session(**kwargs)
+
+    def stream_query(self, message: str, **kwargs):
+        start = time.monotonic()
+        events = []
+        event_times = []
+        for event in self.agent_engine.stream_query(message=message, **kwargs):
+            event_times.append(time.monotonic() - start)
+            events.append(event)
+            yield event
+
+        self.write_record(dict(type="stream_query",
+                               message=message,
+                               events=events,
+                               event_times=event_times,
+                               latency=time.monotonic() - start))
+
+    def __getattr__(self, name):
+        return getattr(self.agent_engine, name)
+
+
+class replayAgentEngine:
+    '''
+    Local stand-in for an agent engine that serves recorded responses from a fixture
+    file. stream_query returns the recording for the same message, or the next
+    recording in turn when the message was not recorded.
+
+    Attributes
+
+        latency: Distribution (see sample_latency) of the delay before the first event
+        event_latency: Distribution of the delay between events; "recorded" replays
+            the recorded gaps
+
+    '''
+
+    def __init__(self,
+                 resource_name: str,
+                 fixtures_dir: str,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.latency = "recorded"
+        self.event_latency = "recorded"
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.resource_name = resource_name
+        self.path = fixture_path(fixtures_dir, resource_name)
+
+        self.sessions = []
+        self.queries = []
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] == "create_session":
+                    self.sessions.append(record)
+                elif record["type"] == "stream_query":
+                    self.queries.append(record)
+
+        if len(self.queries) == 0:
+            raise ValueError("No stream_query recordings in {}".format(self.path))
+
+        self.queries_by_message = {}
+        for record in self.queries:
+            self.queries_by_message.setdefault(record["message"], record)
+
+        self.lock = threading.Lock()
+        self.next_query = 0
+
+    def create_session(self, user_id: str, **kwargs):
+        recorded = random.choice(self.sessions) if self.sessions else dict(latency=0.0, session={})
+        time.sleep(sample_latency(self.latency, recorded["latency"]))
+
+        session = dict(recorded["session"])
+        session.update(id=str(uuid.uuid4()), user_id=user_id)
+        return session
+
+    def get_session(self, user_id: str, session_id: str, **kwargs):
+        return dict(id=session_id, user_id=user_id)
+
+    def stream_query(self, message: str, **kwargs):
+        record = self.queries_by_message.get(message)
+        if record is None:
+            with self.lock:
+                record = self.queries[self.next_query % len(self.queries)]
+                self.next_query += 1
+
+        event_times = record.get("event_times") or [record["latency"]] * len(record["events"])
+        previous = 0.0
+        for i, event in enumerate(record["events"]):
+            recorded_gap = event_times[i] - previous
+            previous = event_times[i]
+            spec = self.latency if i == 0 else self.event_latency
+            time.sleep(sample_latency(spec, recorded_gap))
+            yield event
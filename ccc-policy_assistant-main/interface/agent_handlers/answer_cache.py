@@ -0,0 +1,368 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Semantic cache of chatbot reports keyed by normalized query text and query embedding
+
+import os
+import sys
+import copy
+import time
+import hashlib
+import threading
+
+import numpy as np
+from cachetools import TTLCache, LRUCache
+
+utils_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils")
+sys.path.insert(0, utils_path)
+from text_cleaning_tools import normalize_question
+
+
+def conversation_fingerprint(prior_queries: list) -> str:
+    '''
+    Fingerprint of a conversation's prior queries; empty for the first query of a conversation
+    '''
+
+    if not prior_queries:
+        return ""
+
+    text = "\n".join(normalize_question(query) for query in prior_queries)
+
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def vertex_embed_fn(model_name: str = "text-embedding-005"):
+    '''
+    Create an embedding function using a Vertex AI text embedding model. The model
+    is loaded on first use.
+    '''
+
+    state = {}
+
+    def embed(text: str) -> list:
+        if "model" not in state:
+            from vertexai.language_models import TextEmbeddingModel
+            state["model"] = TextEmbeddingModel.from_pretrained(model_name)
+
+        return state["model"].get_embeddings([text])[0].values
+
+    return embed
+
+
+class memoryCacheBackend:
+    '''
+    In-process cache backend with LRU eviction, a TTL and a maximum number of entries.
+    TTLCache isn't thread-safe, so every access holds a lock.
+    '''
+
+    def __init__(self,
+                 max_entries: int,
+                 ttl: float):
+        '''
+        Initialize class
+        '''
+
+        self.cache = TTLCache(maxsize=max_entries, ttl=ttl)
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            return self.cache.get(key)
+
+    def set(self, key: str, value: dict):
+        with self.lock:
+            self.cache[key] = value
+
+    def delete(self, key: str):
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def items(self):
+        with self.lock:
+            return list(self.cache.items())
+
+
+class diskCacheBackend:
+    '''
+    On-disk cache backend using diskcache, shared by processes using the same directory.
+    Evicts least recently used entries beyond size_limit bytes.
+    '''
+
+    def __init__(self,
+                 directory: str,
+                 ttl: float,
+                 size_limit: int):
+        '''
+        Initialize class
+        '''
+
+        import diskcache
+
+        self.ttl = ttl
+        self.cache = diskcache.Cache(directory,
+                                     size_limit=size_limit,
+                                     eviction_policy="least-recently-used")
+
+    def get(self, key: str):
+        return self.cache.get(key)
+
+    def set(self, key: str, value: dict):
+        self.cache.set(key, value, expire=self.ttl)
+
+    def delete(self, key: str):
+        self.cache.delete(key)
+
+    def items(self):
+        items = []
+        for key in self.cache.iterkeys():
+            value = self.cache.get(key)
+            if value is not None:
+                items.append((key, value))
+        return items
+
+
+class answerCache:
+    '''
+    Cache of report dictionaries for user queries. A query hits the cache when its
+    normalized text matches a stored query or, if an embedding function is given
+    (semantic matching is off by default, since embedding is a remote call on every
+    miss), when its embedding's cosine similarity to a stored query is at least
+    similarity_threshold. Both must also have the same context (see
+    conversation_fingerprint), so a follow-up query only matches answers given after
+    the same prior queries.
+
+    Attributes
+
+        backend: "memory" or "disk"
+        similarity_threshold: Minimum cosine similarity for a semantic hit
+        ttl: Seconds an answer stays in the cache
+        max_entries: Maximum number of answers kept by the memory backend
+        cache_dir: Directory of the disk backend
+        disk_size_limit: Maximum size in bytes of the disk backend
+        embed_fn: Function returning an embedding for a text; None (the default) for
+            exact matches only
+
+    '''
+
+    def __init__(self,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.backend = "memory"
+        self.similarity_threshold = 0.95
+        self.ttl = 24 * 60 * 60
+        self.max_entries = 500
+        self.cache_dir = "/tmp/ccc_answer_cache"
+        self.disk_size_limit = 2 ** 28
+        self.embed_fn = None
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        if self.backend == "disk":
+            self.store = diskCacheBackend(directory=self.cache_dir,
+                                          ttl=self.ttl,
+                                          size_limit=self.disk_size_limit)
+        else:
+            self.store = memoryCacheBackend(max_entries=self.max_entries,
+                                            ttl=self.ttl)
+
+        # Guards the embedding index, the query embeddings and the stats, which
+        # Streamlit sessions share across threads
+        self.lock = threading.Lock()
+
+        # Embeddings of recent queries so a miss does not embed the query twice
+        self.query_embeddings = LRUCache(maxsize=256)
+
+        # Embedding index of cached queries: parallel rows of keys, contexts and vectors,
+        # the row of each key, and the number of rows of each context
+        self.index_rows = {}
+        self.index_keys = []
+        self.index_contexts = []
+        self.index_vectors = []
+        self.index_matrix = None
+        self.context_counts = {}
+        for key, entry in self.store.items():
+            if entry.get("embedding") is not None:
+                self._add_to_index(key, entry.get("context", ""), entry["embedding"])
+
+        # Hit and miss counts
+        self.stats = dict(exact_hits=0, semantic_hits=0, misses=0)
+
+    def _count(self,
+               stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def embed(self,
+              key: str):
+        '''
+        Get the normalized embedding of a normalized query, or None if embeddings
+        are unavailable
+        '''
+
+        if self.embed_fn is None:
+            return None
+
+        with self.lock:
+            vector = self.query_embeddings.get(key)
+        if vector is None:
+            try:
+                vector = np.asarray(self.embed_fn(key), dtype=np.float32)
+            except Exception:
+                return None
+
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            with self.lock:
+                self.query_embeddings[key] = vector
+
+        return vector
+
+    @staticmethod
+    def cache_key(normalized_query: str,
+                  context: str) -> str:
+        '''
+        Key of a normalized query asked in a context
+        '''
+
+        return "{}|{}".format(context, normalized_query) if context else normalized_query
+
+    def get(self,
+            query: str,
+            context: str = ""):
+        '''
+        Get a copy of the cached report for a query asked in a context, or None on a miss
+        '''
+
+        normalized = normalize_question(query)
+        key = self.cache_key(normalized, context)
+
+        # Exact match of the normalized query
+        entry = self.store.get(key)
+        if entry is not None:
+            self._count("exact_hits")
+            return copy.deepcopy(entry["report_dict"])
+
+        # Nearest live cached query by embedding, among queries asked in the same context
+        with self.lock:
+            indexed = self.context_counts.get(context, 0) > 0
+        vector = self.embed(normalized) if indexed else None
+        if vector is not None:
+            with self.lock:
+                if self.index_matrix is None:
+                    self.index_matrix = np.vstack(self.index_vectors)
+                similarities = self.index_matrix @ vector
+                same_context = np.array([c == context for c in self.index_contexts])
+                similarities = np.where(same_context, similarities, -np.inf)
+                candidates = [self.index_keys[i] for i in np.argsort(-similarities, kind="stable")
+                              if similarities[i] >= self.similarity_threshold]
+
+            # Entries expired or evicted from the backend don't shadow the next best match
+            for candidate in candidates:
+                entry = self.store.get(candidate)
+                if entry is not None:
+                    self._count("semantic_hits")
+                    return copy.deepcopy(entry["report_dict"])
+                self._remove_from_index(candidate)
+
+        self._count("misses")
+        return None
+
+    def set(self,
+            query: str,
+            report_dict: dict,
+            context: str = ""):
+        '''
+        Store the report for a query asked in a context
+        '''
+
+        normalized = normalize_question(query)
+        key = self.cache_key(normalized, context)
+        vector = self.embed(normalized)
+
+        entry = dict(query=query,
+                     context=context,
+                     report_dict=copy.deepcopy(report_dict),
+                     embedding=None if vector is None else vector.tolist(),
+                     created=time.time())
+        self.store.set(key, entry)
+
+        if vector is not None:
+            self._add_to_index(key, context, vector)
+
+    def _add_to_index(self,
+                      key: str,
+                      context: str,
+                      vector):
+        '''
+        Add or replace a query in the embedding index
+        '''
+
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            row = self.index_rows.get(key)
+            if row is not None:
+                self.index_vectors[row] = vector
+            else:
+                self.index_rows[key] = len(self.index_keys)
+                self.index_keys.append(key)
+                self.index_contexts.append(context)
+                self.index_vectors.append(vector)
+                self.context_counts[context] = self.context_counts.get(context, 0) + 1
+
+            # Drop index entries the backend has evicted
+            if len(self.index_keys) > 2 * self.max_entries:
+                for dead in [k for k in self.index_keys if self.store.get(k) is None]:
+                    self._remove_row(dead)
+
+            self.index_matrix = None
+
+    def _remove_from_index(self,
+                           key: str):
+        '''
+        Remove a query from the embedding index
+        '''
+
+        with self.lock:
+            self._remove_row(key)
+
+    def _remove_row(self,
+                    key: str):
+        '''
+        Remove a query's row from the embedding index by moving the last row into it.
+        Must be called holding self.lock.
+        '''
+
+        row = self.index_rows.pop(key, None)
+        if row is None:
+            return
+
+        context = self.index_contexts[row]
+        self.context_counts[context] -= 1
+        if not self.context_counts[context]:
+            del self.context_counts[context]
+
+        last = len(self.index_keys) - 1
+        if row != last:
+            moved = self.index_keys[last]
+            self.index_keys[row] = moved
+            self.index_contexts[row] = self.index_contexts[last]
+            self.index_vectors[row] = self.index_vectors[last]
+            self.index_rows[moved] = row
+        self.index_keys.pop()
+        self.index_contexts.pop()
+        self.index_vectors.pop()
+        self.index_matrix = None
+
+
+# Cache shared by all chatbots in this process. Near-identical queries only hit with
+# CCC_ANSWER_CACHE_SEMANTIC=true; short policy questions that differ in a year or a
+# college can be very similar, so raise CCC_ANSWER_CACHE_SIMILARITY if they collide.
+SEMANTIC_ANSWER_CACHE = os.getenv("CCC_ANSWER_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE = answerCache(backend=os.getenv("CCC_ANSWER_CACHE_BACKEND", "memory"),
+                           cache_dir=os.getenv("CCC_ANSWER_CACHE_DIR", "/tmp/ccc_answer_cache"),
+                           similarity_threshold=float(os.getenv("CCC_ANSWER_CACHE_SIMILARITY", "0.95")),
+                           embed_fn=vertex_embed_fn() if SEMANTIC_ANSWER_CACHE else None)
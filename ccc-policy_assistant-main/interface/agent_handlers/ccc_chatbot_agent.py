@@ -6,11 +6,32 @@
 
 import os, sys
 import json
+import time
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 import vertexai
 from vertexai import agent_engines
 
-from ccc_subagent_parser import getSubAgentResults
+from ccc_subagent_parser import getSubAgentResults, emptySubAgentResults, SUB_AGENT_RESOURCES
+from agent_engine_registry import AGENT_ENGINES
+from answer_cache import ANSWER_CACHE, conversation_fingerprint
+from context_builder import contextBuilder
+from resilience import call_with_resilience, DEFAULT_CALL_POLICY
+
+# Streaming JSON parser
+utils_path = "../utils/"
+sys.path.insert(0, utils_path)
+from json_stream_parser import EventStreamParser
+
+# Shared worker pool for sub-agent searches. It lives at module level so that a
+# search that overruns its timeout does not block the chat turn that started it.
+SUB_AGENT_EXECUTOR = ThreadPoolExecutor(max_workers=12,
+                                        thread_name_prefix="ccc_subagent")
+
+# Run configuration of the synthesis agent: stream partial text events (ADK RunConfig)
+SYNTHESIS_RUN_CONFIG = {"streaming_mode": "sse"}
 
 class cccChatBot:
     '''
@@ -28,12 +49,51 @@ class cccChatBot:
         self.max_va_uris = 5
         self.max_gs_uris = 5
 
+        # Parameters - Run the sub-agent searches concurrently and the number of
+        # seconds to wait for each one before continuing without its results
+        self.concurrent_search = True
+        self.sub_agent_timeout = 60
+
+        # Parameters - Answer repeated and near-identical queries from the shared answer cache
+        self.use_answer_cache = True
+
+        # Parameters - Maximum number of tokens of search results in the synthesis query
+        self.context_token_budget = 6000
+
+        # Parameters - When to run the IPEDS search:
+        #   "lazy": only when its results are first needed
+        #   "speculative": in the background with the other searches; cancelled if not
+        #       needed before the next query
+        #   "eager": with the other searches, waiting for it at the end of each query
+        self.ipeds_search = "lazy"
+
+        # Parameters - Overrides of the default remote call policy (see
+        # resilience.DEFAULT_CALL_POLICY) for the sub-agents and the synthesis agent.
+        # Synthesis calls are never hedged or retried since they share the conversation's
+        # session: a retry after the server accepted the query would repeat the user's turn.
+        self.call_policy = {}
+        self.synthesis_call_policy = dict(deadline=90.0,
+                                          max_attempts=1)
+
         # Update any key word args
         self.__dict__.update(kwargs)
 
         # Users's query
         self.user_id = user_id
 
+        # Queries asked so far in this conversation
+        self.prior_queries = []
+
+        # (query, report) of turns answered from the cache, which the synthesis session
+        # hasn't seen yet; they are sent ahead of the next synthesized query
+        self.unsent_turns = []
+
+        # IPEDS search state for the latest query
+        self.ipeds_query = None
+        self.ipeds_futures = None
+        self.ipeds_cancel = None
+        self._ip_results = None
+
         # Synthesis agent resouce
         self.synthesis_resource_name = "projects/1062597788108/locations/us-central1/reasoningEngines/3177122411342462976"
 
@@ -41,12 +101,29 @@ class cccChatBot:
         ########### Adjust for production deployments
         # self.authenticate()
 
-        # Retrieve agent
-        self.agent_engine = agent_engines.get(self.synthesis_resource_name)
+        # Retrieve agent (resolved once per process) and establish session - the chatbot
+        # keeps its synthesis session for the whole conversation, taking a pre-created
+        # one from the shared pool when available. Setting up adds no turn, so it is retried.
+        self.agent_engine, self.session = call_with_resilience(name="synthesis_setup",
+                                                               fn=self.start_synthesis_session,
+                                                               **{**self.synthesis_call_policy,
+                                                                  "max_attempts": DEFAULT_CALL_POLICY["max_attempts"],
+                                                                  "hedge_after": None})
+
+        # Start creating sessions for the sub-agents so searches don't wait for them
+        for resource_name in SUB_AGENT_RESOURCES.values():
+            AGENT_ENGINES.warm(resource_name, self.user_id)
 
-        # Establish session
-        self.session = self.agent_engine.create_session(user_id=self.user_id)
 
+    def start_synthesis_session(self) -> tuple:
+        '''
+        Retrieve the synthesis agent and a session for this chatbot
+        '''
+
+        agent_engine = AGENT_ENGINES.get_engine(self.synthesis_resource_name)
+        synthesis_pool = AGENT_ENGINES.get_pool(self.synthesis_resource_name, self.user_id)
+
+        return agent_engine, synthesis_pool.acquire()["session"]
 
     def authenticate(self):
         '''
@@ -67,7 +144,18 @@ class cccChatBot:
     def stream_and_parse_query(self,
                                query: str):
         '''
-        Method to respond to a user's query
+        Method to respond to a user's query. The complete report is in self.report_dict.
+        '''
+
+        for _ in self.stream_report(query=query):
+            pass
+
+    def stream_report(self,
+                      query: str):
+        '''
+        Generator responding to a user's query that yields (key, value) tuples for
+        each section of the report as soon as the synthesis agent has completed it.
+        self.report_dict holds the sections received so far.
         '''
 
         # # Authenticate
@@ -79,37 +167,227 @@ class cccChatBot:
         # # Establish session
         # self.session = self.agent_engine.create_session(user_id=self.user_id)
 
-        ### Step 1. Get RAG Vertex AI search results of web text
-        self.va_results = getSubAgentResults(query=query,
-                                             rag_agent="rag_webtext",
-                                             user_id=self.user_id)
-
-        ### Step 2. Get Google search results
-        self.gs_results = getSubAgentResults(query=query,
-                                             rag_agent="search",
-                                             user_id=self.user_id)
+        # Nobody asked for the previous query's IPEDS results
+        self.cancel_ipeds_search()
+        self.ipeds_query = query
+
+        # The same query can mean something else after different prior queries
+        # (e.g. "what about 2022?"), so cached answers are keyed by the conversation so far
+        self.cache_context = conversation_fingerprint(self.prior_queries)
+        self.prior_queries.append(query)
+
+        # Answer from the cache if this query (or a near-identical one) was seen recently
+        self.cache_hit = False
+        if self.use_answer_cache:
+            cached_report = ANSWER_CACHE.get(query, context=self.cache_context)
+            if cached_report is not None:
+                self.cache_hit = True
+                self.reset_query_results(query=query)
+                self.report_dict = cached_report
+                self.unsent_turns.append((query, cached_report))
+                for key, value in cached_report.items():
+                    yield key, value
+                return
+
+        ### Steps 1 and 2. Get RAG Vertex AI search results of web text and Google search results.
+        # The IPEDS search (step 6) does not depend on the synthesis so it can start now as well.
+        self.sub_agent_errors = {}
+        if self.ipeds_search in ["speculative", "eager"]:
+            self.start_ipeds_search()
+
+        if self.concurrent_search:
+            futures = self.submit_sub_agents(query=query,
+                                             rag_agents=["rag_webtext", "search"])
+            results = self.collect_sub_agents(futures=futures,
+                                              rag_agents=["rag_webtext", "search"])
+
+            # Synthesis needs at least one set of search results
+            if len(self.sub_agent_errors) == 2:
+                msg = "All sub-agent searches failed: {}".format(self.sub_agent_errors)
+                raise RuntimeError(msg)
 
-        # Step 3. Create full-context query using search results
-        self.context = " ".join(self.va_results.contents + self.gs_results.contents)
+        else:
+            results = {rag_agent: getSubAgentResults(query=query,
+                                                     rag_agent=rag_agent,
+                                                     user_id=self.user_id,
+                                                     call_policy=self.call_policy)
+                       for rag_agent in ["rag_webtext", "search"]}
+
+        self.va_results = results["rag_webtext"]
+        self.gs_results = results["search"]
+
+        # Step 3. Create full-context query using search results,
+        # keeping the most relevant results that fit the context token budget
+        self.context_builder = contextBuilder(token_budget=self.context_token_budget)
+        self.context = self.context_builder.build(query=query,
+                                                  snippets=self.va_results.contents + self.gs_results.contents)
         q_wrp = ("Use the following search results to synthesize an answer "
                  "in the context of California community colleges "
                  "to this user query: {}?  "
                  "Search results: {}.")
-        self.full_context_query = q_wrp.format(query,
-                                               self.context)
+        self.full_context_query = self.unsent_turns_preamble() + q_wrp.format(query,
+                                                                              self.context)
+
+        # Step 4. Call the synthesis agent. Opening its stream has a deadline, retries
+        # and a circuit breaker; once sections are shown to the user it can't be retried.
+        self.result = call_with_resilience(name="synthesis",
+                                           fn=self.open_synthesis_stream,
+                                           **{**self.synthesis_call_policy,
+                                              "hedge_after": None})
+        self.unsent_turns = []
+
+        # Step 5. Parse response as it streams in
+        for section in self.stream_synthesis_response():
+            yield section
+
+        # Cache complete reports built from all search results
+        if self.use_answer_cache and "report_body" in self.report_dict and not self.sub_agent_errors:
+            ANSWER_CACHE.set(query, self.report_dict, context=self.cache_context)
+
+        # Step 6. Wait for the IPEDS search results now if not deferred
+        if self.ipeds_search == "eager":
+            _ = self.ip_results
+
+    def reset_query_results(self,
+                            query: str):
+        '''
+        Clear the search results, context and synthesis output of the previous query,
+        for a query answered without searching
+        '''
+
+        self.sub_agent_errors = {}
+        self.va_results = emptySubAgentResults(rag_agent="rag_webtext", query=query)
+        self.gs_results = emptySubAgentResults(rag_agent="search", query=query)
+        self.context_builder = None
+        self.context = ""
+        self.full_context_query = None
+        self.result = None
+        self.events = []
+
+    def unsent_turns_preamble(self) -> str:
+        '''
+        Text giving the synthesis agent the turns answered from the cache since its last
+        query, so its conversation history matches the user's
+        '''
+
+        if not self.unsent_turns:
+            return ""
+
+        turns = ["User query: {}\nAnswer: {}".format(query, report.get("report_executive_summary",
+                                                                     report.get("report_body", "")))
+                 for query, report in self.unsent_turns]
+
+        return ("Earlier in this conversation the user also asked the following, and was "
+                "given these answers:\n{}\n\n").format("\n\n".join(turns))
 
-        # Step 4. Call the synthesis agent
-        self.result = self.agent_engine.stream_query(message=self.full_context_query,
+    def open_synthesis_stream(self):
+        '''
+        Start the synthesis agent's response stream, returning an iterator of its events
+        once the first one has arrived
+        '''
+
+        # ADK only emits the final event unless streaming is requested; with SSE, partial
+        # events carry the text as it is generated
+        events = iter(self.agent_engine.stream_query(message=self.full_context_query,
                                                      session_id=self.session["id"],
-                                                     user_id=self.user_id)
+                                                     user_id=self.user_id,
+                                                     run_config=SYNTHESIS_RUN_CONFIG))
+        first_event = next(events, None)
+        if first_event is None:
+            return iter([])
+
+        return itertools.chain([first_event], events)
 
-        # Step 5. Parse response
-        self.parse_synthesis_response()
+    @property
+    def ip_results(self):
+        '''
+        IPEDS search results for the latest query. Waits for a search started by
+        start_ipeds_search(), or runs the search now if none was started.
+        '''
+
+        if self._ip_results is None and self.ipeds_query is not None:
+            if self.ipeds_futures is None:
+                self.start_ipeds_search()
+
+            self._ip_results = self.collect_sub_agents(futures=self.ipeds_futures,
+                                                       rag_agents=["rag_ipeds"])["rag_ipeds"]
+            self.ipeds_futures = None
+
+        return self._ip_results
+
+    def start_ipeds_search(self):
+        '''
+        Method to start the IPEDS search for the latest query in the background
+        '''
+
+        self.ipeds_cancel = threading.Event()
+        self.ipeds_futures = self.submit_sub_agents(query=self.ipeds_query,
+                                                   rag_agents=["rag_ipeds"],
+                                                   cancel_event=self.ipeds_cancel)
+
+    def cancel_ipeds_search(self):
+        '''
+        Method to cancel an IPEDS search nobody has asked for. A search that has not
+        started is removed from the worker pool; a running one stops reading its stream.
+        '''
+
+        if self.ipeds_futures is not None:
+            self.ipeds_cancel.set()
+            self.ipeds_futures["rag_ipeds"][0].cancel()
+
+        self.ipeds_futures = None
+        self.ipeds_cancel = None
+        self._ip_results = None
+
+    def submit_sub_agents(self,
+                          query: str,
+                          rag_agents: list,
+                          cancel_event: threading.Event = None) -> dict:
+        '''
+        Method to start sub-agent searches in the shared worker pool
+
+        Returns a dictionary of rag_agent: (future, start time, query)
+        '''
 
-        # Step 6. Call the IPEDS search
-        self.ip_results = getSubAgentResults(query=query,
-                                             rag_agent="rag_ipeds",
-                                             user_id=self.user_id)
+        futures = {}
+        for rag_agent in rag_agents:
+            future = SUB_AGENT_EXECUTOR.submit(getSubAgentResults,
+                                               query=query,
+                                               rag_agent=rag_agent,
+                                               user_id=self.user_id,
+                                               cancel_event=cancel_event,
+                                               call_policy=self.call_policy)
+            futures[rag_agent] = (future, time.monotonic(), query)
+
+        return futures
+
+    def collect_sub_agents(self,
+                           futures: dict,
+                           rag_agents: list) -> dict:
+        '''
+        Method to wait for sub-agent searches started by submit_sub_agents. Each search
+        gets sub_agent_timeout seconds from when it was submitted; searches that fail or
+        time out are recorded in self.sub_agent_errors and return empty results.
+
+        '''
+
+        results = {}
+        for rag_agent in rag_agents:
+            future, started, query = futures[rag_agent]
+            remaining = max(0, self.sub_agent_timeout - (time.monotonic() - started))
+
+            try:
+                results[rag_agent] = future.result(timeout=remaining)
+
+            except Exception as e:
+                future.cancel()
+                error = "{}: {}".format(type(e).__name__, e)
+                self.sub_agent_errors[rag_agent] = error
+                results[rag_agent] = emptySubAgentResults(rag_agent=rag_agent,
+                                                          query=query,
+                                                          error=error)
+
+        return results
 
     def parse_synthesis_response(self):
         '''
@@ -118,30 +396,28 @@ class cccChatBot:
 
         '''
 
-        # Put results into a dictionary for later access
-        self.events = []
-        for event in self.result:
-            self.events.append(event)
+        for _ in self.stream_synthesis_response():
+            pass
 
-        # Create an output dictionary
-        contents = []
+    def stream_synthesis_response(self):
+        '''
+        Generator parsing the synthesis agent's JSON output (as specified in the JSON
+        output schema format) while it streams. Yields (key, value) tuples as each
+        report section completes, then the reference URIs from the search results.
 
-        # Get text results
-        for event in self.events:
-            if type(event) == dict:
-                for key in event.keys():
-                    if type(event[key]) == dict and key == "content":
-                        for txt_dict in event[key]["parts"]:
-                            contents.append(txt_dict["text"])
+        '''
 
-        # Convert the output JSON to a dictionary
-        contstr = contents[0].replace("```json\n", "")
-        contstr = contstr.replace("\n```", "")
+        self.events = []
+        self.report_dict = {}
+        parser = EventStreamParser()
 
-        try:
-            self.report_dict = json.loads(contstr)
-        except:
-            self.report_dict = {}
+        for event in self.result:
+            self.events.append(event)
+
+            # Get text results
+            for key, value in parser.feed(event):
+                self.report_dict[key] = value
+                yield key, value
 
         # Add reference URIs from search results
         ref_uris = []
@@ -152,6 +428,7 @@ class cccChatBot:
 
         # Add these to report dictionary
         self.report_dict["reference_uris"] = ref_uris
+        yield "reference_uris", ref_uris
 
     def parse_ipeds_search_results(self):
         '''
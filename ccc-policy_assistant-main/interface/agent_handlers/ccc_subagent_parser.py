@@ -6,15 +6,25 @@
 import os, sys
 import re
 import json
+from concurrent.futures import CancelledError
 
-# import vertexai
-from vertexai import agent_engines
+from agent_engine_registry import AGENT_ENGINES
+from resilience import call_with_resilience, call_cancelled
+from grounding_parser import parse_rag_events
 
 # Text cleaning
 utils_path = "../utils/"
 sys.path.insert(0, utils_path)
 import text_cleaning_tools as tct
 
+# Sub-agent reasoning engine resources
+SUB_AGENT_RESOURCES = {
+    "rag_webtext": "projects/1062597788108/locations/us-central1/reasoningEngines/7423647424045907968",
+    # "rag_ipeds": "projects/1062597788108/locations/us-central1/reasoningEngines/59136133388304384",
+    "rag_ipeds": "projects/1062597788108/locations/us-central1/reasoningEngines/1676772824544444416",
+    "search": "projects/eternal-bongo-435614-b9/locations/us-central1/reasoningEngines/8448585775179628544",
+}
+
 
 class getSubAgentResults:
     '''
@@ -31,21 +41,20 @@ class getSubAgentResults:
         Initialize class
         '''
 
+        # Event that stops the search when set
+        self.cancel_event = None
+
+        # Overrides of the default remote call policy (see resilience.DEFAULT_CALL_POLICY)
+        self.call_policy = {}
+
         # Update any key word args
         self.__dict__.update(kwargs)
 
         # Get the agent resource name
-        if rag_agent == "rag_webtext":
-            self.resource_name = "projects/1062597788108/locations/us-central1/reasoningEngines/7423647424045907968"
-
-        elif rag_agent == "rag_ipeds":
-            # self.resource_name = "projects/1062597788108/locations/us-central1/reasoningEngines/59136133388304384"
-            self.resource_name = "projects/1062597788108/locations/us-central1/reasoningEngines/1676772824544444416"
-
-        elif rag_agent == "search":
-            self.resource_name = "projects/eternal-bongo-435614-b9/locations/us-central1/reasoningEngines/8448585775179628544"
+        self.resource_name = SUB_AGENT_RESOURCES.get(rag_agent)
 
         # Users's query
+        self.rag_agent = rag_agent
         self.query = query
         self.user_id = user_id
 
@@ -61,104 +70,53 @@ class getSubAgentResults:
 
     def call_agent(self):
         '''
-        Call the API to get search results for user's query
+        Call the API to get search results for user's query. The call has a deadline,
+        is retried with backoff, hedged when slow and guarded by a circuit breaker.
         '''
 
-        # Retrieve agent
-        self.agent_engine = agent_engines.get(self.resource_name)
+        # Retrieve agent (resolved once per process)
+        self.agent_engine = AGENT_ENGINES.get_engine(self.resource_name)
 
-        # Establish session
-        self.session = self.agent_engine.create_session(user_id=self.user_id)
+        # Put results into a dictionary for later access
+        self.events = call_with_resilience(name=self.rag_agent,
+                                           fn=self.stream_events,
+                                           **self.call_policy)
 
-        # Get agent response
-        self.result = self.agent_engine.stream_query(message=self.query,
-                                                     session_id=self.session["id"],
-                                                     user_id=self.user_id)
+    def stream_events(self) -> list:
+        '''
+        Stream the agent's response to the user's query and return its events
+        '''
 
-        # Put results into a dictionary for later access
-        self.events = []
-        for event in self.result:
-            self.events.append(event)
+        # Borrow a pre-created session for the duration of the query
+        with AGENT_ENGINES.get_pool(self.resource_name, self.user_id).lease() as session:
+
+            # Get agent response
+            result = self.agent_engine.stream_query(message=self.query,
+                                                    session_id=session["id"],
+                                                    user_id=self.user_id)
 
+            events = []
+            for event in result:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise CancelledError("{} search cancelled".format(self.rag_agent))
+                # Another copy of a hedged call won, or the deadline passed
+                if call_cancelled():
+                    raise CancelledError("{} search no longer needed".format(self.rag_agent))
+                events.append(event)
+
+        return events
 
     def parse_rag_response(self):
         '''
         Method to parse response into the elements of interest
         '''
 
-        self.organizations = []
-        self.uris = []
-        self.contents = []
-        self.transcripts = []
-        dorgs = []
-
-        # Get text results
-        for event in self.events:
-            if type(event) == dict:
-                for key in event.keys():
-                    if type(event[key]) == dict and key == "content":
-                        for txt_dict in event[key]["parts"]:
-                            self.contents.append(tct.clean_contents(intext=txt_dict["text"]))
+        parsed = parse_rag_events(self.events)
 
-            # Find domains and URIs from grounding_metadata
-            try:
-                for i, gc in enumerate(event["grounding_metadata"]["grounding_chunks"]):
-                    if type(gc) == dict:
-                        for key in gc.keys():
-                            if type(gc[key]) == dict and key == "retrieved_context":
-
-                                # Get organizations and transcripts
-                                pat_org = r"organizations:"
-                                pat_src = r"source_index:"
-                                pat_trs = r"transcript:"
-
-                                fl_txt = gc["retrieved_context"]["text"]
-
-                                # Find organization
-                                tores = re.search(pat_org, fl_txt)
-                                # Find source_index
-                                tsires = re.search(pat_src, fl_txt)
-                                # Find transcript
-                                ttsres = re.search(pat_trs, fl_txt)
-
-                                # Get organization
-                                if tores and tsires:
-                                    os = tores.start() + len(pat_org)
-                                    ss = tsires.start()
-                                    dorg = json.loads(json.loads(fl_txt[os:ss]))
-                                    dorgs.append(dorg)
-
-                                # Get transcript
-                                if ttsres:
-                                    transcript = fl_txt[ttsres.start() + len(pat_trs):]
-                                else:
-                                    transcript = ""
-
-                                # get a list of organizations without duplicates
-                                for org_name in set([org["name"] for org in dorgs]):
-                                    for dorg in dorgs:
-                                        if dorg["name"] == org_name and dorg not in self.organizations:
-                                            self.organizations.append(dorg)
-
-                                # Add transcripts
-                                self.transcripts.append(transcript)
-
-                                # Get the title
-                                if "title" in gc["retrieved_context"].keys() and len(
-                                        gc["retrieved_context"]["title"]) > 0:
-                                    title = gc["retrieved_context"]["title"]
-                                else:
-                                    title = dorg["name"]
-
-                                # Add a URI
-                                self.uris.append(dict(uri_index=i,
-                                                      uri=gc["retrieved_context"]["uri"],
-                                                      uri_text=title
-                                                      )
-                                                 )
-
-            except:
-                pass
+        self.organizations = parsed["organizations"]
+        self.uris = parsed["uris"]
+        self.contents = parsed["contents"]
+        self.transcripts = parsed["transcripts"]
 
     def parse_search_response(self):
         '''
@@ -192,3 +150,29 @@ class getSubAgentResults:
         self.domains = list(set(self.domains))
 
 
+class emptySubAgentResults:
+    '''
+    Stand-in for getSubAgentResults when a sub-agent call fails or times out, so
+    that the remaining search results can still be used
+
+    '''
+
+    def __init__(self,
+                 rag_agent: str,
+                 query: str,
+                 error: str = ""):
+        '''
+        Initialize class
+        '''
+
+        self.rag_agent = rag_agent
+        self.query = query
+        self.error = error
+
+        # Same result attributes as getSubAgentResults, all empty
+        self.events = []
+        self.organizations = []
+        self.domains = []
+        self.uris = []
+        self.contents = []
+        self.transcripts = []
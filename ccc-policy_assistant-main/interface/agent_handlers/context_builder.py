@@ -0,0 +1,191 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Token-budgeted assembly of search results into the synthesis agent's context
+
+import os
+import re
+import sys
+
+utils_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils")
+sys.path.insert(0, utils_path)
+from bm25 import BM25Index
+from token_counting import count_tokens, get_encoding
+
+
+def split_sentences(text: str) -> list:
+    '''
+    Split text into sentences at ., ! or ? followed by whitespace
+    '''
+
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+
+
+class contextBuilder:
+    '''
+    Class to rank search result passages by relevance to a query and pack them
+    into a token budget. Snippets (one per sub-agent answer) are split into passages
+    of paragraphs, or of sentences for long paragraphs, so the relevant parts of a long
+    answer are kept. The first passage that doesn't fit is truncated to fill the rest
+    of the budget.
+
+    Attributes
+
+        token_budget: Maximum number of tokens of passages in the context
+        max_passage_tokens: Paragraphs longer than this are split into sentence passages
+            of up to this many tokens
+        min_truncated_tokens: A passage is only truncated to fit if at least this many
+            tokens of budget remain
+        encoding_name: tiktoken encoding used to count tokens. If it cannot be loaded,
+            tokens are estimated as characters / chars_per_token
+        bm25_k1, bm25_b: BM25 relevance scoring parameters
+
+    After build(), self.report describes the packing and self.dropped lists the
+    passages left out as dict(snippet, passage, tokens, score).
+
+    '''
+
+    def __init__(self,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.token_budget = 6000
+        self.max_passage_tokens = 200
+        self.min_truncated_tokens = 20
+        self.encoding_name = "cl100k_base"
+        self.chars_per_token = 4
+        self.bm25_k1 = 1.2
+        self.bm25_b = 0.75
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.kept = []
+        self.dropped = []
+        self.report = {}
+
+    def count_tokens(self,
+                     text: str) -> int:
+        '''
+        Count the tokens in a text
+        '''
+
+        return count_tokens(text,
+                            encoding_name=self.encoding_name,
+                            chars_per_token=self.chars_per_token)
+
+    def truncate(self,
+                 text: str,
+                 max_tokens: int) -> str:
+        '''
+        Cut a text down to at most max_tokens tokens, at a word boundary
+        '''
+
+        encoding = get_encoding(self.encoding_name)
+        if encoding is None:
+            truncated = text[:max_tokens * self.chars_per_token]
+        else:
+            truncated = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+        if len(truncated) < len(text) and " " in truncated:
+            truncated = truncated.rsplit(" ", 1)[0]
+
+        return truncated
+
+    def split_passages(self,
+                       snippet: str) -> list:
+        '''
+        Split a snippet into paragraph passages, splitting paragraphs longer than
+        max_passage_tokens into groups of sentences
+        '''
+
+        passages = []
+        for paragraph in re.split(r"\n\s*\n|\n", snippet):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if self.count_tokens(paragraph) <= self.max_passage_tokens:
+                passages.append(paragraph)
+                continue
+
+            group, group_tokens = [], 0
+            for sentence in split_sentences(paragraph):
+                tokens = self.count_tokens(sentence)
+                if group and group_tokens + tokens > self.max_passage_tokens:
+                    passages.append(" ".join(group))
+                    group, group_tokens = [], 0
+                group.append(sentence)
+                group_tokens += tokens
+            if group:
+                passages.append(" ".join(group))
+
+        return passages
+
+    def score_snippets(self,
+                       query: str,
+                       snippets: list) -> list:
+        '''
+        Score each snippet's relevance to the query with BM25
+        '''
+
+        index = BM25Index(snippets,
+                          k1=self.bm25_k1,
+                          b=self.bm25_b)
+
+        return index.score(query)
+
+    def build(self,
+              query: str,
+              snippets: list) -> str:
+        '''
+        Pack the most relevant passages of the snippets into the token budget and
+        return them joined in their original order
+        '''
+
+        # Passages in original order as (snippet index, passage index, text)
+        passages = [(i, j, passage)
+                    for i, snippet in enumerate(snippets)
+                    for j, passage in enumerate(self.split_passages(snippet))]
+        texts = [passage for _, _, passage in passages]
+        scores = self.score_snippets(query=query,
+                                     snippets=texts)
+        tokens = [self.count_tokens(text) for text in texts]
+
+        # Take passages in order of relevance while they fit, truncating the first one
+        # that doesn't fit to fill the remaining budget
+        ranked = sorted(range(len(passages)), key=lambda k: scores[k], reverse=True)
+        used_tokens = 0
+        kept = {}
+        truncated = False
+        self.dropped = []
+        for k in ranked:
+            remaining = self.token_budget - used_tokens
+            if tokens[k] <= remaining:
+                kept[k] = texts[k]
+                used_tokens += tokens[k]
+            elif not truncated and remaining >= self.min_truncated_tokens:
+                kept[k] = self.truncate(texts[k], remaining)
+                used_tokens += self.count_tokens(kept[k])
+                truncated = True
+            else:
+                self.dropped.append(dict(snippet=passages[k][0],
+                                         passage=passages[k][1],
+                                         tokens=tokens[k],
+                                         score=scores[k]))
+
+        self.kept = [kept[k] for k in range(len(passages)) if k in kept]
+
+        self.report = dict(token_budget=self.token_budget,
+                           total_tokens=sum(tokens),
+                           used_tokens=used_tokens,
+                           snippets=len(snippets),
+                           passages=len(passages),
+                           kept_passages=len(self.kept),
+                           truncated_passage=truncated,
+                           dropped_passages=len(self.dropped),
+                           dropped_tokens=sum(d["tokens"] for d in self.dropped))
+
+        return " ".join(self.kept)
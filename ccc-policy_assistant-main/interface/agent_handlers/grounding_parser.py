@@ -0,0 +1,115 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Single-pass parser of the grounding metadata in RAG sub-agent responses
+
+import os, sys
+import re
+import json
+
+# Text cleaning
+utils_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utils")
+sys.path.insert(0, utils_path)
+import text_cleaning_tools as tct
+
+# Markers in the text of a retrieved context
+PAT_ORG = "organizations:"
+PAT_SRC = "source_index:"
+PAT_TRS = "transcript:"
+MARKER_SCANNER = re.compile("|".join(re.escape(pat) for pat in [PAT_ORG, PAT_SRC, PAT_TRS]))
+
+
+def find_markers(text: str) -> dict:
+    '''
+    Find the first position of each marker in one scan of the text, stopping once
+    all of them have been seen
+    '''
+
+    positions = {}
+    for match in MARKER_SCANNER.finditer(text):
+        positions.setdefault(match.group(), match.start())
+        if len(positions) == 3:
+            break
+
+    return positions
+
+
+def parse_rag_events(events: list) -> dict:
+    '''
+    Parse RAG sub-agent events into the elements of interest in one pass over
+    their content parts and grounding chunks.
+
+    Returns a dictionary of
+        organizations: Organizations in the retrieved contexts, without duplicate names
+        uris: dict(uri_index, uri, uri_text) of each retrieved context
+        contents: Cleaned response texts
+        transcripts: Transcripts of the retrieved contexts
+
+    As with the original parser, an unparsable grounding chunk ends the parsing of
+    the remaining chunks of its event.
+    '''
+
+    organizations = {}
+    uris = []
+    contents = []
+    transcripts = []
+
+    # Organizations already decoded, keyed by their raw JSON text
+    decoded_orgs = {}
+    last_org = None
+
+    for event in events:
+        if type(event) != dict:
+            continue
+
+        # Get text results
+        content = event.get("content")
+        if type(content) == dict:
+            for txt_dict in content["parts"]:
+                contents.append(tct.clean_contents(intext=txt_dict["text"]))
+
+        # Find organizations, transcripts and URIs from grounding_metadata
+        try:
+            for i, gc in enumerate(event["grounding_metadata"]["grounding_chunks"]):
+                if type(gc) != dict or type(gc.get("retrieved_context")) != dict:
+                    continue
+
+                retrieved_context = gc["retrieved_context"]
+                fl_txt = retrieved_context["text"]
+                markers = find_markers(fl_txt)
+
+                # Get organization; its text is a JSON encoded JSON string
+                if PAT_ORG in markers and PAT_SRC in markers:
+                    org_txt = fl_txt[markers[PAT_ORG] + len(PAT_ORG):markers[PAT_SRC]]
+                    org = decoded_orgs.get(org_txt)
+                    if org is None:
+                        org = json.loads(json.loads(org_txt))
+                        decoded_orgs[org_txt] = org
+
+                    organizations.setdefault(org["name"], org)
+                    last_org = org
+
+                # Get transcript
+                if PAT_TRS in markers:
+                    transcripts.append(fl_txt[markers[PAT_TRS] + len(PAT_TRS):])
+                else:
+                    transcripts.append("")
+
+                # Get the title, defaulting to the latest organization's name
+                if "title" in retrieved_context and len(retrieved_context["title"]) > 0:
+                    title = retrieved_context["title"]
+                else:
+                    title = last_org["name"]
+
+                # Add a URI
+                uris.append(dict(uri_index=i,
+                                 uri=retrieved_context["uri"],
+                                 uri_text=title))
+
+        except Exception:
+            pass
+
+    return dict(organizations=list(organizations.values()),
+                uris=uris,
+                contents=contents,
+                transcripts=transcripts)
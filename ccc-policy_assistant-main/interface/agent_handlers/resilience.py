@@ -0,0 +1,475 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Deadlines, retries with jittered backoff, hedged requests and circuit breakers
+# for remote agent calls
+
+import time
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+# Worker pool running the (possibly duplicated) remote calls, and the number of calls
+# submitted to it that haven't finished
+CALL_WORKERS = 16
+CALL_EXECUTOR = ThreadPoolExecutor(max_workers=CALL_WORKERS,
+                                   thread_name_prefix="ccc_call")
+_CALLS_IN_FLIGHT = 0
+_CALLS_IN_FLIGHT_LOCK = threading.Lock()
+
+# Default policy for remote agent calls
+#   deadline: Seconds for the whole call, including retries
+#   max_attempts: Attempts before giving up
+#   base_delay, max_delay: Backoff delay bounds in seconds
+#   hedge_after: Seconds before a duplicate request is sent; None to disable hedging
+DEFAULT_CALL_POLICY = dict(deadline=45.0,
+                           max_attempts=3,
+                           base_delay=0.5,
+                           max_delay=4.0,
+                           hedge_after=15.0)
+
+# The stop event of the hedged call running in each worker thread (see call_cancelled)
+_CALL_STATE = threading.local()
+
+# Errors of a remote service that is down or overloaded, which are retried and count
+# against its circuit breaker; any other error is the request's own and is raised at once
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+if google_exceptions is not None:
+    TRANSIENT_ERRORS += (google_exceptions.ServiceUnavailable,
+                         google_exceptions.DeadlineExceeded,
+                         google_exceptions.ResourceExhausted,
+                         google_exceptions.InternalServerError)
+if requests is not None:
+    TRANSIENT_ERRORS += (requests.exceptions.ConnectionError,
+                         requests.exceptions.Timeout)
+
+# HTTP status codes of transient errors raised by clients outside google.api_core
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    '''
+    A remote call did not complete before its deadline
+    '''
+
+
+class QueueTimeout(DeadlineExceeded):
+    '''
+    A remote call waited in the local worker pool until its deadline without being
+    sent, so the remote service is not to blame
+    '''
+
+
+class CircuitOpenError(RuntimeError):
+    '''
+    A remote call was rejected because its circuit breaker is open
+    '''
+
+
+class resilienceCounters:
+    '''
+    Counts of remote call outcomes by call name. Counts are kept in memory
+    (see snapshot()) and, when prometheus_client is installed, exported as the
+    ccc_agent_calls_total counter.
+
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+
+        if prometheus_client is not None:
+            self.prometheus_counter = prometheus_client.Counter("ccc_agent_calls_total",
+                                                                "Remote agent call outcomes",
+                                                                ["name", "outcome"])
+        else:
+            self.prometheus_counter = None
+
+    def inc(self,
+            name: str,
+            outcome: str):
+        '''
+        Count an outcome (e.g. success, failure, retry, hedge) of a named call
+        '''
+
+        with self.lock:
+            self.counts[(name, outcome)] += 1
+
+        if self.prometheus_counter is not None:
+            self.prometheus_counter.labels(name=name, outcome=outcome).inc()
+
+    def snapshot(self) -> dict:
+        '''
+        Get the counts as a dictionary of {name: {outcome: count}}
+        '''
+
+        snapshot = defaultdict(dict)
+        with self.lock:
+            for (name, outcome), count in self.counts.items():
+                snapshot[name][outcome] = count
+
+        return dict(snapshot)
+
+
+COUNTERS = resilienceCounters()
+
+_METRICS_LOCK = threading.Lock()
+_METRICS_PORTS = set()
+
+
+def start_metrics_server(port: int) -> bool:
+    '''
+    Serve the counters for Prometheus scraping on a port. Safe to call more than
+    once; returns False if prometheus_client is not installed.
+    '''
+
+    if prometheus_client is None:
+        return False
+
+    with _METRICS_LOCK:
+        if port not in _METRICS_PORTS:
+            prometheus_client.start_http_server(port)
+            _METRICS_PORTS.add(port)
+
+    return True
+
+
+class circuitBreaker:
+    '''
+    Circuit breaker for a named remote call. After failure_threshold consecutive
+    failures it opens and rejects calls for reset_timeout seconds, then lets a
+    single trial call through (half open) which closes it on success.
+
+    '''
+
+    def __init__(self,
+                 name: str,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.failure_threshold = 5
+        self.reset_timeout = 30.0
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.name = name
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        '''
+        Check if a call may go ahead
+        '''
+
+        with self.lock:
+            if self.state == "closed":
+                return True
+
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+
+            return False
+
+    def record_success(self):
+        '''
+        Record a successful call
+        '''
+
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def release_trial(self):
+        '''
+        Release the half-open trial of a call that ended without an outcome (e.g. it
+        was cancelled), so the next call can be the trial instead
+        '''
+
+        with self.lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_failure(self):
+        '''
+        Record a failed call, opening the breaker if needed
+        '''
+
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    COUNTERS.inc(self.name, "breaker_open")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(name: str) -> circuitBreaker:
+    '''
+    Get the process-wide circuit breaker for a call name
+    '''
+
+    with _BREAKERS_LOCK:
+        if name not in _BREAKERS:
+            _BREAKERS[name] = circuitBreaker(name=name)
+
+        return _BREAKERS[name]
+
+
+def backoff_delay(attempt: int,
+                  base_delay: float,
+                  max_delay: float) -> float:
+    '''
+    Exponential backoff delay with full jitter for a retry attempt (1 for the first retry)
+    '''
+
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def is_transient(error: Exception) -> bool:
+    '''
+    Check if an error is a transient failure of the remote service (see TRANSIENT_ERRORS)
+    '''
+
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+
+    code = getattr(error, "code", None)
+
+    return isinstance(code, int) and code in TRANSIENT_STATUS_CODES
+
+
+def call_cancelled() -> bool:
+    '''
+    Check, from inside a function run by hedged_call, whether its result is no longer
+    needed (another copy won or the deadline passed). Long-running calls should check
+    this and stop early.
+    '''
+
+    stop = getattr(_CALL_STATE, "stop", None)
+
+    return stop is not None and stop.is_set()
+
+
+def _run_with_stop(fn,
+                   stop: threading.Event,
+                   started: threading.Event):
+    '''
+    Run fn in a worker thread with the stop event call_cancelled() checks
+    '''
+
+    started.set()
+    _CALL_STATE.stop = stop
+    try:
+        return fn()
+    finally:
+        _CALL_STATE.stop = None
+
+
+def _call_finished(future):
+    global _CALLS_IN_FLIGHT
+    with _CALLS_IN_FLIGHT_LOCK:
+        _CALLS_IN_FLIGHT -= 1
+
+
+def _submit_call(fn,
+                 stop: threading.Event,
+                 started: threading.Event):
+    '''
+    Submit a call to the worker pool, counting it until it finishes or is cancelled
+    '''
+
+    global _CALLS_IN_FLIGHT
+    with _CALLS_IN_FLIGHT_LOCK:
+        _CALLS_IN_FLIGHT += 1
+    future = CALL_EXECUTOR.submit(_run_with_stop, fn, stop, started)
+    future.add_done_callback(_call_finished)
+
+    return future
+
+
+def has_idle_worker() -> bool:
+    '''
+    Check if the worker pool can start another call without queueing it
+    '''
+
+    with _CALLS_IN_FLIGHT_LOCK:
+        return _CALLS_IN_FLIGHT < CALL_WORKERS
+
+
+def hedged_call(name: str,
+                fn,
+                timeout: float,
+                hedge_after: float = None):
+    '''
+    Call fn in the worker pool and wait up to timeout seconds. If it has not
+    finished after hedge_after seconds a duplicate call is started and the first
+    successful result is returned. The duplicate is skipped when the pool has no idle
+    worker, since it would only queue behind other calls. Once a call wins or the
+    deadline passes, the others are cancelled: queued ones are removed from the pool
+    and running ones see call_cancelled() return True.
+
+    Raises QueueTimeout if the deadline passed before any copy of the call left the
+    pool's queue, and DeadlineExceeded if it passed while one was running.
+    '''
+
+    if timeout <= 0:
+        raise DeadlineExceeded("{} has no time left before its deadline".format(name))
+
+    start = time.monotonic()
+    end = start + timeout
+    hedge_at = None if hedge_after is None else start + hedge_after
+
+    stop = threading.Event()
+    started = threading.Event()
+    first = _submit_call(fn, stop, started)
+    pending = {first}
+    error = None
+
+    try:
+        while pending and time.monotonic() < end:
+            wake = end if hedge_at is None else min(end, hedge_at)
+            done, pending = wait(pending,
+                                 timeout=max(0, wake - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        COUNTERS.inc(name, "hedge_win")
+                    return future.result()
+                error = future.exception()
+
+            # Send a duplicate request for a slow call
+            if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                if has_idle_worker():
+                    COUNTERS.inc(name, "hedge")
+                    pending.add(_submit_call(fn, stop, started))
+                else:
+                    COUNTERS.inc(name, "hedge_skipped")
+                hedge_at = None
+
+        if error is not None and not pending:
+            raise error
+
+        if not started.is_set():
+            raise QueueTimeout("{} waited {:.1f}s for a free worker".format(name, timeout))
+
+        raise DeadlineExceeded("{} did not complete within {:.1f}s".format(name, timeout))
+
+    finally:
+        # Stop the losing and timed out calls
+        stop.set()
+        for future in pending:
+            future.cancel()
+
+
+def call_with_resilience(name: str,
+                         fn,
+                         **policy):
+    '''
+    Call fn() with the named circuit breaker, a deadline, hedging and retries with
+    jittered exponential backoff. Key word args override DEFAULT_CALL_POLICY.
+
+    Only transient errors (see is_transient) are retried and recorded as breaker
+    failures; other errors, such as an invalid request, are raised at once without
+    affecting the breaker.
+
+    Raises CircuitOpenError without calling fn when the breaker is open and
+    DeadlineExceeded when the deadline passes. Time spent queued for a worker counts
+    towards the deadline but not as a breaker failure (see QueueTimeout).
+    '''
+
+    policy = {**DEFAULT_CALL_POLICY, **policy}
+    breaker = get_breaker(name)
+
+    if not breaker.allow():
+        COUNTERS.inc(name, "breaker_reject")
+        raise CircuitOpenError("{} circuit breaker is open".format(name))
+
+    end = time.monotonic() + policy["deadline"]
+    attempt = 1
+    # Whether the latest attempt's outcome was recorded on the breaker
+    recorded = False
+    try:
+        while True:
+            recorded = False
+            try:
+                result = hedged_call(name=name,
+                                     fn=fn,
+                                     timeout=end - time.monotonic(),
+                                     hedge_after=policy["hedge_after"])
+                breaker.record_success()
+                recorded = True
+                COUNTERS.inc(name, "success")
+                return result
+
+            except CancelledError:
+                COUNTERS.inc(name, "cancelled")
+                raise
+
+            except QueueTimeout:
+                COUNTERS.inc(name, "queue_timeout")
+                raise
+
+            except DeadlineExceeded:
+                breaker.record_failure()
+                recorded = True
+                COUNTERS.inc(name, "deadline_exceeded")
+                raise
+
+            except Exception as e:
+                if not is_transient(e):
+                    COUNTERS.inc(name, "error")
+                    raise
+
+                breaker.record_failure()
+                recorded = True
+                COUNTERS.inc(name, "failure")
+
+                delay = backoff_delay(attempt=attempt,
+                                      base_delay=policy["base_delay"],
+                                      max_delay=policy["max_delay"])
+                if (attempt >= policy["max_attempts"] or not breaker.allow()
+                        or time.monotonic() + delay >= end):
+                    raise
+
+                COUNTERS.inc(name, "retry")
+                time.sleep(delay)
+                attempt += 1
+
+    finally:
+        # A cancelled half-open trial must not leave the breaker stuck half open
+        if not recorded:
+            breaker.release_trial()
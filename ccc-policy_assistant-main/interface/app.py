@@ -24,19 +24,24 @@ import random_questions as rq
 chatbot_path = "agent_handlers/"
 sys.path.insert(0, chatbot_path)
 from ccc_chatbot_agent import cccChatBot
+from resilience import CircuitOpenError, start_metrics_server
 
 # Import BigQuery modules
 bq_path = "BQ/"
 sys.path.insert(0, bq_path)
 try:
-    from BQ.db.table_router_agent import TableRouter
+    from BQ.db.table_router_agent import get_table_router
     from BQ.db.table_factory import table_factory
-    from BQ.db.agent import dynamic_get_data
+    from BQ.db.agent import get_table_data, run_table_sql
     BQ_AVAILABLE = True
 except ImportError as e:
     st.error(f"Failed to import BigQuery modules: {e}")
     BQ_AVAILABLE = False
 
+# Load table schemas in the background so the chat can be used meanwhile (once per process)
+if BQ_AVAILABLE:
+    table_factory.start_background_warm_up()
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -63,6 +68,10 @@ vertexai.init(project=os.environ["GOOGLE_CLOUD_PROJECT"],
               location=os.environ["GOOGLE_CLOUD_LOCATION"],
               staging_bucket=os.environ["STAGING_BUCKET"])
 
+# Serve remote call counters for scraping
+if "CCC_METRICS_PORT" in os.environ:
+    start_metrics_server(int(os.environ["CCC_METRICS_PORT"]))
+
 ########## Set up Streamlit
 st.set_page_config(page_title="CCC-PA")
 font_url = ("https://fonts.googleapis.com/css2?family=Lato:ital,wght"
@@ -119,15 +128,15 @@ if "questions" not in st.session_state:
 if "bot" not in st.session_state:
     # Create a chatbot for this user
     user_id = "u_123"
+    # Remote calls are retried inside the chatbot, so a failure here is final for this page load
     try:
         st.session_state["bot"] = cccChatBot(user_id=user_id)
-    except:
-        time.sleep (5)
-        msg = ("TRY BOT: We're having trouble starting the CCC Policy Assistant. We're going to try again, but if that "
-               "doesn't work, please refresh this web page and try again. ")
+    except Exception:
+        msg = ("We're having trouble starting the CCC Policy Assistant. "
+               "Please refresh this web page and try again. ")
         st.markdown(msg)
         st.markdown(traceback.format_exc())
-        st.session_state["bot"] = cccChatBot(user_id=user_id)
+        st.stop()
 
 
 if "messages" not in st.session_state:
@@ -140,35 +149,106 @@ def format_agent_output(report_dict: dict):
     """
     # Display results
     for key in report_dict.keys():
-        if key == "report_title":
-            st.markdown("## {}\n\n".format(report_dict[key]))
+        format_agent_section(key=key,
+                             report_dict=report_dict)
 
-        elif key == "report_executive_summary":
-            st.markdown("### Summary: \n{}\n".format(report_dict[key]))
 
-        elif key == "report_body":
-            st.markdown("### Report: \n{}\n".format(report_dict[key]))
+def format_agent_section(key: str,
+                         report_dict: dict):
+    """
+    Function to format one section of the agent's output into Markdown for interface display
+    """
+    if key == "report_title":
+        st.markdown("## {}\n\n".format(report_dict[key]))
 
-        elif key == "report_references":
-            st.markdown("### References: \n{}\n".format(report_dict[key]))
+    elif key == "report_executive_summary":
+        st.markdown("### Summary: \n{}\n".format(report_dict[key]))
 
-        elif key == "reference_uris":
-            # Convert URLs to markdown list
-            ref_uris_md = ["- {}\n".format(u) for u in report_dict["reference_uris"]]
-            st.markdown("### Reference URLs \n")
-            st.markdown(" ".join(ref_uris_md))
+    elif key == "report_body":
+        st.markdown("### Report: \n{}\n".format(report_dict[key]))
 
-        elif key == "relevant_data_yes_or_no" and report_dict["relevant_data_yes_or_no"] == True:
-            msg = ("I did a search of the Integrated Postsecondary Education Data System (IPEDS) "
-                   "datasets from the U.S. Department of Education and found data relevant to "
-                   "your query. \n\nHere's are my findings: {}").format(report_dict["description_of_relevant_data"])
-            st.markdown(msg)
+    elif key == "report_references":
+        st.markdown("### References: \n{}\n".format(report_dict[key]))
 
-        elif key == "relevant_data_yes_or_no" and report_dict["relevant_data_yes_or_no"] == False:
-            msg = ("I did a search of the Integrated Postsecondary Education Data System (IPEDS) "
-                   "datasets from the U.S. Department of Education but did not find data relevant to "
-                   "your query. ")
-            st.markdown(msg)
+    elif key == "reference_uris":
+        # Convert URLs to markdown list
+        ref_uris_md = ["- {}\n".format(u) for u in report_dict["reference_uris"]]
+        st.markdown("### Reference URLs \n")
+        st.markdown(" ".join(ref_uris_md))
+
+    elif key == "relevant_data_yes_or_no" and report_dict["relevant_data_yes_or_no"] == True:
+        msg = ("I did a search of the Integrated Postsecondary Education Data System (IPEDS) "
+               "datasets from the U.S. Department of Education and found data relevant to "
+               "your query. \n\nHere's are my findings: {}").format(report_dict["description_of_relevant_data"])
+        st.markdown(msg)
+
+    elif key == "relevant_data_yes_or_no" and report_dict["relevant_data_yes_or_no"] == False:
+        msg = ("I did a search of the Integrated Postsecondary Education Data System (IPEDS) "
+               "datasets from the U.S. Department of Education but did not find data relevant to "
+               "your query. ")
+        st.markdown(msg)
+
+
+def format_query_estimate(estimate: dict) -> str:
+    """
+    Function to describe a query's dry-run estimate of bytes scanned, cost and time
+    """
+    return ("about {:.2f} GB scanned, ~${:.2f}, ~{:.0f}s"
+            .format(estimate["bytes_processed"] / 1e9,
+                    estimate["estimated_cost_usd"],
+                    estimate["estimated_seconds"]))
+
+
+def show_query_result(result: dict,
+                      user_question: str,
+                      table_name: str):
+    """
+    Function to display a Database Operations query result, or hold a heavy query for confirmation
+    """
+    if result.get("status") == "needs_confirmation":
+        st.session_state.pending_query = {"question": user_question,
+                                          "table": table_name,
+                                          "sql": result["sql"],
+                                          "sql_cached": result.get("sql_cached", False),
+                                          "estimate": result["estimate"]}
+        return
+
+    if result.get("status") == "error":
+        st.error(f"Error: {result.get('error')}")
+        if result.get("estimate"):
+            st.caption(f"Estimate: {format_query_estimate(result['estimate'])}")
+        return
+
+    st.success("Query executed successfully!")
+    if result.get("cached"):
+        st.caption("Served from the local result cache; no bytes were scanned.")
+    elif result.get("estimate"):
+        st.caption(f"Estimate: {format_query_estimate(result['estimate'])}")
+
+    # Display results
+    if "table" in result and result["row_count"]:
+        st.subheader("Query Results")
+        st.dataframe(result["table"])
+
+        # Show result count
+        st.info(f"Found {result['row_count']} records")
+        if result.get("truncated"):
+            st.warning(f"Results were capped at {result['row_count']} rows and may be incomplete. "
+                       f"Narrow the question or aggregate to see everything.")
+
+        # Store query in session state for history
+        if "query_history" not in st.session_state:
+            st.session_state.query_history = []
+
+        query_record = {
+            "question": user_question,
+            "table": table_name,
+            "results_count": result["row_count"],
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        st.session_state.query_history.append(query_record)
+    else:
+        st.warning("No data returned from query")
 
 
 with st.sidebar:
@@ -217,12 +297,14 @@ with st.sidebar:
         # Database Status
         if BQ_AVAILABLE:
             st.success("✅ BigQuery module loaded successfully")
+            if not table_factory.is_warm:
+                st.info("Table schemas are still loading; queries may take longer until they're ready.")
 
             
             # Initialize BQ components
             if "table_router" not in st.session_state:
                 try:
-                    st.session_state.table_router = TableRouter()
+                    st.session_state.table_router = get_table_router()
                 except Exception as e:
                     st.error(f"Failed to initialize TableRouter: {e}")
                     st.session_state.table_router = None
@@ -273,35 +355,10 @@ with st.sidebar:
                                     # Show which table is being used
                                     st.success(f"🔍 Using table: **{selected_table}**")
                                     
-                                    # Use the dynamic_get_data function
-                                    result = dynamic_get_data(selected_table, user_question)
-                                    
-                                    if result.get("status") == "error":
-                                        st.error(f"Error: {result.get('error')}")
-                                    else:
-                                        st.success("Query executed successfully!")
-                                        
-                                        # Display results
-                                        if "data" in result and result["data"]:
-                                            st.subheader("Query Results")
-                                            st.dataframe(result["data"])
-                                            
-                                            # Show result count
-                                            st.info(f"Found {len(result['data'])} records")
-                                            
-                                            # Store query in session state for history
-                                            if "query_history" not in st.session_state:
-                                                st.session_state.query_history = []
-                                            
-                                            query_record = {
-                                                "question": user_question,
-                                                "table": selected_table,
-                                                "results_count": len(result["data"]),
-                                                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-                                            }
-                                            st.session_state.query_history.append(query_record)
-                                        else:
-                                            st.warning("No data returned from query")
+                                    # Use the get_table_data function; its Arrow result is displayed without conversion
+                                    st.session_state.pending_query = None
+                                    result = get_table_data(selected_table, user_question)
+                                    show_query_result(result, user_question, selected_table)
                                 except (KeyError, TypeError, IndexError) as e:
                                     st.error(f"Error processing table selection: {str(e)}")
                                     st.error("Please try rephrasing your question.")
@@ -311,6 +368,19 @@ with st.sidebar:
                         except Exception as e:
                             st.error(f"An error occurred: {str(e)}")
                             st.exception(e)
+                
+                # Queries over the byte warning budget wait for the user to confirm them
+                pending_query = st.session_state.get("pending_query")
+                if pending_query:
+                    st.warning(f"This query is large ({format_query_estimate(pending_query['estimate'])}). "
+                               "Run it anyway, or narrow your question.")
+                    if st.button("Run anyway"):
+                        st.session_state.pending_query = None
+                        with st.spinner("Running query..."):
+                            result = run_table_sql(pending_query["table"], pending_query["question"],
+                                                   pending_query["sql"], pending_query["sql_cached"],
+                                                   allow_heavy=True)
+                        show_query_result(result, pending_query["question"], pending_query["table"])
             else:
                 st.warning("Database components not properly initialized. Please check your environment variables and credentials.")
             
@@ -392,26 +462,29 @@ if user_input:
     # Store user's query in the chat history
     st.session_state.messages.append({"role": "user", "content": user_input})
 
-    # Query the agent
+    # Query the agent and display each report section as soon as it is generated
     with st.spinner("I'm generating a report in response to your query. "):
         user_id = "u_123"
         try:
-            st.session_state["bot"].stream_and_parse_query(query=user_input)
-        except:
-            time.sleep(5)
-            msg = ("We're having trouble submitting queries to the CCC Policy Assistant. We're going to try again, but if that "
-                   "doesn't work, please refresh this web page and try again. ")
+            for key, _ in st.session_state["bot"].stream_report(query=user_input):
+                format_agent_section(key=key,
+                                     report_dict=st.session_state["bot"].report_dict)
+        except CircuitOpenError:
+            msg = ("The CCC Policy Assistant's search services are temporarily unavailable. "
+                   "Please try again in a minute. ")
+            st.markdown(msg)
+            st.stop()
+        except Exception:
+            msg = ("We're having trouble submitting queries to the CCC Policy Assistant. "
+                   "Please try again, or refresh this web page. ")
             st.markdown(msg)
             st.markdown(traceback.format_exc())
-            st.session_state["bot"].stream_and_parse_query(query=user_input)
+            st.stop()
 
     # Add agent results to session messages
     st.session_state.messages.append({"role": "assistant",
                                       "content": st.session_state["bot"].report_dict})
 
-    # Display report results
-    format_agent_output(report_dict=st.session_state["bot"].report_dict)
-
     # Add to BigQuery
     # Create response logger object parameters
     rlog_params = {"query": user_input,
@@ -0,0 +1,68 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Offline load test of the chat pipeline using replayed agent engine responses
+#
+# Record fixtures by running the app with CCC_AGENT_MODE=record (and optionally
+# CCC_AGENT_FIXTURES=<dir>), then from the interface directory run:
+#   python benchmarks/bench_chat_pipeline.py --queries 50 --concurrency 8 --latency "lognormal:-1,0.5"
+
+import os, sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of cccChatBot")
+    parser.add_argument("--fixtures", default="fixtures/agent_engines")
+    parser.add_argument("--latency", default="recorded",
+                        help="Replay latency distribution, see agent_replay.sample_latency")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--query", default="What are the responsibilities of community college board members?")
+    args = parser.parse_args()
+
+    # The agent engine registry reads its mode when first imported
+    os.environ["CCC_AGENT_MODE"] = "replay"
+    os.environ["CCC_AGENT_FIXTURES"] = args.fixtures
+    os.environ["CCC_AGENT_REPLAY_LATENCY"] = args.latency
+
+    interface_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    sys.path.insert(0, os.path.join(interface_path, "utils"))
+    sys.path.insert(0, os.path.join(interface_path, "agent_handlers"))
+    from ccc_chatbot_agent import cccChatBot
+    from resilience import COUNTERS
+
+    def run_query(i: int) -> dict:
+        bot = cccChatBot(user_id="load_{}".format(i), use_answer_cache=False)
+
+        start = time.perf_counter()
+        first_section = None
+        for _ in bot.stream_report(query=args.query):
+            if first_section is None:
+                first_section = time.perf_counter() - start
+
+        return dict(total=time.perf_counter() - start,
+                    first_section=first_section or 0.0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        timings = list(executor.map(run_query, range(args.queries)))
+    elapsed = time.perf_counter() - start
+
+    for key in ["first_section", "total"]:
+        values = sorted(t[key] for t in timings)
+        print("{:>14}: p50 {:7.3f}s  p95 {:7.3f}s  max {:7.3f}s".format(
+            key,
+            statistics.median(values),
+            values[min(len(values) - 1, int(0.95 * len(values)))],
+            values[-1]))
+
+    print("{} queries in {:.2f}s ({:.2f} queries/s)".format(args.queries, elapsed, args.queries / elapsed))
+    print("Call outcomes: {}".format(COUNTERS.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Micro-benchmark of the RAG grounding metadata parser against the original
+# getSubAgentResults.parse_rag_response implementation
+#
+# Usage (from the interface directory):
+#   python benchmarks/bench_rag_parser.py --chunks 100 250 500
+#   python benchmarks/bench_rag_parser.py --events fixtures/agent_engines/7423647424045907968.jsonl
+
+import os, sys
+import re
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent_handlers"))
+from grounding_parser import parse_rag_events, tct
+
+
+def legacy_parse_rag_events(events: list) -> dict:
+    '''
+    The original parse_rag_response, kept here as the reference implementation
+    '''
+
+    organizations = []
+    uris = []
+    contents = []
+    transcripts = []
+    dorgs = []
+
+    for event in events:
+        if type(event) == dict:
+            for key in event.keys():
+                if type(event[key]) == dict and key == "content":
+                    for txt_dict in event[key]["parts"]:
+                        contents.append(tct.clean_contents(intext=txt_dict["text"]))
+
+        try:
+            for i, gc in enumerate(event["grounding_metadata"]["grounding_chunks"]):
+                if type(gc) == dict:
+                    for key in gc.keys():
+                        if type(gc[key]) == dict and key == "retrieved_context":
+                            pat_org = r"organizations:"
+                            pat_src = r"source_index:"
+                            pat_trs = r"transcript:"
+
+                            fl_txt = gc["retrieved_context"]["text"]
+                            tores = re.search(pat_org, fl_txt)
+                            tsires = re.search(pat_src, fl_txt)
+                            ttsres = re.search(pat_trs, fl_txt)
+
+                            if tores and tsires:
+                                os_ = tores.start() + len(pat_org)
+                                ss = tsires.start()
+                                dorg = json.loads(json.loads(fl_txt[os_:ss]))
+                                dorgs.append(dorg)
+
+                            if ttsres:
+                                transcript = fl_txt[ttsres.start() + len(pat_trs):]
+                            else:
+                                transcript = ""
+
+                            for org_name in set([org["name"] for org in dorgs]):
+                                for dorg in dorgs:
+                                    if dorg["name"] == org_name and dorg not in organizations:
+                                        organizations.append(dorg)
+
+                            transcripts.append(transcript)
+
+                            if "title" in gc["retrieved_context"].keys() and len(
+                                    gc["retrieved_context"]["title"]) > 0:
+                                title = gc["retrieved_context"]["title"]
+                            else:
+                                title = dorg["name"]
+
+                            uris.append(dict(uri_index=i,
+                                             uri=gc["retrieved_context"]["uri"],
+                                             uri_text=title))
+        except:
+            pass
+
+    return dict(organizations=organizations,
+                uris=uris,
+                contents=contents,
+                transcripts=transcripts)
+
+
+def synthetic_events(n_chunks: int,
+                     n_orgs: int,
+                     transcript_words: int,
+                     seed: int = 0) -> list:
+    '''
+    Build one rag_webtext-like event with n_chunks grounding chunks
+    '''
+
+    rng = random.Random(seed)
+    words = ["college", "district", "board", "trustee", "enrollment", "budget",
+             "policy", "student", "faculty", "California", "transfer", "equity"]
+
+    chunks = []
+    for i in range(n_chunks):
+        org_index = rng.randrange(n_orgs)
+        org = dict(name="Organization {}".format(org_index),
+                   url="https://example{}.edu".format(org_index))
+        transcript = " ".join(rng.choice(words) for _ in range(transcript_words))
+        text = "organizations:{} source_index: {} transcript:{}".format(json.dumps(json.dumps(org)),
+                                                                        i,
+                                                                        transcript)
+        chunks.append(dict(retrieved_context=dict(text=text,
+                                                  title="" if i % 3 else "Page {}".format(i),
+                                                  uri="https://example.edu/page/{}".format(i))))
+
+    return [dict(content=dict(parts=[dict(text="Answer text [1] with citations [2].")]),
+                 grounding_metadata=dict(grounding_chunks=chunks))]
+
+
+def load_events(path: str) -> list:
+    '''
+    Load recorded events from a JSON list, a JSON lines file of events or an
+    agent_replay fixture file (the events of all its stream_query records)
+    '''
+
+    with open(path, "r") as f:
+        text = f.read()
+
+    try:
+        events = json.loads(text)
+    except json.JSONDecodeError:
+        events = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    if type(events) != list:
+        events = [events]
+
+    if events and all(type(e) == dict and e.get("type") in ["stream_query", "create_session"] for e in events):
+        events = [event for record in events if record["type"] == "stream_query" for event in record["events"]]
+
+    return events
+
+
+def best_time(fn, events: list, repeat: int) -> float:
+    '''
+    Best wall time of repeat runs
+    '''
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(events)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", help="Recorded events (JSON list or JSON lines)")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--transcript-words", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.events:
+        payloads = [(args.events, load_events(args.events))]
+    else:
+        payloads = [("{} chunks".format(n), synthetic_events(n, args.orgs, args.transcript_words))
+                    for n in args.chunks]
+
+    for name, events in payloads:
+        legacy = legacy_parse_rag_events(events)
+        current = parse_rag_events(events)
+
+        # Organization order in the original parser depended on set iteration order
+        same = (all(legacy[key] == current[key] for key in ["uris", "contents", "transcripts"])
+                and sorted(map(json.dumps, legacy["organizations"])) ==
+                sorted(map(json.dumps, current["organizations"])))
+
+        t_legacy = best_time(legacy_parse_rag_events, events, args.repeat)
+        t_current = best_time(parse_rag_events, events, args.repeat)
+        print("{:>20}: legacy {:9.2f} ms   single-pass {:8.2f} ms   speedup {:6.1f}x   identical: {}".format(
+            name, t_legacy * 1000, t_current * 1000, t_legacy / max(t_current, 1e-9), same))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Accuracy versus latency of the table routing backends over a labelled question set
+#
+# The question set is a JSON lines file with one labelled question per line:
+#   {"question": "What was the fall enrollment at Foothill College?", "tables": ["EF2022A"]}
+# where tables lists the tables that answer the question. benchmarks/fixtures/
+# table_router_questions.jsonl is a small labelled set over the IPEDS 2022 tables, used by
+# default. From the interface directory run:
+#   python benchmarks/bench_table_router.py --schemas schemas/
+#
+# Each backend reports top-1 and top-5 accuracy (hit@1, hit@5; also hit@k for another --top-k)
+# and mean reciprocal rank next to its cold and warm routing latencies.
+#
+# --schemas is a directory of schema JSON files; without it schemas are read from GCS through
+# table_factory. The lexical backend runs fully offline. The vector and hybrid backends embed
+# the schemas once (saved to --index-path) and each question once, with Vertex AI embeddings;
+# the vertex_rag backend queries the RAG corpus.
+
+import os, sys
+import json
+import hashlib
+import time
+import argparse
+import statistics
+
+# Labelled questions used when --questions isn't given
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "fixtures", "table_router_questions.jsonl")
+
+
+class localSchemaSource:
+    '''
+    Schemas read from a local directory of JSON files, with the interface of
+    table_factory that the routing indexes use
+    '''
+
+    def __init__(self,
+                 schemas_dir: str):
+        '''
+        Initialize class
+        '''
+
+        self.schemas = {}
+        for file_name in sorted(os.listdir(schemas_dir)):
+            if file_name.endswith(".json"):
+                with open(os.path.join(schemas_dir, file_name), "r") as f:
+                    self.schemas[os.path.splitext(file_name)[0]] = json.load(f)
+
+    def get_all_table_names(self) -> list:
+        return list(self.schemas)
+
+    def get_schema(self, table_name: str) -> dict:
+        return self.schemas[table_name]
+
+    def get_schema_version(self, table_name: str) -> str:
+        return hashlib.sha1(json.dumps(self.schemas[table_name], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_questions(path: str) -> list:
+    '''
+    Read the labelled questions from a JSON lines file
+    '''
+
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: list,
+               q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def evaluate(route,
+             questions: list,
+             top_k: int,
+             repeat: int) -> dict:
+    '''
+    Route every question repeat times. Accuracy (hit@1, hit@5, hit@top_k and MRR over the
+    top_k tables) is from the first pass; latencies are reported for the first (cold) pass
+    and for the later (warm) passes. Questions are routed to at least 5 tables so hit@5 is
+    always measured.
+    '''
+
+    hits_1 = hits_5 = hits_k = reciprocal_ranks = 0.0
+    cold, warm = [], []
+
+    for n in range(repeat):
+        for item in questions:
+            start = time.perf_counter()
+            ranked = route(item["question"], max(top_k, 5))
+            elapsed = (time.perf_counter() - start) * 1000
+            (cold if n == 0 else warm).append(elapsed)
+
+            if n > 0:
+                continue
+            labels = {label.lower() for label in item["tables"]}
+            ranks = [i + 1 for i, name in enumerate(ranked) if name.lower() in labels]
+            first = ranks[0] if ranks else None
+            hits_1 += 1 if first == 1 else 0
+            hits_5 += 1 if first is not None and first <= 5 else 0
+            hits_k += 1 if first is not None and first <= top_k else 0
+            reciprocal_ranks += 1.0 / first if first is not None and first <= top_k else 0.0
+
+    count = len(questions)
+    result = dict(hit_at_1=hits_1 / count,
+                  hit_at_5=hits_5 / count,
+                  hit_at_k=hits_k / count,
+                  mrr=reciprocal_ranks / count,
+                  cold_p50_ms=statistics.median(cold),
+                  cold_p95_ms=percentile(cold, 0.95))
+    if warm:
+        result.update(warm_p50_ms=statistics.median(warm),
+                      warm_p95_ms=percentile(warm, 0.95))
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark table routing backends")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="JSON lines file of labelled questions")
+    parser.add_argument("--schemas", default=None, help="Directory of schema JSON files")
+    parser.add_argument("--backends", default="lexical,vector,hybrid-rrf,hybrid-weighted",
+                        help="Comma separated: lexical, vector, hybrid-rrf, hybrid-weighted, vertex_rag")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--alpha", type=float, default=0.5, help="Vector weight of hybrid-weighted")
+    parser.add_argument("--repeat", type=int, default=2, help="Passes over the questions")
+    parser.add_argument("--index-path", default="benchmarks/table_index.npz",
+                        help="File of the schema embeddings, reused between runs")
+    args = parser.parse_args()
+
+    interface_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    sys.path.insert(0, interface_path)
+    from BQ.db.vector_index import TableVectorIndex
+    from BQ.db.hybrid_index import HybridTableIndex, TableLexicalIndex
+
+    if args.schemas:
+        schemas = localSchemaSource(args.schemas)
+    else:
+        from BQ.db.table_factory import table_factory
+        schemas = table_factory
+
+    questions = load_questions(args.questions)
+    print("{} questions over {} tables, top_k={}".format(len(questions),
+                                                         len(schemas.get_all_table_names()),
+                                                         args.top_k))
+
+    lexical = TableLexicalIndex()
+    vector = TableVectorIndex(path=args.index_path)
+    indexes = {
+        "lexical": lexical,
+        "vector": vector,
+        "hybrid-rrf": HybridTableIndex(lexical=lexical, vector=vector, fusion="rrf"),
+        "hybrid-weighted": HybridTableIndex(lexical=lexical, vector=vector, fusion="weighted", alpha=args.alpha),
+    }
+
+    for backend in args.backends.split(","):
+        if backend == "vertex_rag":
+            from BQ.db.table_router_agent import TableRouter
+            router = TableRouter(backend="vertex_rag")
+
+            def route(question, top_k):
+                return [r["file_name"].replace(".json", "") for r in router.rank_tables(question, top_k=top_k)]
+        else:
+            index = indexes[backend]
+            build_start = time.perf_counter()
+            index.ensure_built(schemas)
+            print("{:>16}: built in {:.2f}s".format(backend, time.perf_counter() - build_start))
+
+            def route(question, top_k, index=index):
+                return [r["table_name"] for r in index.search(question, top_k=top_k)]
+
+        result = evaluate(route, questions, args.top_k, args.repeat)
+        print("{:>16}: hit@1 {:.3f}  hit@5 {:.3f}{}  MRR {:.3f}  cold p50 {:.2f}ms p95 {:.2f}ms{}".format(
+            backend, result["hit_at_1"], result["hit_at_5"],
+            "  hit@{} {:.3f}".format(args.top_k, result["hit_at_k"]) if args.top_k != 5 else "",
+            result["mrr"],
+            result["cold_p50_ms"], result["cold_p95_ms"],
+            "  warm p50 {:.2f}ms p95 {:.2f}ms".format(result["warm_p50_ms"], result["warm_p95_ms"])
+            if "warm_p50_ms" in result else ""))
+
+
+if __name__ == "__main__":
+    main()
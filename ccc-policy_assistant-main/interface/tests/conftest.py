@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The app imports its modules from these directories by path, not as packages
+INTERFACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ["agent_handlers", "utils", os.path.join("BQ", "tools"), ""]:
+    path = os.path.join(INTERFACE_DIR, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
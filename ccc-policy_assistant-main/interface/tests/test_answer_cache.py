@@ -0,0 +1,42 @@
+from answer_cache import answerCache
+
+EMBEDDINGS = {
+    "transfer rates": [1.0, 0.0, 0.0],
+    "transfer rate": [0.99, 0.1, 0.0],
+    "transfer rates by college": [0.98, 0.15, 0.0],
+    "tuition": [0.0, 0.0, 1.0],
+}
+
+
+def semantic_cache():
+    return answerCache(embed_fn=lambda text: EMBEDDINGS[text], similarity_threshold=0.9)
+
+
+def test_exact_match_is_the_default():
+    cache = answerCache()
+    cache.set("Transfer rates?", {"report_body": "exact"})
+
+    assert cache.embed_fn is None
+    assert cache.get("transfer   RATES") == {"report_body": "exact"}
+    assert cache.get("transfer rate") is None
+    assert cache.stats == dict(exact_hits=1, semantic_hits=0, misses=1)
+
+
+def test_semantic_match_within_the_same_context_only():
+    cache = semantic_cache()
+    cache.set("transfer rate", {"report_body": "first turn"})
+    cache.set("tuition", {"report_body": "follow up"}, context="earlier")
+
+    assert cache.get("transfer rates") == {"report_body": "first turn"}
+    assert cache.get("transfer rates", context="earlier") is None
+
+
+def test_expired_best_match_does_not_shadow_a_live_one():
+    cache = semantic_cache()
+    cache.set("transfer rate", {"report_body": "expired"})
+    cache.set("transfer rates by college", {"report_body": "live"})
+    cache.store.delete("transfer rate")
+
+    assert cache.get("transfer rates") == {"report_body": "live"}
+    assert "transfer rate" not in cache.index_rows
+    assert cache.index_keys[cache.index_rows["transfer rates by college"]] == "transfer rates by college"
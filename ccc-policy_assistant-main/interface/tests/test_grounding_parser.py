@@ -0,0 +1,67 @@
+import importlib.util
+import json
+import os
+
+from grounding_parser import parse_rag_events
+
+# The original parser is kept in the benchmark as the reference implementation
+BENCHMARK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "benchmarks", "bench_rag_parser.py")
+spec = importlib.util.spec_from_file_location("bench_rag_parser", BENCHMARK_PATH)
+bench_rag_parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_rag_parser)
+legacy_parse_rag_events = bench_rag_parser.legacy_parse_rag_events
+
+
+def grounding_chunk(org, transcript, title="", uri="https://example.edu/page"):
+    text = "organizations:{} source_index: 0 transcript:{}".format(json.dumps(json.dumps(org)), transcript)
+    return dict(retrieved_context=dict(text=text, title=title, uri=uri))
+
+
+def rag_event(*chunks, text="Answer [1]."):
+    return dict(content=dict(parts=[dict(text=text)]),
+                grounding_metadata=dict(grounding_chunks=list(chunks)))
+
+
+def test_same_output_as_the_original_parser():
+    events = bench_rag_parser.synthetic_events(n_chunks=60, n_orgs=7, transcript_words=20)
+    legacy = legacy_parse_rag_events(events)
+    parsed = parse_rag_events(events)
+
+    for key in ["uris", "contents", "transcripts"]:
+        assert parsed[key] == legacy[key]
+    # The original ordered organizations by set iteration, so they are compared regardless of order
+    assert sorted(map(json.dumps, parsed["organizations"])) == sorted(map(json.dumps, legacy["organizations"]))
+    assert len({org["name"] for org in parsed["organizations"]}) == len(parsed["organizations"]) == 7
+
+
+def test_organizations_are_deduplicated_by_name():
+    first = dict(name="Foothill College", url="https://foothill.edu")
+    same_name = dict(name="Foothill College", url="https://www.foothill.edu")
+    other = dict(name="De Anza College", url="https://deanza.edu")
+    events = [rag_event(grounding_chunk(first, "a"), grounding_chunk(same_name, "b"), grounding_chunk(other, "c"))]
+
+    # The original kept every distinct organization dict, so a name could appear twice
+    assert legacy_parse_rag_events(events)["organizations"].count(same_name) == 1
+    assert len(legacy_parse_rag_events(events)["organizations"]) == 3
+    # Now the first organization of each name is kept
+    assert parse_rag_events(events)["organizations"] == [first, other]
+
+
+def test_title_defaults_to_the_latest_organization():
+    events = [rag_event(grounding_chunk(dict(name="Foothill College"), "a", title="Board minutes"),
+                        grounding_chunk(dict(name="De Anza College"), "b"))]
+    parsed = parse_rag_events(events)
+
+    assert [uri["uri_text"] for uri in parsed["uris"]] == ["Board minutes", "De Anza College"]
+    assert parsed["uris"] == legacy_parse_rag_events(events)["uris"]
+
+
+def test_unparsable_chunk_ends_its_event_as_before():
+    broken = dict(retrieved_context=dict(text="organizations:not json source_index: 0", title="", uri="u"))
+    events = [rag_event(grounding_chunk(dict(name="A"), "a"), broken, grounding_chunk(dict(name="B"), "b")),
+              rag_event(grounding_chunk(dict(name="C"), "c"))]
+    parsed = parse_rag_events(events)
+
+    assert [org["name"] for org in parsed["organizations"]] == ["A", "C"]
+    assert parsed["transcripts"] == legacy_parse_rag_events(events)["transcripts"] == ["a", "c"]
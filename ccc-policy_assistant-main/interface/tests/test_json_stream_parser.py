@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from json_stream_parser import JsonStreamParser
+
+REPORT = {
+    "report_title": "Transfer \"rates\" {2022}",
+    "report_body": "Line one\nLine two with a backslash \\ and braces } ] { [ and a comma, here",
+    "statistics": {"colleges": 116, "rates": [0.31, {"min": 0.1, "max": [0.9]}], "empty": {}},
+    "tags": ["transfer", "{not an object}", "\\\"quoted\\\""],
+    "complete": True,
+    "note": None,
+}
+REPORT_TEXT = "```json\n" + json.dumps(REPORT, indent=2) + "\n```"
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_members_are_parsed_at_any_chunk_size(size):
+    parser = JsonStreamParser()
+    completed = [member for chunk in chunks(REPORT_TEXT, size) for member in parser.feed(chunk)]
+
+    assert completed == list(REPORT.items())
+    assert parser.members == REPORT
+    assert parser.done
+
+
+def test_each_member_is_returned_as_soon_as_it_is_complete():
+    parser = JsonStreamParser()
+    completing_chars = []
+    for char in REPORT_TEXT:
+        if parser.feed(char):
+            completing_chars.append(char)
+
+    # Returned on the comma after each member, and the closing brace after the last one
+    assert completing_chars == [","] * (len(REPORT) - 1) + ["}"]
+
+
+def test_incomplete_member_is_not_returned():
+    parser = JsonStreamParser()
+
+    assert parser.feed('{"a": 1, "b": "x, y') == [("a", 1)]
+    assert parser.feed('", "c": [1, 2') == [("b", "x, y")]
+    assert parser.feed("]}") == [("c", [1, 2])]
+
+
+def test_text_after_the_object_is_ignored():
+    parser = JsonStreamParser()
+
+    assert parser.feed('{"a": 1}') == [("a", 1)]
+    assert parser.feed(' trailing {"b": 2}') == []
+    assert parser.members == {"a": 1}
+
+
+def test_empty_object():
+    parser = JsonStreamParser()
+
+    assert parser.feed("{}") == []
+    assert parser.done
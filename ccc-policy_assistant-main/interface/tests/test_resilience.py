@@ -0,0 +1,98 @@
+import pytest
+
+from resilience import call_with_resilience, get_breaker, is_transient
+
+
+class FlakyCall:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def fast_policy(**overrides):
+    return {**dict(deadline=5.0, max_attempts=3, base_delay=0.0, max_delay=0.0, hedge_after=None), **overrides}
+
+
+def test_transient_errors_are_retried_and_counted_on_the_breaker():
+    call = FlakyCall([ConnectionError("reset"), TimeoutError("slow")])
+
+    assert call_with_resilience(name="test_transient", fn=call, **fast_policy()) == "ok"
+    assert call.calls == 3
+    assert get_breaker("test_transient").failures == 0
+
+
+def test_request_errors_are_raised_at_once_without_tripping_the_breaker():
+    breaker = get_breaker("test_request_error")
+    breaker.failure_threshold = 1
+    call = FlakyCall([ValueError("malformed request")])
+
+    with pytest.raises(ValueError):
+        call_with_resilience(name="test_request_error", fn=call, **fast_policy())
+
+    assert call.calls == 1
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_status_codes_classify_client_errors():
+    class ClientError(Exception):
+        def __init__(self, code):
+            self.code = code
+
+    assert is_transient(ClientError(503))
+    assert is_transient(ClientError(429))
+    assert not is_transient(ClientError(400))
+    assert not is_transient(KeyError("report_body"))
+
+
+@pytest.fixture
+def one_worker_pool(monkeypatch):
+    import resilience
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(resilience, "CALL_EXECUTOR", pool)
+    monkeypatch.setattr(resilience, "CALL_WORKERS", 1)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_hedge_is_skipped_without_an_idle_worker(one_worker_pool):
+    import time
+    from resilience import COUNTERS, hedged_call
+
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return "ok"
+
+    assert hedged_call(name="test_hedge_skip", fn=slow_call, timeout=5.0, hedge_after=0.05) == "ok"
+    assert len(calls) == 1
+    assert COUNTERS.snapshot()["test_hedge_skip"] == {"hedge_skipped": 1}
+
+
+def test_time_queued_for_a_worker_is_not_a_breaker_failure(one_worker_pool):
+    import threading
+    from resilience import QueueTimeout, _submit_call
+
+    release = threading.Event()
+    _submit_call(release.wait, threading.Event(), threading.Event())
+    breaker = get_breaker("test_queue_timeout")
+    breaker.failure_threshold = 1
+
+    try:
+        with pytest.raises(QueueTimeout):
+            call_with_resilience(name="test_queue_timeout", fn=lambda: "ok", **fast_policy(deadline=0.2))
+    finally:
+        release.set()
+
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from row_limit import enforce_row_limit, strip_trailing_comments
+
+MAX_ROWS = 100
+
+
+@pytest.mark.parametrize("sql, stripped", [
+    ("SELECT 1 LIMIT 5 -- only a few", "SELECT 1 LIMIT 5"),
+    ("SELECT 1 LIMIT 5; # done\n", "SELECT 1 LIMIT 5"),
+    ("SELECT 1 LIMIT 5 /* block */;", "SELECT 1 LIMIT 5"),
+    ("SELECT 1\n-- first\n-- second", "SELECT 1"),
+    ("SELECT '#1' AS rank", "SELECT '#1' AS rank"),
+    ("SELECT 'a -- b' AS s -- note", "SELECT 'a -- b' AS s"),
+    ("SELECT 'it\\'s # here' AS s", "SELECT 'it\\'s # here' AS s"),
+])
+def test_strip_trailing_comments(sql, stripped):
+    assert strip_trailing_comments(sql) == stripped
+
+
+def test_limit_is_added_to_a_query_without_one():
+    assert enforce_row_limit("SELECT instnm FROM hd2022;", MAX_ROWS) == (
+        f"SELECT instnm FROM hd2022 LIMIT {MAX_ROWS}", True)
+
+
+def test_limit_after_a_comment_is_found():
+    assert enforce_row_limit("SELECT instnm FROM hd2022 LIMIT 10 -- top ten", MAX_ROWS) == (
+        "SELECT instnm FROM hd2022 LIMIT 10", False)
+
+
+def test_hash_inside_a_string_is_not_a_comment():
+    assert enforce_row_limit("SELECT instnm FROM hd2022 WHERE instnm = '#1 College'", MAX_ROWS) == (
+        f"SELECT instnm FROM hd2022 WHERE instnm = '#1 College' LIMIT {MAX_ROWS}", True)
+
+
+@pytest.mark.parametrize("limit", ["@n", "?", "@n OFFSET @skip"])
+def test_parameter_limit_is_kept(limit):
+    assert enforce_row_limit(f"SELECT instnm FROM hd2022 LIMIT {limit}", MAX_ROWS) == (
+        f"SELECT instnm FROM hd2022 LIMIT {limit}", False)
+
+
+def test_limit_above_the_cap_is_lowered():
+    assert enforce_row_limit("SELECT instnm FROM hd2022 limit 5000 OFFSET 20", MAX_ROWS) == (
+        f"SELECT instnm FROM hd2022 limit {MAX_ROWS} OFFSET 20", True)
+
+
+@pytest.mark.parametrize("limit", [10, MAX_ROWS])
+def test_limit_at_or_below_the_cap_is_kept(limit):
+    # A result of the query's own LIMIT rows isn't truncated, even when it equals the cap
+    assert enforce_row_limit(f"SELECT instnm FROM hd2022 LIMIT {limit}", MAX_ROWS) == (
+        f"SELECT instnm FROM hd2022 LIMIT {limit}", False)
+
+
+def test_limit_of_a_subquery_is_not_the_query_limit():
+    assert enforce_row_limit("SELECT * FROM (SELECT instnm FROM hd2022 LIMIT 10) t", MAX_ROWS) == (
+        f"SELECT * FROM (SELECT instnm FROM hd2022 LIMIT 10) t LIMIT {MAX_ROWS}", True)
@@ -0,0 +1,98 @@
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip("sqlglot")
+
+# BQ.db's __init__ imports the ADK agent, so the validator is loaded from its file
+VALIDATOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "BQ", "db", "sql_validator.py")
+spec = importlib.util.spec_from_file_location("sql_validator", VALIDATOR_PATH)
+sql_validator = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sql_validator)
+
+COLUMN_TYPES = {
+    "hd2022": {"unitid": "INTEGER", "instnm": "STRING", "stabbr": "STRING"},
+    "ef2022": {"unitid": "INTEGER", "enrtot": "INTEGER"},
+}
+HD2022_SCHEMA = {"Data dictionary": {"unitid": "", "instnm": "", "stabbr": ""}}
+
+
+def column_types(table_name):
+    return COLUMN_TYPES[table_name]
+
+
+def validate(sql, column_types_fn=column_types):
+    return sql_validator.SQLValidator(column_types_fn=column_types_fn).validate(sql, "hd2022", HD2022_SCHEMA)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT instnm FROM hd2022 WHERE stabbr = 'CA'",
+    "SELECT instnm, enrtot FROM hd2022 h JOIN ef2022 e ON h.unitid = e.unitid",
+    "SELECT unitid FROM hd2022 JOIN ef2022 USING (unitid)",
+    "SELECT instnm, bogus FROM hd2022 h JOIN other.x e ON h.unitid = e.unitid",
+    "WITH x AS (SELECT unitid, instnm AS nm FROM hd2022) SELECT nm, enrtot FROM x JOIN ef2022 USING (unitid)",
+    "SELECT h.instnm AS name FROM hd2022 h ORDER BY name",
+    "SELECT COUNT(*) AS n FROM hd2022 GROUP BY stabbr HAVING n > 1",
+    "SELECT instnm, v FROM hd2022, UNNEST([1, 2]) AS v",
+    "SELECT * FROM hd2022",
+    "SELECT t.* FROM hd2022 t",
+    "SELECT SUM(SAFE_CAST(instnm AS INT64)) FROM hd2022",
+])
+def test_valid_queries_pass(sql):
+    assert validate(sql) == []
+
+
+def test_misspelled_column_has_a_suggestion():
+    assert validate("SELECT instnm FROM hd2022 h WHERE h.stabr = 'CA'") == [
+        "Unknown column stabr in hd2022; did you mean stabbr?"]
+
+
+def test_misspelled_column_in_a_cte_is_found():
+    assert validate("WITH x AS (SELECT unitid, instnam FROM hd2022) SELECT * FROM x") == [
+        "Unknown column instnam in hd2022; did you mean instnm?"]
+
+
+def test_unknown_column_of_a_join_is_attributed_to_the_table():
+    assert validate("SELECT instnm, bogus FROM hd2022 h JOIN ef2022 e ON h.unitid = e.unitid") == [
+        "Unknown column bogus in hd2022"]
+
+
+def test_string_column_compared_with_a_number():
+    assert validate("SELECT instnm FROM hd2022 h JOIN ef2022 e USING (unitid) WHERE stabbr = 5") == [
+        "STRING column stabbr is compared with the number 5; compare with a quoted string or SAFE_CAST the column"]
+
+
+def test_numeric_column_compared_with_a_string():
+    problems = validate("SELECT instnm FROM hd2022 WHERE unitid = '100654'")
+
+    assert len(problems) == 1
+    assert "unitid" in problems[0]
+
+
+def test_sum_of_a_string_column():
+    assert validate("SELECT SUM(instnm) FROM hd2022") == [
+        "SUM of STRING column instnm; SAFE_CAST it to a number first"]
+
+
+def test_query_must_read_the_table():
+    assert validate("SELECT * FROM ef2022") == ["Query doesn't read from the hd2022 table"]
+
+
+def test_types_are_not_checked_when_unavailable():
+    def unavailable(table_name):
+        raise RuntimeError("BigQuery unavailable")
+
+    assert validate("SELECT SUM(instnm) FROM hd2022 WHERE stabbr = 5", column_types_fn=unavailable) == []
+    assert validate("SELECT stabr FROM hd2022", column_types_fn=unavailable) == [
+        "Unknown column stabr in hd2022; did you mean stabbr?"]
+
+
+def test_repair_prompt_lists_the_problems():
+    repair = sql_validator.repair_prompt("Question: CA colleges", "SELECT stabr FROM hd2022",
+                                         ["Unknown column stabr in hd2022; did you mean stabbr?"])
+
+    assert repair.startswith("Question: CA colleges")
+    assert "SELECT stabr FROM hd2022" in repair
+    assert "- Unknown column stabr in hd2022; did you mean stabbr?" in repair
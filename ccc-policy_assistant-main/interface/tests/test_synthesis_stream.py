@@ -0,0 +1,37 @@
+from json_stream_parser import EventStreamParser
+
+
+def text_event(text, partial):
+    return {"content": {"parts": [{"text": text}]}, "partial": partial}
+
+
+FULL_TEXT = '{"report_title": "T", "report_body": "B"}'
+
+
+def test_partial_events_render_incrementally():
+    parser = EventStreamParser()
+
+    # Each section is returned as soon as the partial event completing it arrives
+    assert parser.feed(text_event('{"report_title": "T", ', True)) == [("report_title", "T")]
+    assert parser.feed(text_event('"report_body": "B"}', True)) == [("report_body", "B")]
+
+    # The final event repeating the full text doesn't return the sections again
+    assert parser.feed(text_event(FULL_TEXT, False)) == []
+    assert parser.members == {"report_title": "T", "report_body": "B"}
+
+
+def test_unstreamed_response_is_parsed_from_the_final_event():
+    parser = EventStreamParser()
+
+    assert parser.feed(text_event("```json\n" + FULL_TEXT + "\n```", False)) == [
+        ("report_title", "T"), ("report_body", "B")]
+
+
+def test_events_without_text_content_are_skipped():
+    parser = EventStreamParser()
+
+    assert parser.feed("not an event") == []
+    assert parser.feed({"content": None, "partial": True}) == []
+    assert parser.feed({"content": {"parts": [{"function_call": {}}]}, "partial": False}) == []
+    # Skipped events don't count as partial text, so the final event is still parsed
+    assert parser.feed(text_event(FULL_TEXT, False)) == [("report_title", "T"), ("report_body", "B")]
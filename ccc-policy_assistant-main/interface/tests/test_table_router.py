@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chunk_ranking import aggregate_chunks, chunk_similarity
+
+# Chunks retrieved per table ranked, as TableRouter's default chunk_overfetch
+CHUNK_OVERFETCH = 4
+
+
+def chunk(table_name, score):
+    return {"file_name": f"{table_name}.json", "snippet": f"{table_name} chunk", "score": score}
+
+
+# Chunks in the order the RAG corpus returns them, most similar first
+EXACT_TABLE_NAME_CHUNKS = [
+    chunk("hd2022", 0.93), chunk("hd2022", 0.90), chunk("ic2022", 0.74), chunk("hd2022", 0.72),
+    chunk("ef2022a", 0.66), chunk("ic2022", 0.61), chunk("adm2022", 0.58), chunk("ef2022a", 0.55),
+    chunk("sfa2122", 0.51), chunk("gr2022", 0.47), chunk("adm2022", 0.44), chunk("c2022_a", 0.40),
+]
+KEYWORD_CHUNKS = [
+    chunk("adm2022", 0.88), chunk("ic2022", 0.79), chunk("adm2022", 0.77), chunk("hd2022", 0.70),
+    chunk("ic2022", 0.68), chunk("sfa2122", 0.61), chunk("adm2022", 0.59), chunk("ef2022a", 0.52),
+    chunk("gr2022", 0.49), chunk("hd2022", 0.45), chunk("c2022_a", 0.41), chunk("sfa2122", 0.38),
+]
+
+
+def rank_tables(chunks, top_k, score_aggregation="max"):
+    """Rank tables as TableRouter.rank_tables does from the chunks retrieved for top_k."""
+    return aggregate_chunks(chunks[:top_k * CHUNK_OVERFETCH], top_k, score_aggregation)
+
+
+def previous_ranking(chunks, top_k):
+    """Tables in the order the router returned them before chunk scores were aggregated."""
+    return list(dict.fromkeys(result["file_name"] for result in chunks[:top_k]))
+
+
+@pytest.mark.parametrize("chunks", [EXACT_TABLE_NAME_CHUNKS, KEYWORD_CHUNKS])
+@pytest.mark.parametrize("top_k", [1, 3, 5])
+def test_aggregation_keeps_previous_ranking(chunks, top_k):
+    ranked = [result["file_name"] for result in rank_tables(chunks, top_k)]
+    previous = previous_ranking(chunks, top_k)
+
+    # The tables previously returned keep their order, and the freed slots go to the next tables
+    assert ranked[:len(previous)] == previous
+    assert len(ranked) == min(top_k, len({result["file_name"] for result in chunks}))
+
+
+def test_aggregation_returns_distinct_tables_with_best_chunk():
+    ranked = rank_tables(EXACT_TABLE_NAME_CHUNKS, top_k=5)
+
+    assert [result["file_name"] for result in ranked] == [
+        "hd2022.json", "ic2022.json", "ef2022a.json", "adm2022.json", "sfa2122.json"]
+    assert ranked[0]["score"] == pytest.approx(0.93)
+
+
+def test_best_chunk_snippet_is_kept():
+    chunks = [{"file_name": "hd2022.json", "snippet": "weaker", "score": 0.5},
+              {"file_name": "hd2022.json", "snippet": "stronger", "score": 0.8}]
+
+    assert aggregate_chunks(chunks, top_k=1) == [{"file_name": "hd2022.json", "snippet": "stronger", "score": 0.8}]
+
+
+def test_sum_aggregation_favours_tables_with_many_matching_chunks():
+    ranked = rank_tables(KEYWORD_CHUNKS, top_k=2, score_aggregation="sum")
+
+    assert [result["file_name"] for result in ranked] == ["adm2022.json", "ic2022.json"]
+    assert ranked[0]["score"] == pytest.approx(0.88 + 0.77 + 0.59)
+
+
+def test_aggregation_does_not_modify_the_chunk_results():
+    chunks = [dict(result) for result in KEYWORD_CHUNKS]
+
+    rank_tables(chunks, top_k=3, score_aggregation="sum")
+
+    assert chunks == KEYWORD_CHUNKS
+
+
+def test_unknown_aggregation_is_rejected():
+    with pytest.raises(ValueError):
+        aggregate_chunks(KEYWORD_CHUNKS, top_k=3, score_aggregation="mean")
+
+
+def test_chunk_similarity_from_cosine_distance():
+    assert chunk_similarity(SimpleNamespace(score=0.25)) == pytest.approx(0.75)
+    assert chunk_similarity(SimpleNamespace(score=None, distance=0.4)) == pytest.approx(0.6)
+    assert chunk_similarity(SimpleNamespace(score=1.5)) == 0.0
+    assert chunk_similarity(SimpleNamespace()) == 0.0
@@ -0,0 +1,10 @@
+from text_cleaning_tools import normalize_question
+
+
+def test_questions_differing_in_case_punctuation_and_spacing_are_equal():
+    assert normalize_question("How many students, in 2022?") == "how many students in 2022"
+    assert normalize_question("  how MANY students in 2022 ") == "how many students in 2022"
+
+
+def test_questions_differing_in_words_or_numbers_are_not_equal():
+    assert normalize_question("Tuition in 2021?") != normalize_question("Tuition in 2022?")
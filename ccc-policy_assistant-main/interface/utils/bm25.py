@@ -0,0 +1,70 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# BM25 relevance scoring shared by the table router, column selection and context building
+
+import re
+import math
+from collections import Counter
+from typing import Dict, List, Sequence
+
+# Words that carry no meaning for matching questions to tables and columns
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "me", "of", "on", "or", "show", "that", "the", "this", "to", "was", "what", "which",
+    "who", "with", "give", "list", "many", "much", "there", "do", "does", "each", "per",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word terms without stopwords, with simple plural stripping."""
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class BM25Index:
+    """In-memory BM25 index over a list of documents."""
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, document in enumerate(documents):
+            terms = Counter(tokenize(document))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+        self.n_docs = len(self.doc_lengths)
+        self.avg_length = sum(self.doc_lengths) / max(self.n_docs, 1)
+        self.idf = {
+            term: math.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def score(self, query: str) -> List[float]:
+        """BM25 score of every document for a query."""
+        scores = [0.0] * self.n_docs
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / max(self.avg_length, 1))
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[tuple]:
+        """(doc_id, score) of the k best-scoring documents with a positive score."""
+        scores = self.score(query)
+        ranked = sorted((i for i in range(self.n_docs) if scores[i] > 0), key=lambda i: scores[i], reverse=True)
+        return [(i, scores[i]) for i in ranked[:k]]
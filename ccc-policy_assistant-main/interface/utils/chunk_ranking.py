@@ -0,0 +1,36 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Ranking tables from the schema chunks retrieved from the RAG corpus
+
+# How the scores of a table's chunks are combined: "max" keeps the best chunk's score,
+# "sum" adds up all of them
+SCORE_AGGREGATIONS = ("max", "sum")
+
+
+def chunk_similarity(context) -> float:
+    """Similarity of a retrieved chunk, from the cosine distance the RAG corpus reports as its score."""
+    distance = getattr(context, "score", None)
+    if distance is None:
+        distance = getattr(context, "distance", None)
+    if distance is None:
+        return 0.0
+    return max(0.0, 1.0 - float(distance))
+
+
+def aggregate_chunks(chunk_results: list, top_k: int, score_aggregation: str = "max") -> list:
+    """Combine chunk results into the top_k tables by aggregated score, each with its best chunk's snippet."""
+    if score_aggregation not in SCORE_AGGREGATIONS:
+        raise ValueError(f"Unknown score aggregation: {score_aggregation}")
+    tables = {}
+    for result in chunk_results:
+        table = tables.get(result["file_name"])
+        if table is None:
+            tables[result["file_name"]] = dict(result)
+            continue
+        if score_aggregation == "sum":
+            table["score"] += result["score"]
+        elif result["score"] > table["score"]:
+            table["score"] = result["score"]
+            table["snippet"] = result["snippet"]
+    return sorted(tables.values(), key=lambda table: table["score"], reverse=True)[:top_k]
@@ -0,0 +1,207 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Process-wide registry of Google credentials and API clients
+
+import os
+import time
+import datetime
+import logging
+import threading
+
+import google.auth
+from google.auth.transport.requests import Request
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+class GoogleClients:
+    '''
+    Registry that builds Google credentials and API clients lazily, once per
+    process, so every thread shares their HTTP connection pools. Credentials are
+    refreshed by a background thread before they expire, so requests don't stall
+    on token refreshes.
+
+    Attributes
+
+        pool_size: HTTP connections kept per host by the BigQuery and Storage clients
+        refresh_margin: Seconds before token expiry when the background refresh runs
+
+    '''
+
+    def __init__(self,
+                 **kwargs):
+        '''
+        Initialize class
+        '''
+
+        # Parameters
+        self.pool_size = 32
+        self.refresh_margin = 5 * 60
+
+        # Update any key word args
+        self.__dict__.update(kwargs)
+
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.Lock()
+        self._credentials = None
+        self._project = None
+        self._refresh_thread = None
+        self.clients = {}
+
+    def credentials(self) -> tuple:
+        '''
+        Get the application default (credentials, project), authenticating on first use
+        and starting the background token refresh
+        '''
+
+        if self._credentials is None:
+            with self.lock:
+                if self._credentials is None:
+                    credentials, project = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+                    self._refresh(credentials)
+                    self._credentials, self._project = credentials, project
+                    self._start_refresh_thread()
+
+        return self._credentials, self._project
+
+    def _refresh(self,
+                 credentials):
+        '''
+        Refresh credentials that have a token to refresh
+        '''
+
+        with self.refresh_lock:
+            if hasattr(credentials, "refresh"):
+                credentials.refresh(Request())
+
+    def _start_refresh_thread(self):
+        self._refresh_thread = threading.Thread(target=self._refresh_loop,
+                                                name="google_token_refresh",
+                                                daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        '''
+        Refresh the shared credentials refresh_margin seconds before they expire
+        '''
+
+        while True:
+            expiry = getattr(self._credentials, "expiry", None)
+            if expiry is None:
+                # Credentials without an expiry don't need refreshing
+                return
+
+            # google-auth expiries are naive UTC datetimes
+            now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            wait = (expiry - now).total_seconds() - self.refresh_margin
+            time.sleep(max(30, wait))
+
+            try:
+                self._refresh(self._credentials)
+                logger.info("Refreshed Google credentials")
+            except Exception as e:
+                logger.warning("Background credential refresh failed: {}".format(str(e)))
+                time.sleep(60)
+
+    def _get_client(self,
+                    key: tuple,
+                    build):
+        '''
+        Get a memoized client, building it on first use
+        '''
+
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = build()
+                    self.clients[key] = client
+
+        return client
+
+    def _size_pool(self,
+                   client):
+        '''
+        Allow pool_size pooled connections in a client's requests session
+        '''
+
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+        client._http.mount("https://", adapter)
+
+        return client
+
+    def bigquery(self,
+                 project: str = None):
+        '''
+        Get the shared BigQuery client of a project (the default project if None)
+        '''
+
+        def build():
+            from google.cloud import bigquery
+            credentials, default_project = self.credentials()
+            return self._size_pool(bigquery.Client(project=project or default_project,
+                                                   credentials=credentials))
+
+        return self._get_client(("bigquery", project), build)
+
+    def bigquery_storage(self):
+        '''
+        Get the shared BigQuery Storage Read API client, or None if
+        google-cloud-bigquery-storage isn't installed
+        '''
+
+        def build():
+            try:
+                from google.cloud import bigquery_storage
+            except ImportError:
+                logger.warning("google-cloud-bigquery-storage not installed; query results will download over REST")
+                return False
+            credentials, _ = self.credentials()
+            return bigquery_storage.BigQueryReadClient(credentials=credentials)
+
+        # False is memoized so the import is only attempted once
+        return self._get_client(("bigquery_storage",), build) or None
+
+    def storage(self,
+                project: str = None):
+        '''
+        Get the shared Cloud Storage client of a project (the default project if None)
+        '''
+
+        def build():
+            from google.cloud import storage
+            credentials, default_project = self.credentials()
+            return self._size_pool(storage.Client(project=project or default_project,
+                                                  credentials=credentials))
+
+        return self._get_client(("storage", project), build)
+
+    def genai(self,
+              api_key: str = None,
+              api_version: str = None):
+        '''
+        Get the shared Gen AI client for an API key (or the environment's
+        configuration if None) and API version
+        '''
+
+        def build():
+            from google import genai
+            from google.genai.types import HttpOptions
+            kwargs = {}
+            if api_key:
+                kwargs["api_key"] = api_key
+            if api_version:
+                kwargs["http_options"] = HttpOptions(api_version=api_version)
+            return genai.Client(**kwargs)
+
+        return self._get_client(("genai", api_key, api_version), build)
+
+
+# Registry shared by the whole process
+google_clients = GoogleClients(pool_size=int(os.getenv("GOOGLE_CLIENT_POOL_SIZE", "32")))
@@ -0,0 +1,183 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Incremental parser for JSON objects streamed in text chunks
+
+import json
+
+
+class JsonStreamParser:
+    '''
+    Parse a JSON object as its text arrives in chunks, returning each top-level
+    member as soon as it is complete. Text before the opening brace (such as a
+    ```json markdown fence) and after the closing brace is ignored.
+
+    Example:
+
+        parser = JsonStreamParser()
+        for chunk in chunks:
+            for key, value in parser.feed(chunk):
+                ...
+
+    Attributes
+
+        done: True once the closing brace of the object has been read
+        members: Dictionary of all members parsed so far
+
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.done = False
+
+        # Start of the member being read (index into buffer)
+        self.member_start = None
+
+        self.members = {}
+
+    def feed(self,
+             text: str) -> list:
+        '''
+        Add a chunk of text and return a list of (key, value) tuples for the
+        top-level members it completed
+        '''
+
+        if self.done:
+            return []
+
+        self.buffer += text
+        completed = []
+
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if not self.started:
+                # Skip anything before the object
+                if char == "{":
+                    self.started = True
+                    self.depth = 1
+                    self.member_start = self.pos + 1
+
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+
+            elif char == '"':
+                self.in_string = True
+
+            elif char in "{[":
+                self.depth += 1
+
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._add_member(self.pos, completed)
+                    self.done = True
+                    break
+
+            elif char == "," and self.depth == 1:
+                self._add_member(self.pos, completed)
+                self.member_start = self.pos + 1
+
+            self.pos += 1
+
+        # Drop text that has already been parsed
+        if self.member_start is not None and self.member_start > 0:
+            trim = min(self.member_start, self.pos)
+            self.buffer = self.buffer[trim:]
+            self.pos -= trim
+            self.member_start -= trim
+
+        return completed
+
+    def _add_member(self,
+                    end: int,
+                    completed: list):
+        '''
+        Parse the member text between member_start and end
+        '''
+
+        member_text = self.buffer[self.member_start:end].strip()
+        if len(member_text) == 0:
+            return
+
+        try:
+            member = json.loads("{" + member_text + "}")
+        except json.JSONDecodeError:
+            return
+
+        for key, value in member.items():
+            self.members[key] = value
+            completed.append((key, value))
+
+
+class EventStreamParser:
+    '''
+    Parse the JSON object in the text of an agent's streamed events (ADK event
+    dictionaries), returning each top-level member as soon as the event
+    completing it arrives.
+
+    With SSE streaming, partial events carry the text as it is generated and a
+    final event repeats all of it; that final event is skipped once partial
+    text has been seen. Without streaming, only the final event is parsed.
+
+    Example:
+
+        parser = EventStreamParser()
+        for event in events:
+            for key, value in parser.feed(event):
+                ...
+
+    Attributes
+
+        members: Dictionary of all members parsed so far
+
+    '''
+
+    def __init__(self):
+        '''
+        Initialize class
+        '''
+
+        self.parser = JsonStreamParser()
+        self.partial_text_seen = False
+
+    @property
+    def members(self) -> dict:
+        return self.parser.members
+
+    def feed(self,
+             event) -> list:
+        '''
+        Parse the text of an event and return a list of (key, value) tuples for
+        the top-level members it completed
+        '''
+
+        # Only events with text content carry the response
+        if type(event) != dict or type(event.get("content")) != dict:
+            return []
+
+        # A streamed response ends with an event repeating all of its partial text
+        if event.get("partial"):
+            self.partial_text_seen = True
+        elif self.partial_text_seen:
+            return []
+
+        completed = []
+        for txt_dict in event["content"].get("parts", []):
+            completed.extend(self.parser.feed(txt_dict.get("text", "")))
+
+        return completed
@@ -10,10 +10,8 @@ import uuid
 from dataclasses import dataclass, asdict
 
 from google.cloud import bigquery
-import google.auth
 
-from google import genai
-from google.genai.types import HttpOptions
+from google_clients import google_clients
 
 
 # Predefined prompts
@@ -62,8 +60,8 @@ class ResponseLogger:
         # Update any key word args
         self.__dict__.update(kwargs)
 
-        # Authenticate
-        self.credentials, self.project = google.auth.default()
+        # Shared process-wide credentials
+        self.credentials, self.project = google_clients.credentials()
 
     def to_bq(self, rlog):
         """
@@ -110,6 +108,7 @@ class ResponseLogger:
         pandas_gbq.to_gbq(df,
                           rlog.location,
                           project_id=self.project,
+                          credentials=self.credentials,
                           table_schema=self.schema,
                           if_exists='append')
 
@@ -182,10 +181,10 @@ class ResponseLogger:
 
         # Try to call the AI model
         try:
-            client = genai.Client(http_options=HttpOptions(api_version="v1"))
+            client = google_clients.genai(api_version="v1")
         except:
-            client = genai.Client(http_options=HttpOptions(api_version="v1"),
-                                  api_key=os.environ["GOOGLE_API_KEY"])
+            client = google_clients.genai(api_key=os.environ["GOOGLE_API_KEY"],
+                                          api_version="v1")
 
         # Generate a response
         response = client.models.generate_content(
@@ -124,3 +124,14 @@ def get_text_between_phrases(text: str,
     all_matches = re.findall(pattern, text)
 
     return all_matches
+
+def normalize_question(question: str) -> str:
+    '''
+    Normalize a user question for cache keys: lower case, punctuation replaced by
+    spaces and whitespace collapsed, so the router, SQL and answer caches all treat
+    the same questions as equal
+    '''
+
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+
+    return " ".join(question.split())
@@ -0,0 +1,42 @@
+# © 2025 Numantic Solutions LLC
+# MIT License
+#
+# Token counting shared by prompt and context builders
+
+import math
+import threading
+
+# tiktoken encodings by name, loaded on first use; None if one can't be loaded
+_ENCODINGS = {}
+_ENCODINGS_LOCK = threading.Lock()
+
+
+def get_encoding(encoding_name: str = "cl100k_base"):
+    '''
+    Get a tiktoken encoding, or None if tiktoken or the encoding file is unavailable
+    '''
+
+    with _ENCODINGS_LOCK:
+        if encoding_name not in _ENCODINGS:
+            try:
+                import tiktoken
+                _ENCODINGS[encoding_name] = tiktoken.get_encoding(encoding_name)
+            except Exception:
+                _ENCODINGS[encoding_name] = None
+
+    return _ENCODINGS[encoding_name]
+
+
+def count_tokens(text: str,
+                 encoding_name: str = "cl100k_base",
+                 chars_per_token: int = 4) -> int:
+    '''
+    Count the tokens in a text, or estimate them as characters / chars_per_token
+    if the encoding is unavailable
+    '''
+
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return math.ceil(len(text) / chars_per_token)
+
+    return len(encoding.encode(text, disallowed_special=()))